@@ -0,0 +1,36 @@
+"""Resource usage of submissions
+
+Revision ID: 3b7e1f4a9c20
+Revises: 9f3a6d2c8e15
+Create Date: 2026-10-18 17:21:05.402117
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3b7e1f4a9c20'
+down_revision = '9f3a6d2c8e15'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('submission', sa.Column('max_cpu_time', sa.Integer(), nullable=True))
+    op.add_column('submission', sa.Column('total_cpu_time', sa.Integer(), nullable=True))
+    op.add_column('submission', sa.Column('max_wall_time', sa.Integer(), nullable=True))
+    op.add_column('submission', sa.Column('total_wall_time', sa.Integer(), nullable=True))
+    op.add_column('submission', sa.Column('max_memory', sa.Integer(), nullable=True))
+    op.add_column('submission_log', sa.Column('cpu_time', sa.Integer(), nullable=True))
+    op.add_column('submission_log', sa.Column('wall_time', sa.Integer(), nullable=True))
+    op.add_column('submission_log', sa.Column('memory', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('submission_log', 'memory')
+    op.drop_column('submission_log', 'wall_time')
+    op.drop_column('submission_log', 'cpu_time')
+    op.drop_column('submission', 'max_memory')
+    op.drop_column('submission', 'total_wall_time')
+    op.drop_column('submission', 'max_wall_time')
+    op.drop_column('submission', 'total_cpu_time')
+    op.drop_column('submission', 'max_cpu_time')
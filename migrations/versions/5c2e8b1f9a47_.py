@@ -0,0 +1,24 @@
+"""Leases of submissions checked by judge nodes
+
+Revision ID: 5c2e8b1f9a47
+Revises: d670db0af161
+Create Date: 2026-10-18 14:05:42.913270
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5c2e8b1f9a47'
+down_revision = 'd670db0af161'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('submission', sa.Column('lease', sa.String(length=32), nullable=True))
+    op.add_column('submission', sa.Column('lease_time', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('submission', 'lease_time')
+    op.drop_column('submission', 'lease')
@@ -0,0 +1,22 @@
+"""Built-in comparators of problems
+
+Revision ID: 9f3a6d2c8e15
+Revises: e41b7c9d2f06
+Create Date: 2026-10-18 16:02:37.118904
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9f3a6d2c8e15'
+down_revision = 'e41b7c9d2f06'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('problem', sa.Column('builtin_checker', sa.String(length=32), nullable=True))
+
+
+def downgrade():
+    op.drop_column('problem', 'builtin_checker')
@@ -0,0 +1,39 @@
+"""Test pair content hashes
+
+Revision ID: a03cf31c636e
+Revises: b8506fa1f21e
+Create Date: 2026-10-18 12:04:31.172934
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'a03cf31c636e'
+down_revision = 'b8506fa1f21e'
+
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('test_pair', sa.Column('input_hash', sa.String(length=64), nullable=True))
+    op.add_column('test_pair', sa.Column('pattern_hash', sa.String(length=64), nullable=True))
+
+    test_pair = sa.table('test_pair',
+                         sa.column('id', sa.Integer),
+                         sa.column('input', sa.Text),
+                         sa.column('pattern', sa.Text),
+                         sa.column('input_hash', sa.String),
+                         sa.column('pattern_hash', sa.String))
+    connection = op.get_bind()
+    for row in connection.execute(sa.select([test_pair.c.id, test_pair.c.input,
+                                             test_pair.c.pattern])).fetchall():
+        connection.execute(test_pair.update().where(test_pair.c.id == row.id).values(
+            input_hash=hashlib.sha256((row.input or '').encode()).hexdigest(),
+            pattern_hash=hashlib.sha256((row.pattern or '').encode()).hexdigest()))
+
+
+def downgrade():
+    op.drop_column('test_pair', 'pattern_hash')
+    op.drop_column('test_pair', 'input_hash')
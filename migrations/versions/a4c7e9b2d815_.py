@@ -0,0 +1,33 @@
+"""Maximum score and test count of problems
+
+Revision ID: a4c7e9b2d815
+Revises: f2a8d6c3b917
+Create Date: 2026-10-18 23:02:41.817203
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'a4c7e9b2d815'
+down_revision = 'f2a8d6c3b917'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('problem', sa.Column('max_score', sa.Integer(), nullable=True))
+    op.add_column('problem', sa.Column('test_count', sa.Integer(), nullable=True))
+    op.execute('UPDATE problem SET '
+               'test_count = (SELECT COUNT(test_pair.id) FROM test_pair '
+               'JOIN test_group ON test_group.id = test_pair.test_group_id '
+               'WHERE test_group.problem_id = problem.id), '
+               'max_score = COALESCE((SELECT SUM(COALESCE(test_group.score, 0) + '
+               'COALESCE(test_group.score_per_test, 0) * (SELECT COUNT(test_pair.id) '
+               'FROM test_pair WHERE test_pair.test_group_id = test_group.id)) '
+               'FROM test_group WHERE test_group.problem_id = problem.id), 0)')
+
+
+def downgrade():
+    with op.batch_alter_table('problem') as batch_op:
+        batch_op.drop_column('test_count')
+        batch_op.drop_column('max_score')
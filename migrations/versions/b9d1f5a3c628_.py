@@ -0,0 +1,31 @@
+"""Standings revisions
+
+Revision ID: b9d1f5a3c628
+Revises: a4c7e9b2d815
+Create Date: 2026-10-18 23:48:12.604381
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b9d1f5a3c628'
+down_revision = 'a4c7e9b2d815'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('contest', sa.Column('standings_revision', sa.Integer(), nullable=True))
+    op.add_column('contest', sa.Column('standings_reset', sa.Integer(), nullable=True))
+    op.add_column('contest_standing', sa.Column('revision', sa.Integer(), nullable=True))
+    # Contests with revision 0 are rebuilt when their scoreboard is shown
+    op.execute('UPDATE contest SET standings_revision = 0, standings_reset = 0')
+    op.execute('UPDATE contest_standing SET revision = 0')
+
+
+def downgrade():
+    with op.batch_alter_table('contest_standing') as batch_op:
+        batch_op.drop_column('revision')
+    with op.batch_alter_table('contest') as batch_op:
+        batch_op.drop_column('standings_reset')
+        batch_op.drop_column('standings_revision')
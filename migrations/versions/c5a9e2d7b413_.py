@@ -0,0 +1,42 @@
+"""Rejudge jobs
+
+Revision ID: c5a9e2d7b413
+Revises: 3b7e1f4a9c20
+Create Date: 2026-10-18 19:42:13.518204
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c5a9e2d7b413'
+down_revision = '3b7e1f4a9c20'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('rejudge_job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('description', sa.String(length=256), nullable=True),
+    sa.Column('share', sa.Integer(), nullable=True),
+    sa.Column('total', sa.Integer(), nullable=True),
+    sa.Column('cancelled', sa.Integer(), nullable=True),
+    sa.Column('created', sa.DateTime(), nullable=True),
+    sa.Column('finished', sa.DateTime(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('submission') as batch_op:
+        batch_op.add_column(sa.Column('previous_status', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('rejudge_job_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_submission_rejudge_job_id', 'rejudge_job',
+                                    ['rejudge_job_id'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('submission') as batch_op:
+        batch_op.drop_constraint('fk_submission_rejudge_job_id', type_='foreignkey')
+        batch_op.drop_column('rejudge_job_id')
+        batch_op.drop_column('previous_status')
+    op.drop_table('rejudge_job')
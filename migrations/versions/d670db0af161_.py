@@ -0,0 +1,22 @@
+"""Recheck flag of submissions
+
+Revision ID: d670db0af161
+Revises: a03cf31c636e
+Create Date: 2026-10-18 12:31:07.448120
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'd670db0af161'
+down_revision = 'a03cf31c636e'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('submission', sa.Column('is_recheck', sa.Boolean(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('submission', 'is_recheck')
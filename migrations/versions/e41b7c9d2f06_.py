@@ -0,0 +1,24 @@
+"""Hash and size of submission output
+
+Revision ID: e41b7c9d2f06
+Revises: 5c2e8b1f9a47
+Create Date: 2026-10-18 15:20:11.604318
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e41b7c9d2f06'
+down_revision = '5c2e8b1f9a47'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('submission_log', sa.Column('stdout_hash', sa.String(length=64), nullable=True))
+    op.add_column('submission_log', sa.Column('stdout_size', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('submission_log', 'stdout_size')
+    op.drop_column('submission_log', 'stdout_hash')
@@ -0,0 +1,26 @@
+"""Test versions of submission logs and delta rejudge jobs
+
+Revision ID: e7b3c1f9d254
+Revises: c5a9e2d7b413
+Create Date: 2026-10-18 20:31:47.108562
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e7b3c1f9d254'
+down_revision = 'c5a9e2d7b413'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('submission_log', sa.Column('test_version', sa.String(length=64), nullable=True))
+    op.add_column('rejudge_job', sa.Column('delta', sa.Boolean(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('rejudge_job') as batch_op:
+        batch_op.drop_column('delta')
+    with op.batch_alter_table('submission_log') as batch_op:
+        batch_op.drop_column('test_version')
@@ -0,0 +1,35 @@
+"""Contest standings
+
+Revision ID: f2a8d6c3b917
+Revises: e7b3c1f9d254
+Create Date: 2026-10-18 22:14:05.392716
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'f2a8d6c3b917'
+down_revision = 'e7b3c1f9d254'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('contest_standing',
+    sa.Column('contest_id', sa.Integer(), nullable=False),
+    sa.Column('frozen', sa.Boolean(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('problem_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Integer(), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=True),
+    sa.Column('time', sa.Integer(), nullable=True),
+    sa.Column('penalty', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['contest_id'], ['contest.id'], ),
+    sa.ForeignKeyConstraint(['problem_id'], ['problem.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('contest_id', 'frozen', 'user_id', 'problem_id')
+    )
+
+
+def downgrade():
+    op.drop_table('contest_standing')
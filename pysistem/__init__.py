@@ -23,20 +23,24 @@ basedir = os.path.dirname(os.path.realpath(__file__))
 
 class PySistemApplication(Flask):
     """Main PySistem WSGI Application"""
-    def make_check_thread(self):
-        from pysistem.checkthread import CheckThread
-        self.check_thread = CheckThread()
+    def make_check_thread(self, workers=None):
+        from pysistem.checkthread import make_check_threads
+        self.check_threads = make_check_threads(workers)
+        self.check_thread = self.check_threads[0]
 
-    def start_check_thread(self=None, join=False):
-        """Start checking thread
+    def start_check_thread(self=None, join=False, workers=None):
+        """Start checking threads
 
         Arguments:
         join -- Do Thread.join()?
+        workers -- amount of checking threads. Default -- CHECK_THREAD_WORKERS
         """
-        self.make_check_thread()
-        self.check_thread.start()
+        self.make_check_thread(workers)
+        for thread in self.check_threads:
+            thread.start()
         if join:
-            self.check_thread.join()
+            for thread in self.check_threads:
+                thread.join()
 
     def make_dirs(self=None):
         """Create required directories"""
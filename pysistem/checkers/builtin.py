@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+
+"""Built-in comparators
+
+A problem may use a built-in comparator instead of a Checker program
+(see Problem.builtin_checker). Comparators run inside the judge process
+on memory-mapped output and pattern files and return the same results
+as checker programs: RESULT_OK, RESULT_WA or RESULT_PE.
+
+Comparators:
+exact -- output is byte-to-byte equal to pattern, except trailing whitespace
+line -- lines are equal, except trailing whitespace in lines and trailing empty lines
+token -- whitespace-separated tokens are equal
+float -- tokens are equal, numbers differ by at most 1e-6, absolute or relative.
+         Tolerance is set after colon: 'float:1e-9'. Numbers are decimal, with
+         optional sign and exponent: no 'inf', 'nan' or '1_000'. Uses NumPy if available
+
+Tokens are read lazily from mapped files, so large outputs are not copied
+into memory, and comparison stops soon after the first mismatch.
+"""
+
+import mmap
+import os
+import re
+from contextlib import contextmanager
+from itertools import zip_longest
+
+from pysistem.submissions.const import RESULT_OK, RESULT_WA, RESULT_PE
+
+try:
+    import numpy
+except ImportError: # pragma: no cover
+    numpy = None
+
+DEFAULT_EPS = 1e-6
+TOKEN_RE = re.compile(rb'\S+')
+NUMBER_RE = re.compile(rb'[+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?')
+WHITESPACE = b' \t\r\n\x0b\x0c'
+# Tokens compared at once by 'float' comparator
+BATCH_SIZE = 4096
+
+comparators = {}
+
+def comparator(name):
+    """Decorator
+    Register function(output, pattern, argument) returning (Result, message)
+    as comparator 'name'. output and pattern are bytes-like objects
+    """
+    def decorator(func):
+        """Decorator of comparator"""
+        comparators[name] = func
+        return func
+    return decorator
+
+def parse_name(name):
+    """Split comparator name to (comparator, argument or None)"""
+    name, _, argument = (name or '').partition(':')
+    return name, argument or None
+
+def is_valid(name):
+    """Check if name is known comparator with valid argument"""
+    name, argument = parse_name(name)
+    if name not in comparators:
+        return False
+    if argument is not None:
+        if name != 'float':
+            return False
+        try:
+            return float(argument) >= 0
+        except ValueError:
+            return False
+    return True
+
+@contextmanager
+def mapped(path):
+    """Map file into memory read-only, empty file is mapped to b''"""
+    with open(path, 'rb') as mapped_file:
+        if os.fstat(mapped_file.fileno()).st_size == 0:
+            yield b''
+            return
+        buf = mmap.mmap(mapped_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield buf
+        finally:
+            try:
+                buf.close()
+            except BufferError: # pragma: no cover
+                pass # Still referenced by a traceback, freed later
+
+def compare(name, output_path, pattern_path):
+    """Compare output with pattern
+
+    Arguments:
+    name -- comparator name, see is_valid
+    output_path -- path to submission's output
+    pattern_path -- path to test pair's pattern
+
+    Returns:
+    Tuple: (Result, message for checker's log)
+    """
+    name, argument = parse_name(name)
+    with mapped(output_path) as output, mapped(pattern_path) as pattern:
+        return comparators[name](output, pattern, argument)
+
+def shorten(token, limit=64):
+    """Make token printable in log"""
+    text = bytes(token).decode(errors='replace')
+    if len(text) > limit:
+        text = text[:limit] + '...'
+    return text
+
+def content_end(buf):
+    """Get length of buf without trailing whitespace"""
+    end = len(buf)
+    while end and buf[end - 1] in WHITESPACE:
+        end -= 1
+    return end
+
+def lines(buf):
+    """Iterate over lines of buf without line feeds"""
+    start, size = 0, len(buf)
+    while start < size:
+        end = buf.find(b'\n', start)
+        if end < 0:
+            end = size
+        yield buf[start:end]
+        start = end + 1
+
+@comparator('exact')
+def exact_comparator(output, pattern, argument=None):
+    """Output is byte-to-byte equal to pattern, except trailing whitespace"""
+    output_end, pattern_end = content_end(output), content_end(pattern)
+    chunk = 1024 * 1024
+    for start in range(0, min(output_end, pattern_end), chunk):
+        stop = min(start + chunk, output_end, pattern_end)
+        if output[start:stop] != pattern[start:stop]:
+            offset = start + next(i for i, (a, b) in enumerate(
+                zip(output[start:stop], pattern[start:stop])) if a != b)
+            return RESULT_WA, 'Files differ at byte %d' % (offset + 1)
+    if output_end != pattern_end:
+        return RESULT_WA, 'Expected %d bytes, found %d' % (pattern_end, output_end)
+    return RESULT_OK, 'ok %d bytes' % output_end
+
+@comparator('line')
+def line_comparator(output, pattern, argument=None):
+    """Lines are equal, except trailing whitespace in lines and trailing empty lines"""
+    count = 0
+    for count, (found, expected) in enumerate(zip_longest(lines(output), lines(pattern),
+                                                          fillvalue=b''), 1):
+        found, expected = found.rstrip(WHITESPACE), expected.rstrip(WHITESPACE)
+        if found != expected:
+            return RESULT_WA, 'Line %d differs: expected \'%s\', found \'%s\'' \
+                              % (count, shorten(expected), shorten(found))
+    return RESULT_OK, 'ok %d lines' % count
+
+@comparator('token')
+def token_comparator(output, pattern, argument=None):
+    """Whitespace-separated tokens are equal"""
+    count = 0
+    for count, (found, expected) in enumerate(zip_longest(
+            TOKEN_RE.finditer(output), TOKEN_RE.finditer(pattern)), 1):
+        if found is None:
+            return RESULT_WA, 'Unexpected end of file: token %d expected' % count
+        if expected is None:
+            return RESULT_WA, 'Extra tokens after token %d' % (count - 1)
+        if found.group() != expected.group():
+            return RESULT_WA, 'Token %d differs: expected \'%s\', found \'%s\'' \
+                              % (count, shorten(expected.group()), shorten(found.group()))
+    return RESULT_OK, 'ok %d tokens' % count
+
+def is_number(token):
+    """Check if token is a number, float() alone also accepts e.g. 'nan' and '1_000'"""
+    return NUMBER_RE.fullmatch(token) is not None
+
+def to_float(token):
+    """Convert token to float, None if it is not a number"""
+    if not is_number(token):
+        return None
+    return float(token)
+
+def float_equal(found, expected, eps):
+    """Check if numbers differ by at most eps, absolute or relative"""
+    if found == expected or (found != found and expected != expected):
+        return True
+    return abs(found - expected) <= eps * max(1.0, abs(expected))
+
+def compare_token(index, found, expected, eps):
+    """Compare one token as number, if pattern token is a number
+
+    Returns:
+    (Result, message) if tokens differ, else None
+    """
+    expected_value = to_float(expected)
+    if expected_value is None:
+        if found != expected:
+            return RESULT_WA, 'Token %d differs: expected \'%s\', found \'%s\'' \
+                              % (index, shorten(expected), shorten(found))
+        return None
+    found_value = to_float(found)
+    if found_value is None:
+        return RESULT_PE, 'Token %d: expected number, found \'%s\'' % (index, shorten(found))
+    if not float_equal(found_value, expected_value, eps):
+        return RESULT_WA, 'Token %d differs: expected %s, found %s' \
+                          % (index, shorten(expected), shorten(found))
+    return None
+
+def compare_numbers(index, found_tokens, expected_tokens, eps):
+    """Compare batch of numbers at once with NumPy
+
+    Arguments:
+    index -- number of the first token in batch, counted from 1
+
+    Returns:
+    (Result, message) if numbers differ, else None
+    """
+    expected = numpy.array(expected_tokens, dtype=numpy.float64)
+    found = numpy.array(found_tokens, dtype=numpy.float64)
+    with numpy.errstate(invalid='ignore'):
+        equal = (found == expected) | (numpy.isnan(found) & numpy.isnan(expected)) | \
+                (numpy.abs(found - expected) <= eps * numpy.maximum(1.0, numpy.abs(expected)))
+    if not equal.all():
+        offset = int(numpy.argmin(equal))
+        return RESULT_WA, 'Token %d differs: expected %s, found %s' \
+                          % (index + offset, shorten(expected_tokens[offset]),
+                             shorten(found_tokens[offset]))
+    return None
+
+def compare_batch(index, batch, eps):
+    """Compare batch of (found, expected) tokens, vectorized if all are numbers
+
+    Returns:
+    Tuple: ((Result, message) if tokens differ, else None, if all tokens are numbers)
+    """
+    found_tokens, expected_tokens = zip(*batch)
+    if numpy is not None and all(map(is_number, expected_tokens)) \
+            and all(map(is_number, found_tokens)):
+        return compare_numbers(index, found_tokens, expected_tokens, eps), True
+    for offset, (found, expected) in enumerate(batch):
+        verdict = compare_token(index + offset, found, expected, eps)
+        if verdict:
+            return verdict, False
+    return None, False
+
+@comparator('float')
+def float_comparator(output, pattern, argument=None):
+    """Tokens are equal, numbers differ by at most eps, absolute or relative
+
+    Tokens are read lazily from mapped files and compared in batches of
+    BATCH_SIZE, so output is never copied whole and comparison stops at
+    the first batch with mismatch
+    """
+    eps = float(argument) if argument is not None else DEFAULT_EPS
+    count, numbers, batch = 0, True, []
+    for count, (found, expected) in enumerate(zip_longest(
+            TOKEN_RE.finditer(output), TOKEN_RE.finditer(pattern)), 1):
+        if found is None:
+            return RESULT_WA, 'Unexpected end of file: token %d expected' % count
+        if expected is None:
+            return RESULT_WA, 'Extra tokens after token %d' % (count - 1)
+        batch.append((found.group(), expected.group()))
+        if len(batch) == BATCH_SIZE:
+            verdict, batch_numbers = compare_batch(count - len(batch) + 1, batch, eps)
+            if verdict:
+                return verdict
+            numbers, batch = numbers and batch_numbers, []
+    if batch:
+        verdict, batch_numbers = compare_batch(count - len(batch) + 1, batch, eps)
+        if verdict:
+            return verdict
+        numbers = numbers and batch_numbers
+    if count and numbers:
+        return RESULT_OK, 'ok %d numbers' % count
+    return RESULT_OK, 'ok %d tokens' % count
@@ -4,21 +4,23 @@
 
 import tempfile
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from subprocess import Popen, PIPE, STDOUT
 
 from pysistem import app, db
 from pysistem.problems.model import Problem
+from pysistem.compilers.model import run_sandboxed
+from pysistem.compilers import scratch, sandbox
+from pysistem.submissions.output import get_mode, read_output, limit_text
+from pysistem.checkers import builtin, server, runcache
 
 from pysistem.submissions.const import STR_RESULT, STR_STATUS, STATUS_CWAIT
 from pysistem.submissions.const import STATUS_WAIT, STATUS_COMPILEFAIL, STATUS_DONE
 from pysistem.submissions.const import STATUS_ACT, STATUS_CHECKING, STATUS_COMPILING
 from pysistem.submissions.const import RESULT_OK, RESULT_IE, RESULT_SV, RESULT_ML
 from pysistem.submissions.const import RESULT_TL, RESULT_RE, RESULT_WA, RESULT_PE
-
-try:
-    from pysistem.conf import DIR
-except: # pragma: no cover
-    from pysistem.conf_default import DIR
+from pysistem.submissions.const import USAGE_FIELDS
 
 class Checker(db.Model):
     """A submission runner
@@ -68,7 +70,8 @@ class Checker(db.Model):
         return self.compiler.lang
 
     def get_src_path(self):
-        return DIR + '/work/work/checker_%d.%s' % (self.id, self.get_ext())
+        """Get path to checker's source in scratch directory, next to checker headers"""
+        return os.path.join(scratch.link_includes(), 'checker_%d.%s' % (self.id, self.get_ext()))
 
     def get_result(self):
         if self.status in [STATUS_DONE, STATUS_ACT]:
@@ -85,14 +88,9 @@ class Checker(db.Model):
         self.status = STATUS_COMPILING
         db.session.commit()
 
-        with open(self.get_src_path(), "w") as file:
-            file.write(self.source)
-
-        success, stdout = self.compiler.compile(self.get_src_path(), self.get_exe_path())
-
-        try:
-            os.remove(self.get_src_path())
-        except: pass
+        with scratch.job():
+            success, stdout = self.compiler.compile_source(self.source, self.get_src_path(),
+                                                           self.get_exe_path())
 
         self.compile_log = stdout
 
@@ -116,6 +114,15 @@ class Checker(db.Model):
         else:
             return False
 
+    def get_runner(self, submission, source_path=''):
+        """Get TestRunner that runs submission and checks its output with this checker
+
+        Arguments:
+        submission -- Submission object for checking
+        source_path -- path to submission's source, required for intepretable languages
+        """
+        return get_runner(submission, source_path, self)
+
     def check_test(self, submission, test):
         """Run submission on test. For internal use.
 
@@ -124,69 +131,25 @@ class Checker(db.Model):
         test -- TestPair object for checking
 
         Returns:
-        Tuple: (Checker output, Submission output)
+        Tuple: (Checker output, Submission output as stored, see pysistem.submissions.output)
 
         """
-        submission.current_test_id = test.id
-        cstdout = b''
-        result, stdout, stderr = submission.run(test.input, submission.problem.time_limit,
-                                                submission.problem.memory_limit,
-                                                commit_waiting=False)
-        subres = RESULT_OK
-
-        if result & 8:
-            subres = RESULT_IE
-        elif result & 16:
-            subres = RESULT_SV
-        elif result & 4:
-            subres = RESULT_ML
-        elif result & 1:
-            subres = RESULT_TL
-        elif result & 2:
-            subres = RESULT_RE
-
-        if subres == RESULT_OK:
-
-            # NOTHING WRONG: CHECK FOR OK/WA/PE
-            input_path = tempfile.gettempdir() + '/pysistem_checker_input_' + \
-                         str(submission.id) + '_' + str(test.id)
-            output_path = tempfile.gettempdir() + '/pysistem_checker_output_' + \
-                         str(submission.id) + '_' + str(test.id)
-            pattern_path = tempfile.gettempdir() + '/pysistem_checker_pattern_' + \
-                         str(submission.id) + '_' + str(test.id)
-
-            with open(input_path, 'w') as input_file, \
-                 open(output_path, 'w') as output_file, \
-                 open(pattern_path, 'w') as pattern_file:
-                print(test.input, file=input_file)
-                print(test.pattern, file=pattern_file)
-                print(stdout.decode(), file=output_file)
-
-            cmd = [self.get_exe_path(), input_path, output_path, pattern_path]
-            proc = Popen(cmd, stdout=PIPE, stderr=STDOUT)
-            cstdout, cstderr = proc.communicate()
-            returncode = proc.returncode
-
-            os.remove(input_path)
-            os.remove(output_path)
-            os.remove(pattern_path)
-
-            if returncode in [0, 0xAC]:
-                subres = RESULT_OK
-            elif returncode in [1, 0xAB]:
-                subres = RESULT_WA
-            elif returncode in [2, 0xAA]:
-                subres = RESULT_PE
-            else:
-                subres = RESULT_IE
+        submission.set_progress(test.id)
+        source_path = submission.write_source()
+        try:
+            runner = self.get_runner(submission, source_path)
+            subres, cstdout, output = runner.run(test.id, test.get_input_path(),
+                                                 test.get_pattern_path())
+        finally:
+            os.remove(source_path)
 
         submission.result = subres
         if submission.result == RESULT_OK:
             submission.score += test.test_group.score_per_test
-        return cstdout.decode(), stdout.decode()
+        return cstdout, output['stdout']
 
     def check(self, submission, session=None):
-        """(Re)check submission. For internal use.
+        """(Re)check submission with this checker. For internal use.
 
         Arguments:
         submission -- Submission object for checking
@@ -196,46 +159,369 @@ class Checker(db.Model):
         pysistem.submissions.const -- Submission's result
 
         """
-        print("Starting checking", submission);
-        session = session or db.session
-        from pysistem.submissions.model import SubmissionLog
-        submission.result = RESULT_OK
-        submission.status = STATUS_CHECKING
-        submission.score = 0
-        submission.check_log = ''
-        last_result = RESULT_OK
-        for submission_log in session.query(SubmissionLog).filter(
-            SubmissionLog.submission_id == submission.id):
-            session.remove(submission_log)
+        return check_submission(submission, self, session)
+
+def get_runner(submission, source_path='', checker=None):
+    """Get TestRunner that runs submission and checks its output
+
+    Output is checked with problem's built-in comparator, if it is set,
+    else with checker.
+
+    Arguments:
+    submission -- Submission object for checking
+    source_path -- path to submission's source, required for intepretable languages
+    checker -- Checker object
+    """
+    problem = submission.problem
+    checker_exe = checker_server = None
+    if not problem.builtin_checker:
+        checker_exe = checker.get_exe_path()
+        checker_server = server.get_server(checker.compiler, checker.source, checker_exe)
+    return TestRunner(checker_exe,
+                      submission.compiler.get_run_cmd(submission.get_exe_path(), source_path),
+                      problem.time_limit, problem.memory_limit, submission.id,
+                      comparator=problem.builtin_checker, checker_server=checker_server,
+                      program_key=runcache.get_program_key(submission.compiler,
+                                                           submission.get_exe_path(),
+                                                           submission.source))
+
+def check_submission(submission, checker=None, session=None, reuse=None):
+    """(Re)check submission. For internal use.
+
+    Arguments:
+    submission -- Submission object for checking
+    checker -- Checker object, not needed if problem has built-in comparator
+    session -- SQLAlchemy session object to use. Default -- db.session
+    reuse -- results of tests not to run again, see pysistem.judge.rejudge.get_reusable
+
+    Returns:
+    pysistem.submissions.const -- Submission's result
 
+    """
+    print("Starting checking", submission);
+    session = session or db.session
+    from pysistem.submissions.model import SubmissionLog
+    submission.result = RESULT_OK
+    submission.status = STATUS_CHECKING
+    submission.score = 0
+    submission.check_log = ''
+    submission.set_usage({})
+    session.query(SubmissionLog) \
+        .filter(SubmissionLog.submission_id == submission.id) \
+        .delete(synchronize_session=False)
+    session.commit()
+    submission_id = submission.id
+
+    # Logs are written in bulk at group boundaries and every
+    # JUDGE_FLUSH_INTERVAL seconds, progress goes through shared cache
+    pending = []
+    flush_interval = app.config.get('JUDGE_FLUSH_INTERVAL', 5)
+    last_flush = [time.time()]
+    def flush():
+        """Write pending logs and submission's score"""
+        if pending:
+            session.bulk_insert_mappings(SubmissionLog, pending)
+            del pending[:]
         session.commit()
-        from pysistem.test_pairs.model import TestPair, TestGroup
-        for test_group in session.query(TestGroup) \
-            .filter(self.problem_id == TestGroup.problem_id):
+        last_flush[0] = time.time()
+
+    source_path = submission.write_source()
+    runner = get_runner(submission, source_path, checker)
+    from pysistem.test_pairs.model import TestPair, TestGroup
+    versions = {}
+    def group_tests(test_group_id):
+        """Get function loading tests of group"""
+        def load():
+            """Flush previous group and load tests of group"""
+            flush()
+            tests = session.query(TestPair).filter(test_group_id == TestPair.test_group_id).all()
+            versions.update((test.id, test.get_version()) for test in tests)
+            return [(test.id, test.get_input_path(), test.get_pattern_path()) for test in tests]
+        return load
+
+    groups = [(test_group.score, test_group.score_per_test, test_group.check_all,
+               group_tests(test_group.id)) for test_group in session.query(TestGroup) \
+              .filter(submission.problem_id == TestGroup.problem_id)]
+    verdict = Verdict()
+    try:
+        for test_id, result, cstdout, output in runner.run_groups(groups, verdict, reuse):
+            submission.set_progress(test_id)
+            submission.result = result
+            submission.score = verdict.score
+            pending.append(dict(output, submission_id=submission_id, test_pair_id=test_id,
+                                result=result, log=cstdout, test_version=versions[test_id]))
+            if time.time() - last_flush[0] >= flush_interval:
+                flush()
+    finally:
+        os.remove(source_path)
+        submission.set_progress(0)
+    if pending:
+        session.bulk_insert_mappings(SubmissionLog, pending)
+    submission.current_test_id = 0
+    submission.result = verdict.result
+    submission.score = verdict.score
+    submission.set_usage(verdict.usage)
+    submission.done()
+    return submission.result
+
+class Verdict(object):
+    """Result and score of submission being checked, see TestRunner.run_groups
+
+    Fields:
+    result -- result of the first failed test, RESULT_OK if all passed so far
+    score -- score gained so far
+    usage -- resource usage on tests so far: dict of
+             pysistem.submissions.const.USAGE_AGGREGATES fields
+    """
+    def __init__(self):
+        self.result = RESULT_OK
+        self.score = 0
+        self.usage = {}
+
+    def add_usage(self, fields):
+        """Add resource usage on test
+
+        Arguments:
+        fields -- dict of USAGE_FIELDS, see run_sandboxed
+        """
+        for field in USAGE_FIELDS:
+            value = fields.get(field)
+            if value is None:
+                continue
+            self.usage['max_' + field] = max(self.usage.get('max_' + field, 0), value)
+            if field != 'memory':
+                self.usage['total_' + field] = self.usage.get('total_' + field, 0) + value
+
+def result_from_exitcode(exitcode):
+    """Convert runsbox(1) exit code bitmask to pysistem.submissions.const result"""
+    if exitcode & 8:
+        return RESULT_IE
+    elif exitcode & 16:
+        return RESULT_SV
+    elif exitcode & 4:
+        return RESULT_ML
+    elif exitcode & 1:
+        return RESULT_TL
+    elif exitcode & 2:
+        return RESULT_RE
+    return RESULT_OK
+
+class TestRunner(object):
+    """Runs compiled submission on tests and checks its output
+
+    Holds only plain values and never touches the database,
+    so one runner can be used from several threads at once.
+
+    Fields:
+    checker_exe -- path to checker's binary, None if comparator is used
+    run_cmd -- command line of submission, see Compiler.get_run_cmd
+    time_limit -- time limit, in milliseconds
+    memory_limit -- memory limit, in KiB
+    tag -- string used to name temporary files, usually submission's ID
+    workers -- maximum amount of tests run at once
+    output_mode -- how to store submission's output, see pysistem.submissions.output
+    comparator -- name of built-in comparator used instead of checker,
+                  see pysistem.checkers.builtin
+    checker_server -- path to checker server used instead of running checker_exe
+                      for every test, see pysistem.checkers.server
+    scratch_dir -- directory for submission's output and working directory,
+                   scratch directory of the job that created runner
+    program_key -- key of submission in run result cache, None if it is not used,
+                   see pysistem.checkers.runcache.get_program_key
+    checker_key -- key of checker in run result cache
+    """
+    def __init__(self, checker_exe, run_cmd, time_limit, memory_limit, tag='', workers=None,
+                 output_mode=None, comparator=None, checker_server=None, program_key=None):
+        self.checker_exe = checker_exe
+        self.run_cmd = run_cmd
+        self.time_limit = time_limit
+        self.memory_limit = memory_limit
+        self.tag = tag
+        self.workers = workers or app.config.get('JUDGE_TEST_WORKERS', 1)
+        self.output_mode = output_mode or get_mode()
+        self.comparator = comparator
+        self.checker_server = checker_server
+        self.scratch_dir = scratch.get_dir()
+        self.program_key = program_key
+        self.checker_key = None
+        if program_key:
+            self.checker_key = runcache.get_checker_key(checker_exe, comparator)
+
+    def run(self, test_id, input_path, pattern_path, procs=None):
+        """Run submission on test and check its output
+
+        Arguments:
+        test_id -- TestPair's ID
+        input_path -- path to test pair's input, see TestPair.get_input_path
+        pattern_path -- path to test pair's pattern
+        procs -- see run_sandboxed
+
+        Returns:
+        Tuple: (Result, Checker output, dict of SubmissionLog fields: output, see
+                pysistem.submissions.output.read_output, and resource usage,
+                see run_sandboxed)
+        """
+        cstdout = b''
+        output_fd, output_path = tempfile.mkstemp(prefix='pysistem_checker_output_%s_%s_'
+                                                  % (self.tag, test_id), dir=self.scratch_dir)
+        os.close(output_fd)
+        usage = {}
+        run_key = cached = None
+        if self.program_key:
+            run_key = runcache.make_key(self.program_key, runcache.get_file_hash(input_path),
+                                        self.time_limit, self.memory_limit)
+            cached = runcache.get_run(run_key, output_path)
+        try:
+            if cached:
+                exitcode = cached[0]
+                usage.update(cached[1])
+            else:
+                exitcode, _, stderr = run_sandboxed(self.run_cmd, self.time_limit,
+                                                    self.memory_limit, stdin_path=input_path,
+                                                    stdout_path=output_path, usage=usage,
+                                                    workdir=self.scratch_dir, procs=procs)
+                if run_key and runcache.is_cacheable(exitcode, usage, self.time_limit,
+                                                     self.memory_limit):
+                    runcache.put_run(run_key, exitcode, usage, output_path)
+                else:
+                    run_key = None
+            subres = result_from_exitcode(exitcode)
+
+            if subres == RESULT_OK:
+                subres, cstdout = self.check_output(input_path, output_path, pattern_path,
+                                                    run_key)
+            output = read_output(output_path, self.output_mode)
+            output.update(usage)
+        finally:
+            os.remove(output_path)
+
+        return subres, limit_text(cstdout.decode(errors='replace')), output
+
+    def check_output(self, input_path, output_path, pattern_path, run_key=None):
+        """Check output of submission that finished without errors
+
+        Arguments:
+        run_key -- key of cached run to cache verdict with, see pysistem.checkers.runcache
+
+        Returns:
+        Tuple: (Result, Checker output, bytes)
+        """
+        check_key = None
+        if run_key:
+            check_key = runcache.make_key(run_key, self.checker_key,
+                                          runcache.get_file_hash(pattern_path))
+            cached = runcache.get_check(check_key)
+            if cached:
+                return cached
+
+        if self.comparator:
+            result, message = builtin.compare(self.comparator, output_path, pattern_path)
+            cstdout = message.encode()
+        else:
+            # NOTHING WRONG: CHECK FOR OK/WA/PE
+            returncode, cstdout = self.run_checker(input_path, output_path, pattern_path)
+
+            if returncode in [0, 0xAC]:
+                result = RESULT_OK
+            elif returncode in [1, 0xAB]:
+                result = RESULT_WA
+            elif returncode in [2, 0xAA]:
+                result = RESULT_PE
+            else:
+                result = RESULT_IE
+
+        if check_key and result != RESULT_IE:
+            runcache.put_check(check_key, result, cstdout)
+        return result, cstdout
+
+    def run_checker(self, input_path, output_path, pattern_path):
+        """Run checker on submission's output
+
+        Returns:
+        Tuple: (Checker's exit code, Checker's output)
+        """
+        if self.checker_server:
+            try:
+                return server.check(self.checker_server, input_path, output_path, pattern_path)
+            except (IOError, OSError, ValueError):
+                print('Checker server %s failed, running checker' % self.checker_server)
+        cmd = [self.checker_exe, input_path, output_path, pattern_path]
+        proc = Popen(cmd, stdout=PIPE, stderr=STDOUT)
+        cstdout, cstderr = proc.communicate()
+        return proc.returncode, cstdout
+
+    def run_group(self, tests, check_all=False, reuse=None):
+        """Run submission on group of tests
+
+        Tests are run on up to 'workers' threads. If check_all is False,
+        tests after the first failed one are run speculatively and
+        their results are dropped, so the verdict is the same as when
+        checking sequentially. Speculative runs still in progress then are killed.
+
+        Arguments:
+        tests -- list of tuples: (TestPair's ID, path to input, path to pattern)
+        check_all -- check every test regardless of previous results
+        reuse -- dict: TestPair's ID -> result of run, for tests not to run again
+
+        Yields:
+        Tuple: (TestPair's ID, Result, Checker output, Submission output fields) in order of tests
+        """
+        reuse = reuse or {}
+        fresh = [test for test in tests if test[0] not in reuse]
+        if self.workers <= 1 or len(fresh) <= 1:
+            for test in tests:
+                result = reuse[test[0]] if test[0] in reuse else self.run(*test)
+                yield (test[0],) + tuple(result)
+                if result[0] != RESULT_OK and not check_all:
+                    return
+            return
+
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        procs = set()
+        futures = dict((test[0], executor.submit(self.run, *test, procs=procs))
+                       for test in fresh)
+        try:
+            for test in tests:
+                result = reuse[test[0]] if test[0] in reuse else futures[test[0]].result()
+                yield (test[0],) + tuple(result)
+                if result[0] != RESULT_OK and not check_all:
+                    return
+        finally:
+            for future in futures.values():
+                future.cancel()
+            # Speculative runs already in progress are killed, so they do not
+            # take CPU or outlive scratch directory they write to
+            while wait(futures.values(), 0).not_done:
+                sandbox.kill_procs(procs)
+                wait(futures.values(), 0.1)
+            executor.shutdown(wait=True)
+
+    def run_groups(self, groups, verdict, reuse=None):
+        """Run submission on test groups, stopping after the first failed group
+
+        Arguments:
+        groups -- list of tuples: (Group score, Score per test, Check all, Tests),
+                  where Tests is list for run_group or function returning it
+        verdict -- Verdict object, updated after every test
+        reuse -- see run_group
+
+        Yields:
+        Same as run_group
+        """
+        for score, score_per_test, check_all, tests in groups:
+            if callable(tests):
+                tests = tests()
             all_passed = True
-            for test in session.query(TestPair) \
-                .filter(test_group.id == TestPair.test_group_id):
-                cstdout, stdout = self.check_test(submission, test)
-                submission_log = session.query(SubmissionLog).filter(db.and_(
-                    SubmissionLog.submission_id == submission.id,
-                    SubmissionLog.test_pair_id == test.id
-                    )).first() or SubmissionLog(submission=submission, test_pair=test)
-                session.add(submission_log)
-                submission_log.result = submission.result
-                submission_log.log = cstdout
-                submission_log.stdout = stdout
-                session.commit()
-                if submission.result != RESULT_OK:
+            for test_id, result, cstdout, output in self.run_group(tests, check_all, reuse):
+                verdict.add_usage(output)
+                if result == RESULT_OK:
+                    verdict.score += score_per_test
+                else:
                     all_passed = False
-                    if last_result == RESULT_OK:
-                        last_result = submission.result
-                    if not test_group.check_all:
-                        break
+                    if verdict.result == RESULT_OK:
+                        verdict.result = result
+                yield test_id, result, cstdout, output
             if all_passed:
-                submission.score += test_group.score
+                verdict.score += score
             else:
                 break
-        submission.current_test_id = 0
-        submission.result = last_result
-        submission.done()
-        return submission.result
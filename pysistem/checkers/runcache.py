@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+"""Cache of run results
+
+Running the same binary on the same test with the same limits gives the
+same output, so rechecks of unchanged submissions (e.g. after checker
+was fixed) may skip running them and cost only checker invocations.
+
+Runs are keyed by hash of executable, source, compiler's run command and
+name, hash of input, time and memory limits. Checker verdicts are keyed by
+run, checker (hash of its binary or name of built-in comparator) and hash
+of pattern. Files in STORAGE/run_cache:
+<key>.run -- msgpack-encoded runsbox(1) exit code, resource usage and output hash
+<output hash>.out -- program's output, shared by runs with same output
+<key>.check -- msgpack-encoded checker verdict and output
+
+Only runs finished with OK or RE well within limits are cached: usage
+above RUN_CACHE_MARGIN of time or memory limit is considered noise-prone,
+so such runs and TL, ML, SV and IE results are always run again.
+
+Cache is disabled unless RUN_CACHE is set. Least recently used files are
+evicted when cache grows above RUN_CACHE_SIZE bytes.
+"""
+
+import hashlib
+import os
+import shutil
+
+import msgpack
+
+from pysistem import app, storage
+from pysistem.test_pairs.store import get_store_dir
+
+def get_cache_dir():
+    """Get directory where cache entries are stored"""
+    return os.path.join(app.config['STORAGE'], 'run_cache')
+
+def is_enabled():
+    """Check if run result cache is enabled"""
+    return app.config.get('RUN_CACHE', False)
+
+def make_key(*parts):
+    """Get hash of strings"""
+    hasher = hashlib.sha256()
+    for part in parts:
+        hasher.update(str(part).encode())
+        hasher.update(b'\0')
+    return hasher.hexdigest()
+
+def get_file_hash(path):
+    """Get content hash of file, taken from its name for files in test store
+
+    Returns:
+    Hex digest or '' if file does not exist
+    """
+    if os.path.dirname(os.path.dirname(path)) == get_store_dir():
+        return os.path.basename(path)
+    hasher = hashlib.sha256()
+    try:
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                hasher.update(chunk)
+    except (IOError, OSError):
+        return ''
+    return hasher.hexdigest()
+
+def get_program_key(compiler, exe, source):
+    """Get key identifying program for TestRunner
+
+    Arguments:
+    compiler -- Compiler object
+    exe -- path to executable
+    source -- source code
+
+    Returns:
+    Key or None if cache is disabled
+    """
+    if not is_enabled():
+        return None
+    return make_key(get_file_hash(exe), source, compiler.cmd_run, compiler.name)
+
+def get_checker_key(checker_exe, comparator):
+    """Get key identifying checker or built-in comparator"""
+    if comparator:
+        return 'builtin:' + comparator
+    return get_file_hash(checker_exe)
+
+def is_cacheable(exitcode, usage, time_limit, memory_limit):
+    """Check if run may be reused, see module's docstring"""
+    if exitcode & ~2:
+        return False
+    margin = app.config.get('RUN_CACHE_MARGIN', 0.5)
+    cpu_time, memory = usage.get('cpu_time'), usage.get('memory')
+    return cpu_time is not None and memory is not None and \
+        cpu_time < time_limit * margin and memory < memory_limit * margin
+
+def get_run(key, output_path):
+    """Get cached run
+
+    Arguments:
+    key -- run's key
+    output_path -- path to copy program's output to
+
+    Returns:
+    Tuple: (runsbox(1) exit code, resource usage) or None if not cached
+    """
+    meta = _read_meta(key + '.run')
+    if meta is None:
+        return None
+    try:
+        output = os.path.join(get_cache_dir(), meta['output'] + '.out')
+        shutil.copyfile(output, output_path)
+        os.utime(output)
+    except (OSError, KeyError):
+        return None
+    return meta['exitcode'], meta['usage']
+
+def put_run(key, exitcode, usage, output_path):
+    """Store run in cache
+
+    Arguments:
+    key -- run's key
+    exitcode -- runsbox(1) exit code
+    usage -- resource usage, see run_sandboxed
+    output_path -- path to program's output
+    """
+    output_hash = get_file_hash(output_path)
+    output = os.path.join(get_cache_dir(), output_hash + '.out')
+    try:
+        if not os.path.exists(output):
+            with open(output_path, 'rb') as output_file:
+                storage.write_atomic(output,
+                                     lambda file: shutil.copyfileobj(output_file, file))
+        _write_meta(key + '.run', {'exitcode': exitcode, 'usage': usage, 'output': output_hash})
+    except OSError: # pragma: no cover
+        return
+    evict()
+
+def get_check(key):
+    """Get cached checker verdict
+
+    Returns:
+    Tuple: (Result, Checker output) or None if not cached
+    """
+    meta = _read_meta(key + '.check')
+    if meta is None:
+        return None
+    return meta['result'], meta['log']
+
+def put_check(key, result, log):
+    """Store checker verdict in cache
+
+    Arguments:
+    key -- checker verdict's key
+    result -- Result, see pysistem.submissions.const
+    log -- checker output, bytes
+    """
+    try:
+        _write_meta(key + '.check', {'result': result, 'log': log})
+    except OSError: # pragma: no cover
+        pass
+
+def evict(max_size=None):
+    """Remove least recently used files until cache fits into max_size bytes
+
+    Arguments:
+    max_size -- cache size budget. Default -- RUN_CACHE_SIZE
+    """
+    if max_size is None:
+        max_size = app.config.get('RUN_CACHE_SIZE', 512 * 1024 * 1024)
+    storage.evict(get_cache_dir(), max_size)
+
+def _read_meta(name):
+    """Read msgpack-encoded cache file, marking it as recently used"""
+    path = os.path.join(get_cache_dir(), name)
+    try:
+        with open(path, 'rb') as meta_file:
+            meta = msgpack.unpackb(meta_file.read(), raw=False)
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+    return meta
+
+def _write_meta(name, meta):
+    """Write msgpack-encoded cache file"""
+    data = msgpack.packb(meta, use_bin_type=True)
+    storage.write_atomic(os.path.join(get_cache_dir(), name), lambda file: file.write(data))
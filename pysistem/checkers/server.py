@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+"""Persistent checker processes
+
+Spawning a checker for every test costs more than checking itself on
+problems with many small tests. With CHECKER_SERVER enabled, C and C++
+checkers are additionally compiled as checker servers: the source is
+wrapped so that its main() becomes an ordinary function, and a new main()
+reads requests from stdin and runs the checker in a forked child for
+each of them. Fork gives every test a fresh copy of checker's state, so
+testlib checkers, which exit() with the verdict, work unchanged.
+
+Protocol, one request at a time:
+request -- line: input path, output path and pattern path separated by tabs
+response -- line: checker's exit code (-1 if killed) and log size,
+            followed by checker's log: stdout and stderr
+
+Servers are compiled on first use. Idle servers are kept in a pool per
+checker binary, so every thread checking a problem reuses its own process.
+If server fails to compile or dies, checker is run once per test as usual.
+"""
+
+import os
+import threading
+from subprocess import Popen, PIPE
+
+from pysistem import app
+from pysistem.compilers import scratch
+
+LANGUAGES = ('c', 'cpp')
+MAX_POOLS = 16
+
+_compile_lock = threading.Lock()
+_failed = set()
+
+SERVER_SOURCE = r'''
+#undef main
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/types.h>
+#include <sys/wait.h>
+
+int main(void) {
+    static char line[3 * 4096 + 16];
+    int (*checker_main)(int, char**) = (int (*)(int, char**)) pysistem_checker_main;
+    while (fgets(line, sizeof(line), stdin)) {
+        char* argv[5] = {(char*) "checker", line, NULL, NULL, NULL};
+        char* end = strchr(line, '\n');
+        if (end) *end = 0;
+        argv[2] = strchr(argv[1], '\t');
+        if (argv[2]) { *argv[2]++ = 0; argv[3] = strchr(argv[2], '\t'); }
+        if (argv[3]) *argv[3]++ = 0;
+
+        FILE* log = tmpfile();
+        int code = -1, status = 0;
+        fflush(stdout);
+        pid_t pid = fork();
+        if (pid == 0) {
+            int null_fd = open("/dev/null", O_RDONLY);
+            dup2(null_fd, 0);
+            dup2(fileno(log), 1);
+            dup2(fileno(log), 2);
+            exit(argv[3] ? checker_main(4, argv) : -1);
+        }
+        if (pid > 0 && waitpid(pid, &status, 0) == pid && WIFEXITED(status))
+            code = WEXITSTATUS(status);
+
+        long size = log ? (long) lseek(fileno(log), 0, SEEK_END) : 0;
+        printf("%d %ld\n", code, size);
+        if (size > 0) {
+            char buf[65536];
+            ssize_t got;
+            lseek(fileno(log), 0, SEEK_SET);
+            while ((got = read(fileno(log), buf, sizeof(buf))) > 0)
+                fwrite(buf, 1, got, stdout);
+        }
+        fflush(stdout);
+        if (log) fclose(log);
+    }
+    return 0;
+}
+'''
+
+def is_enabled():
+    """Check if checker servers are enabled"""
+    return app.config.get('CHECKER_SERVER', False)
+
+def supports(compiler):
+    """Check if checkers compiled by compiler can be run as servers"""
+    return compiler.lang in LANGUAGES
+
+def wrap_source(source):
+    """Turn checker's source into checker server's source"""
+    return '#define main pysistem_checker_main\n#line 1\n' + source + '\n' + SERVER_SOURCE
+
+def get_server(compiler, source, exe):
+    """Get checker server of checker binary, compiling it on first use
+
+    Arguments:
+    compiler -- Compiler object of checker
+    source -- checker's source
+    exe -- path to checker's binary
+
+    Returns:
+    Path to server or None, if disabled, not supported or failed to compile
+    """
+    if not is_enabled() or not supports(compiler) or not os.path.exists(exe):
+        return None
+    server_exe = exe + '_server'
+    with _compile_lock:
+        if os.path.exists(server_exe) and \
+           os.stat(server_exe).st_mtime >= os.stat(exe).st_mtime:
+            return server_exe
+        key = _get_pool_key(exe)
+        if key in _failed:
+            return None
+        tmp_exe = '%s.%d.tmp' % (server_exe, os.getpid())
+        with scratch.job():
+            src = os.path.join(scratch.link_includes(), 'checker_server_%s.%s'
+                               % (os.path.basename(exe), compiler.lang))
+            try:
+                success, log = compiler.compile_source(wrap_source(source), src, tmp_exe)
+            finally:
+                try:
+                    os.remove(src)
+                except OSError:
+                    pass
+        if not success:
+            print('Checker server of %s failed to compile, running checker per test' % exe)
+            _failed.add(key)
+            return None
+        os.replace(tmp_exe, server_exe)
+    return server_exe
+
+class CheckerServer(object):
+    """Running checker server
+
+    Fields:
+    exe -- path to server's binary
+    proc -- Popen object
+    """
+    def __init__(self, exe):
+        self.exe = exe
+        self.proc = Popen([exe], stdin=PIPE, stdout=PIPE)
+
+    def check(self, input_path, output_path, pattern_path):
+        """Run checker on test
+
+        Returns:
+        Tuple: (Checker's exit code, Checker's output bytes)
+        """
+        self.proc.stdin.write(('%s\t%s\t%s\n' % (input_path, output_path, pattern_path)).encode())
+        self.proc.stdin.flush()
+        header = self.proc.stdout.readline().split()
+        if len(header) != 2:
+            raise IOError('Checker server %s exited' % self.exe)
+        code, size = int(header[0]), int(header[1])
+        return code, self.proc.stdout.read(size)
+
+    def close(self):
+        """Stop server"""
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(1)
+        except Exception:
+            self.proc.kill()
+            self.proc.wait()
+
+_lock = threading.Lock()
+_pools = {}
+
+def _get_pool_key(exe):
+    """Servers are reused only while binary is the same"""
+    return exe, os.stat(exe).st_mtime
+
+def acquire(exe):
+    """Take idle server of binary from pool, or start new one"""
+    key = _get_pool_key(exe)
+    with _lock:
+        pool = _pools.pop(key, [])
+        _pools[key] = pool # Most recently used go last
+        if pool:
+            return pool.pop()
+        stale = list(_pools)[:-MAX_POOLS]
+        stale_servers = [server for stale_key in stale for server in _pools.pop(stale_key)]
+    for server in stale_servers:
+        server.close()
+    return CheckerServer(exe)
+
+def release(server, reuse=True):
+    """Return server to pool, or stop it if reuse is False"""
+    if not reuse:
+        server.close()
+        return
+    try:
+        key = _get_pool_key(server.exe)
+    except OSError:
+        server.close()
+        return
+    with _lock:
+        if key in _pools:
+            _pools[key].append(server)
+            return
+    server.close()
+
+def check(exe, input_path, output_path, pattern_path):
+    """Run checker server on test, see CheckerServer.check"""
+    server = acquire(exe)
+    try:
+        result = server.check(input_path, output_path, pattern_path)
+    except:
+        release(server, False)
+        raise
+    release(server)
+    return result
@@ -1,43 +1,169 @@
 # -*- coding: utf-8 -*-
 
 import threading
-from time import sleep
+import traceback
+from datetime import datetime, timedelta
 
 from pysistem import app, db
 from pysistem.submissions.model import Submission
 from pysistem.submissions.model import SubmissionLog
 from pysistem.compilers.model import Compiler
+from pysistem.compilers import scratch
+from pysistem.checkers.model import Checker
+from pysistem.problems.model import Problem
 from pysistem.submissions.const import STATUS_CWAIT, STATUS_WAIT, STATUS_CHECKING
+from pysistem.submissions.const import STATUS_COMPILING, STATUS_ACT, STATUS_DONE, RESULT_IE
+from pysistem.judge import notify, scheduler, rejudge
 
 CHECK_THREAD_TIME = app.config.get('CHECK_THREAD_TIME', 1)
+CHECK_THREAD_IDLE_TIME = app.config.get('CHECK_THREAD_IDLE_TIME', 60)
+CHECK_THREAD_WORKERS = app.config.get('CHECK_THREAD_WORKERS', 1)
 
 Session = db.scoped_session(db.sessionmaker(bind=db.engine))
 
 
+def claim_submission(session, is_available=None, values=None):
+    """Atomically take one waiting submission for checking
+
+    Waiting submissions are tried in order given by pysistem.judge.scheduler.
+    Submissions to problems without active checker or built-in comparator
+    and submissions of rejudge jobs using their share of judge capacity
+    (see pysistem.judge.rejudge) are left waiting.
+    The status is switched from waiting to STATUS_COMPILING with a guarded
+    UPDATE, so two workers never get the same submission.
+
+    Arguments:
+    session -- SQLAlchemy session object to use
+    is_available -- function(Compiler) checking if compiler can be used.
+                    Default -- Compiler.is_available
+    values -- dict of additional Submission fields to set on claim
+
+    Returns:
+    Claimed Submission or None, if there is nothing to check
+    """
+    is_available = is_available or Compiler.is_available
+    checkers = dict(session.query(Checker.problem_id, Checker.compiler_id) \
+        .filter(Checker.status == STATUS_ACT))
+    checkers.update((problem_id, None) for (problem_id,) in session.query(Problem.id) \
+        .filter(Problem.builtin_checker != None))
+    throttled = rejudge.get_throttled(session)
+    available = {}
+    def compiler_available(compiler_id):
+        """Check compiler once per claim"""
+        if compiler_id not in available:
+            compiler = session.query(Compiler).get(compiler_id)
+            available[compiler_id] = bool(compiler and is_available(compiler))
+        return available[compiler_id]
+
+    for entry in scheduler.rank(scheduler.load_queue(session), session):
+        if entry.problem_id not in checkers or entry.rejudge_job_id in throttled:
+            continue
+        if not compiler_available(entry.compiler_id) or \
+           (checkers[entry.problem_id] and not compiler_available(checkers[entry.problem_id])):
+            continue
+
+        update = {"status": STATUS_COMPILING}
+        update.update(values or {})
+        claimed = session.query(Submission).filter(db.and_(
+            Submission.id == entry.id,
+            Submission.status == entry.status
+        )).update(update, synchronize_session=False)
+        session.commit()
+        if claimed:
+            return session.query(Submission).get(entry.id)
+    return None
+
+
+def requeue_stale_submissions():
+    """Return submissions left in progress by a stopped checker to the queue"""
+    session = Session()
+    session.query(Submission) \
+        .filter(db.and_(Submission.status.in_([STATUS_COMPILING, STATUS_CHECKING]),
+                        Submission.lease == None)) \
+        .update({"status": STATUS_CWAIT, "current_test_id": 0}, synchronize_session=False)
+    session.commit()
+    Session.remove()
+
+
+def requeue_expired_leases(session):
+    """Return submissions of judge nodes silent for JUDGE_LEASE_TIMEOUT to the queue
+
+    Arguments:
+    session -- SQLAlchemy session object to use
+    """
+    expired = datetime.now() - timedelta(seconds=app.config.get('JUDGE_LEASE_TIMEOUT', 600))
+    session.query(Submission) \
+        .filter(db.and_(Submission.status.in_([STATUS_COMPILING, STATUS_CHECKING]),
+                        Submission.lease != None, Submission.lease_time < expired)) \
+        .update({"status": STATUS_CWAIT, "current_test_id": 0, "lease": None},
+                synchronize_session=False)
+    session.commit()
+
+
+def fail_submission(submission_id):
+    """Finish claimed submission that failed to be checked with Internal Error
+
+    Claim is already committed, so the submission would stay compiling or
+    checking until restart. Uses its own session, as the one of the failed
+    check may be broken
+    """
+    session = db.sessionmaker(bind=db.engine)()
+    try:
+        session.query(Submission).filter(Submission.id == submission_id) \
+            .update({"status": STATUS_DONE, "result": RESULT_IE, "score": 0,
+                     "current_test_id": 0}, synchronize_session=False)
+        session.commit()
+    except Exception:
+        traceback.print_exc()
+        session.rollback()
+    finally:
+        session.close()
+
+
 def check_thread_wake():
-    """Check submissions"""
+    """Claim and check one submission
+
+    Returns:
+    True if a submission was checked, False if the queue is empty
+    """
     session = Session()
-    for sub in session.query(Submission).filter(
-        Submission.status.in_([STATUS_CWAIT, STATUS_WAIT, STATUS_CHECKING])):
-
-        compiler = session.query(Compiler).filter(Compiler.id == sub.compiler_id).first()
-        if compiler and compiler.is_available():
-            for log in session.query(SubmissionLog) \
-                .filter(SubmissionLog.submission_id == sub.id):
-                session.add(log)
-                session.delete(log)
+    sub_id = None
+    try:
+        sub = claim_submission(session)
+        if sub is None:
+            return False
+        sub_id = sub.id
+        reuse = rejudge.get_reusable(sub, session)
+        session.query(SubmissionLog) \
+            .filter(SubmissionLog.submission_id == sub.id) \
+            .delete(synchronize_session=False)
+        with scratch.job():
             if sub.compile()[0]:
-                sub.check(session)
-            session.commit()
-    Session.remove()
+                sub.check(session, reuse)
+        session.commit()
+        return True
+    except Exception:
+        traceback.print_exc()
+        session.rollback()
+        if sub_id is not None:
+            fail_submission(sub_id)
+        return True
+    finally:
+        Session.remove()
+
 
+def check_thread_main(worker_id=0):
+    """Start checking thread
 
-def check_thread_main():
-    """Start checking thread"""
-    print('Starting checking thread')
+    Arguments:
+    worker_id -- number of this worker in the pool
+    """
+    print('Starting checking thread #%d' % worker_id)
+    idle_time = CHECK_THREAD_IDLE_TIME if notify.is_enabled() else CHECK_THREAD_TIME
     while True:
-        check_thread_wake()
-        sleep(CHECK_THREAD_TIME)
+        notify.judge_event.clear()
+        if not check_thread_wake():
+            notify.wait(idle_time)
 
 
 class CheckThread(threading.Thread):
@@ -45,3 +171,19 @@ class CheckThread(threading.Thread):
     def __init__(self, *args):
         threading.Thread.__init__(self, target=check_thread_main, args=args)
         self.daemon = True
+
+
+def make_check_threads(workers=None):
+    """Create pool of checking threads
+
+    Arguments:
+    workers -- amount of threads. Default -- CHECK_THREAD_WORKERS
+
+    Returns:
+    List of CheckThread objects, not started
+    """
+    workers = max(1, workers or CHECK_THREAD_WORKERS)
+    if app.config.get('CHECK_THREAD_REQUEUE_STALE', True):
+        requeue_stale_submissions()
+    notify.listen()
+    return [CheckThread(worker_id) for worker_id in range(workers)]
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""Commands for rejudge jobs, see pysistem.judge.rejudge"""
+
+from flask_script import Manager
+
+from pysistem import manager
+
+RejudgeCommand = Manager(usage="Start, watch and cancel rejudge jobs")
+
+def print_progress(job):
+    """Print progress line of rejudge job"""
+    progress = job.get_progress()
+    eta = ', %d s left' % progress['eta'] if progress['eta'] is not None else ''
+    state = 'active' if progress['active'] else 'finished'
+    if progress['cancelled']:
+        state = 'cancelled, %d not rechecked' % progress['cancelled']
+    print('#%d [%s] %s: %d/%d done%s, share %d%%' % (progress['id'], state,
+                                                  progress['description'], progress['done'],
+                                                  progress['total'], eta, progress['share']))
+
+@RejudgeCommand.option('--problem', type=int, dest='problem_id', default=None,
+                       help="Recheck submissions to problem")
+@RejudgeCommand.option('--contest', type=int, dest='contest_id', default=None,
+                       help="Recheck submissions to problems of contest")
+@RejudgeCommand.option('--ids', dest='ids', default=None,
+                       help="Comma-separated IDs of submissions to recheck")
+@RejudgeCommand.option('--result', type=int, dest='result', default=None,
+                       help="Recheck only submissions with this verdict, e.g. 6 for WA")
+@RejudgeCommand.option('--share', type=int, dest='share', default=100,
+                       help="Percentage of judge capacity job may take, "
+                            "at least one worker")
+@RejudgeCommand.option('--delta', dest='delta', action='store_true', default=False,
+                       help="Run only tests added or changed since submissions were checked")
+
+def start(problem_id=None, contest_id=None, ids=None, result=None, share=100, delta=False):
+    """Start rejudge job"""
+    from pysistem.judge import rejudge
+    if ids is not None:
+        ids = [int(submission_id) for submission_id in ids.split(',')]
+    job = rejudge.start(None, share, delta, problem_id=problem_id, contest_id=contest_id,
+                        ids=ids, result=result)
+    print_progress(job)
+
+@RejudgeCommand.option('-a', '--all', dest='show_all', action='store_true', default=False,
+                       help="Show finished jobs too")
+
+def status(show_all=False):
+    """Show progress of rejudge jobs"""
+    from pysistem import db
+    from pysistem.submissions.model import RejudgeJob
+    jobs = RejudgeJob.query.order_by(RejudgeJob.id)
+    if not show_all:
+        jobs = jobs.filter(RejudgeJob.finished == None)
+    for job in jobs:
+        print_progress(job)
+    db.session.commit()
+
+@RejudgeCommand.option('job_id', type=int, help="ID of rejudge job")
+
+def cancel(job_id):
+    """Cancel rejudge job"""
+    from pysistem.judge import rejudge
+    from pysistem.submissions.model import RejudgeJob
+    job = RejudgeJob.query.get(job_id)
+    if job is None:
+        print('No rejudge job #%d' % job_id)
+        return
+    rejudge.cancel(job)
+    print_progress(job)
+
+manager.add_command('rejudge', RejudgeCommand)
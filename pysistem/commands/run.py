@@ -33,10 +33,71 @@ def wsgi(**kwargs):
     """Run the app within Werkzeug"""
     return app.run(**kwargs)
 
-@RunCommand.command
-def checker(**kwargs):
-    """Run checker thread"""
-    app.start_check_thread(join=True)
+@RunCommand.option('-w', '--workers', type=int, dest='workers', default=None,
+                   help="Amount of checking threads. Default is CHECK_THREAD_WORKERS")
+
+def checker(workers=None):
+    """Run checker threads"""
+    app.start_check_thread(join=True, workers=workers)
+
+@RunCommand.option('-u', '--url', dest='url', required=True,
+                   help="URL of PySistem web application")
+@RunCommand.option('-t', '--token', dest='token', default=None,
+                   help="Judge API token. Default is JUDGE_API_TOKEN")
+@RunCommand.option('-w', '--workers', type=int, dest='workers', default=None,
+                   help="Amount of checking threads. Default is CHECK_THREAD_WORKERS")
+
+def judge_node(url, token=None, workers=None):
+    """Run judge node checking submissions of remote PySistem"""
+    from pysistem.judge.node import JudgeClient, JudgeNode
+    app.make_dirs()
+    client = JudgeClient(url, token or app.config.get('JUDGE_API_TOKEN'))
+    JudgeNode(client).run(workers or app.config.get('CHECK_THREAD_WORKERS', 1))
+
+@RunCommand.option('--problems', type=int, dest='problems', default=2,
+                   help="Amount of synthetic problems")
+@RunCommand.option('--tests', type=int, dest='tests', default=10,
+                   help="Amount of tests in every problem")
+@RunCommand.option('--size', type=int, dest='size', default=1000,
+                   help="Amount of numbers in every test")
+@RunCommand.option('--time-limit', type=int, dest='time_limit', default=1000,
+                   help="Time limit, in milliseconds")
+@RunCommand.option('--amount', type=int, dest='amount', default=2,
+                   help="Submissions of every kind for every problem and compiler")
+@RunCommand.option('-w', '--workers', type=int, dest='workers', default=None,
+                   help="Amount of checking threads. Default is CHECK_THREAD_WORKERS")
+@RunCommand.option('-o', '--output', dest='output', default=None,
+                   help="File to write JSON report to. Default is stdout")
+
+def bench_judge(problems=2, tests=10, size=1000, time_limit=1000, amount=2, workers=None,
+                output=None):
+    """Benchmark judging on synthetic problems, see pysistem.judge.bench"""
+    import json
+    import shutil
+    import tempfile
+    from pysistem import db
+    from pysistem.compilers.model import detect_compilers
+    from pysistem.judge.bench import run_benchmark
+
+    # Never touch contest data: benchmark on its own database and storage
+    workdir = tempfile.mkdtemp(prefix='pysistem_bench_')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + workdir + '/bench.db'
+    app.config['STORAGE'] = workdir
+    try:
+        app.make_dirs()
+        db.create_all()
+        detect_compilers()
+        report = run_benchmark(problems, tests, size, time_limit, amount,
+                               workers or app.config.get('CHECK_THREAD_WORKERS', 1))
+    finally:
+        db.session.remove()
+        shutil.rmtree(workdir, ignore_errors=True)
+    report = json.dumps(report, indent=2, sort_keys=True)
+    if output:
+        with open(output, 'w') as output_file:
+            output_file.write(report + '\n')
+    else:
+        print(report)
 
 @RunCommand.command
 def tests(**kwargs):
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+"""Content-addressed compilation cache
+
+Compilation results are keyed by hash of source, compiler command and
+compiler name (autodetected compilers have their version in the name).
+Every entry is a pair of files in STORAGE/compile_cache:
+<key>.meta -- msgpack-encoded success flag and compiler log
+<key>.exe -- resulting executable, if compiler produced one
+
+Least recently used entries are evicted when cache grows
+above COMPILE_CACHE_SIZE bytes.
+"""
+
+import hashlib
+import os
+import shutil
+
+import msgpack
+
+from pysistem import app, storage
+
+def get_cache_dir():
+    """Get directory where cache entries are stored"""
+    return os.path.join(app.config['STORAGE'], 'compile_cache')
+
+def is_enabled():
+    """Check if compilation cache is enabled"""
+    return app.config.get('COMPILE_CACHE', True)
+
+def get_key(source, compiler):
+    """Get cache key of source compiled by compiler
+
+    Arguments:
+    source -- source code
+    compiler -- Compiler object
+    """
+    hasher = hashlib.sha256()
+    for part in (source, compiler.cmd_compile, compiler.name):
+        hasher.update((part or '').encode())
+        hasher.update(b'\0')
+    return hasher.hexdigest()
+
+def get(source, compiler, exe):
+    """Get cached compilation result
+
+    Arguments:
+    source -- source code
+    compiler -- Compiler object
+    exe -- path to copy cached executable to
+
+    Returns:
+    Tuple: (Successfully compiled, compiler log) or None if not cached
+    """
+    if not is_enabled():
+        return None
+    base = os.path.join(get_cache_dir(), get_key(source, compiler))
+    try:
+        with open(base + '.meta', 'rb') as meta_file:
+            meta = msgpack.unpackb(meta_file.read(), raw=False)
+        if meta['has_exe']:
+            shutil.copyfile(base + '.exe', exe)
+            shutil.copymode(base + '.exe', exe)
+        os.utime(base + '.meta')
+    except (OSError, ValueError, KeyError):
+        return None
+    return meta['success'], meta['log']
+
+def put(source, compiler, success, log, exe):
+    """Store compilation result in cache
+
+    Arguments:
+    source -- source code
+    compiler -- Compiler object
+    success -- if compilation succeeded
+    log -- compiler log
+    exe -- path to produced executable
+    """
+    if not is_enabled():
+        return
+    base = os.path.join(get_cache_dir(), get_key(source, compiler))
+    has_exe = success and os.path.isfile(exe)
+    try:
+        if has_exe:
+            storage.write_atomic(base + '.exe', lambda file: _copy_exe(exe, file))
+        meta = msgpack.packb({'success': success, 'log': log, 'has_exe': has_exe},
+                             use_bin_type=True)
+        storage.write_atomic(base + '.meta', lambda file: file.write(meta))
+    except OSError: # pragma: no cover
+        return
+    evict()
+
+def evict(max_size=None):
+    """Remove least recently used entries until cache fits into max_size bytes
+
+    Arguments:
+    max_size -- cache size budget. Default -- COMPILE_CACHE_SIZE
+    """
+    if max_size is None:
+        max_size = app.config.get('COMPILE_CACHE_SIZE', 512 * 1024 * 1024)
+    storage.evict(get_cache_dir(), max_size, lambda name: os.path.splitext(name)[0]
+                  if os.path.splitext(name)[1] in ('.meta', '.exe') else None)
+
+def _copy_exe(exe, file):
+    """Copy executable's contents to file object"""
+    with open(exe, 'rb') as exe_file:
+        shutil.copyfileobj(exe_file, file)
+    os.fchmod(file.fileno(), os.stat(exe).st_mode & 0o777)
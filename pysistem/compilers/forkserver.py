@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Fork-server of native sandbox, see pysistem.compilers.sandbox
+
+Standalone script: imports nothing from PySistem, so it starts fast and
+forking it is much cheaper than forking the judge. Reads requests from
+stdin, runs every one in a forked child and writes a response to stdout.
+Both are JSON objects, one per line.
+
+Request fields:
+cmd -- command line
+time_limit -- CPU time limit, in milliseconds
+memory_limit -- memory limit, in KiB
+stdin, stdout -- paths to program's input and output
+cwd -- working directory of program
+cgroup -- cgroup v2 directory to create run's cgroup in, or null
+
+Response fields:
+exitcode -- runsbox(1) exit code bitmask: 1 -- TL, 2 -- RE, 4 -- ML, 8 -- IE
+cpu_time, wall_time -- in milliseconds
+memory -- peak memory, in KiB
+
+Without cgroup, peak memory comes from rusage, whose ru_maxrss also counts
+memory of the forked server before exec (several MiB). It is used only if it
+is above what the child had just before exec by more than EXEC_MEMORY_SLACK
+(exec itself allocates some), else program's peak was lower, and
+VmHWM sampled every POLL_INTERVAL while it runs is used. So peaks of programs
+using less than the server and finishing within POLL_INTERVAL may be missed:
+use cgroup for precise memory limits below that.
+
+Usage: forkserver.py [CPU to run programs on]
+"""
+
+import json
+import os
+import resource
+import select
+import signal
+import sys
+import time
+
+EXIT_TL = 1
+EXIT_RE = 2
+EXIT_ML = 4
+EXIT_IE = 8
+
+# Processes and threads a program may have, with cgroup
+MAX_PIDS = 64
+# How often CPU time of running program is checked, in seconds
+POLL_INTERVAL = 0.01
+# Memory child may touch between reporting its peak and exec, in KiB
+EXEC_MEMORY_SLACK = 2048
+
+_runs = [0]
+
+def read_int(path, key=None):
+    """Read number from cgroup file, or value of key from 'key value' lines
+
+    Returns:
+    Number or None if file or key does not exist
+    """
+    try:
+        with open(path) as cgroup_file:
+            for line in cgroup_file:
+                parts = line.split()
+                if key is None:
+                    return int(parts[0]) if parts[0] != 'max' else None
+                if len(parts) == 2 and parts[0] == key:
+                    return int(parts[1])
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+    return None
+
+def write_value(path, value):
+    """Write value to cgroup file, False if file does not exist"""
+    try:
+        with open(path, 'w') as cgroup_file:
+            cgroup_file.write(str(value))
+        return True
+    except (IOError, OSError):
+        return False
+
+def make_cgroup(base, memory_limit):
+    """Create cgroup of one run with memory and process limits"""
+    _runs[0] += 1
+    path = os.path.join(base, 'run_%d_%d' % (os.getpid(), _runs[0]))
+    os.mkdir(path)
+    write_value(os.path.join(path, 'memory.max'), memory_limit * 1024)
+    write_value(os.path.join(path, 'memory.swap.max'), 0)
+    write_value(os.path.join(path, 'pids.max'), MAX_PIDS)
+    return path
+
+def remove_cgroup(path):
+    """Kill what is left in cgroup and remove it"""
+    write_value(os.path.join(path, 'cgroup.kill'), 1)
+    for _ in range(100):
+        try:
+            os.rmdir(path)
+            return
+        except OSError:
+            time.sleep(0.001)
+
+def get_cpu_time(pid, cgroup):
+    """Get CPU time used by running program so far, in milliseconds, or None"""
+    if cgroup:
+        usage_usec = read_int(os.path.join(cgroup, 'cpu.stat'), 'usage_usec')
+        if usage_usec is not None:
+            return usage_usec // 1000
+    try:
+        with open('/proc/%d/stat' % pid) as stat_file:
+            fields = stat_file.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) * 1000 // os.sysconf('SC_CLK_TCK')
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+def get_peak_memory(pid='self'):
+    """Get peak resident memory of process since exec, in KiB, or None"""
+    try:
+        with open('/proc/%s/status' % pid) as status_file:
+            for line in status_file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+    return None
+
+def kill(pid, cgroup):
+    """Kill program with all its processes"""
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        pass
+    if cgroup:
+        write_value(os.path.join(cgroup, 'cgroup.kill'), 1)
+
+def exec_child(request, cgroup, error_fd, peak_fd):
+    """Set up forked child and run program in it, never returns
+
+    Child's peak memory before exec is written to peak_fd, see module documentation
+    """
+    try:
+        os.setpgid(0, 0)
+        if cgroup:
+            write_value(os.path.join(cgroup, 'cgroup.procs'), os.getpid())
+        stdin_fd = os.open(request['stdin'], os.O_RDONLY)
+        stdout_fd = os.open(request['stdout'], os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        null_fd = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(stdin_fd, 0)
+        os.dup2(stdout_fd, 1)
+        os.dup2(null_fd, 2)
+        os.chdir(request['cwd'])
+        cpu_seconds = request['time_limit'] // 1000 + 1
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+        if not cgroup:
+            # Peak RSS above limit is ML, this only stops runaway allocation
+            data = request['memory_limit'] * 1024 * 2
+            resource.setrlimit(resource.RLIMIT_DATA, (data, data))
+        os.write(peak_fd, str(get_peak_memory() or 0).encode())
+        os.execvp(request['cmd'][0], request['cmd'])
+    except BaseException as exception:
+        try:
+            os.write(error_fd, repr(exception).encode())
+        except BaseException:
+            pass
+    os._exit(127)
+
+def wait_child(pid, cgroup, time_limit, timeout):
+    """Wait for child, killing it when it uses time_limit milliseconds of CPU time
+    or after timeout seconds
+
+    Returns:
+    Tuple: (wait status, rusage, killed on time limit,
+            peak memory sampled while it ran in KiB, without cgroup)
+    """
+    deadline = time.monotonic() + timeout
+    peak = 0
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        pidfd = None
+    try:
+        while True:
+            if not cgroup:
+                peak = max(peak, get_peak_memory(pid) or 0)
+            waited, status, rusage = os.wait4(pid, os.WNOHANG)
+            if waited:
+                return status, rusage, False, peak
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (get_cpu_time(pid, cgroup) or 0) > time_limit:
+                kill(pid, cgroup)
+                _, status, rusage = os.wait4(pid, 0)
+                return status, rusage, True, peak
+            if pidfd is not None:
+                select.select([pidfd], [], [], min(remaining, POLL_INTERVAL))
+            else:
+                time.sleep(min(remaining, 0.002))
+    finally:
+        if pidfd is not None:
+            os.close(pidfd)
+
+def run(request):
+    """Run program, see module documentation"""
+    time_limit, memory_limit = request['time_limit'], request['memory_limit']
+    cgroup = request.get('cgroup') and make_cgroup(request['cgroup'], memory_limit)
+    try:
+        error_read, error_write = os.pipe()
+        peak_read, peak_write = os.pipe()
+        start = time.monotonic()
+        pid = os.fork()
+        if pid == 0:
+            os.close(error_read)
+            os.close(peak_read)
+            exec_child(request, cgroup, error_write, peak_write)
+        os.close(error_write)
+        os.close(peak_write)
+        try:
+            # Blocks until exec, which closes error_write and peak_write
+            error = os.read(error_read, 4096)
+            os.close(error_read)
+            exec_peak = int(os.read(peak_read, 64) or 0)
+            os.close(peak_read)
+            # Sleeping program uses no CPU time, so wall time is limited too
+            status, rusage, timed_out, sampled_peak = wait_child(
+                pid, cgroup, time_limit, (time_limit * 2 + 1000) / 1000.0)
+        except BaseException:
+            # Server is stopped, see main
+            kill(pid, cgroup)
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+            raise
+        wall_time = int((time.monotonic() - start) * 1000)
+
+        cpu_time = int((rusage.ru_utime + rusage.ru_stime) * 1000)
+        # ru_maxrss counts child before exec too, see module documentation
+        if rusage.ru_maxrss > exec_peak + EXEC_MEMORY_SLACK:
+            memory = rusage.ru_maxrss
+        else:
+            memory = sampled_peak
+        oom = False
+        if cgroup:
+            usage_usec = read_int(os.path.join(cgroup, 'cpu.stat'), 'usage_usec')
+            if usage_usec is not None:
+                cpu_time = usage_usec // 1000
+            peak = read_int(os.path.join(cgroup, 'memory.peak'))
+            if peak is not None:
+                memory = peak // 1024
+            oom = bool(read_int(os.path.join(cgroup, 'memory.events'), 'oom_kill'))
+    finally:
+        if cgroup:
+            remove_cgroup(cgroup)
+
+    signaled = os.WIFSIGNALED(status)
+    if error:
+        exitcode = EXIT_IE
+    elif timed_out or cpu_time > time_limit or \
+         (signaled and os.WTERMSIG(status) == signal.SIGXCPU):
+        exitcode = EXIT_TL
+    elif oom or memory > memory_limit:
+        exitcode = EXIT_ML
+    elif signaled or os.WEXITSTATUS(status) != 0:
+        exitcode = EXIT_RE
+    else:
+        exitcode = 0
+    return {'exitcode': exitcode, 'cpu_time': cpu_time, 'wall_time': wall_time,
+            'memory': memory}
+
+def main():
+    """Serve requests until stdin is closed or SIGTERM is received.
+    SIGTERM kills program that is running
+    """
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+    if len(sys.argv) > 1:
+        try:
+            os.sched_setaffinity(0, [int(sys.argv[1])])
+        except (OSError, ValueError) as exception:
+            sys.stderr.write('Cannot run programs on CPU %s: %s\n' % (sys.argv[1], exception))
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            return
+        try:
+            response = run(json.loads(line))
+        except Exception as exception:
+            response = {'exitcode': EXIT_IE, 'error': repr(exception)}
+        sys.stdout.write(json.dumps(response) + '\n')
+        sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
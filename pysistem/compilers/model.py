@@ -1,17 +1,20 @@
 # -*- coding: utf-8 -*-
 import subprocess
 import tempfile
-import hashlib
 import os
 import shlex
+import time
 
 from pysistem import app, db
+from pysistem.compilers import scratch, sandbox, registry
 
 try:
     from pysistem.conf import COMPILE_TIME_LIMIT
 except ImportError:
     from pysistem.conf_default import COMPILE_TIME_LIMIT
 
+COMPILE_TIMEOUT_LOG = "[INVOKER] Compilation time limit (%d seconds) expired"
+
 class Compiler(db.Model):
     """A submission runner backend
 
@@ -61,14 +64,52 @@ class Compiler(db.Model):
         Tuple: (Successfully compiled, compiler log)
         """
         cmd = self.cmd_compile.replace('%exe%', exe).replace('%src%', src)
-        try:
-            result = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE,
-                                    stderr=subprocess.STDOUT, timeout=COMPILE_TIME_LIMIT)
-        except subprocess.TimeoutExpired:
-            return (False, "[INVOKER] Compilation time limit (%d seconds) expired" % COMPILE_TIME_LIMIT);
+        # Intermediate files of compiler, like ghcdumps, go to scratch directory
+        with scratch.job() as workdir:
+            try:
+                result = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT, timeout=COMPILE_TIME_LIMIT,
+                                        cwd=workdir)
+            except subprocess.TimeoutExpired:
+                return (False, COMPILE_TIMEOUT_LOG % COMPILE_TIME_LIMIT);
         return (result.returncode == 0, result.stdout or '')
 
-    def run(self, exe, src_path='', time_limit=1000, memory_limit=65536, stdin=''):
+    def compile_source(self, source, src, exe):
+        """Compile source code, reusing cached result of identical compilation
+
+        Arguments:
+        source -- source code
+        src -- path to write source file to
+        exe -- path to resulting executable
+
+        Returns:
+        Tuple: (Successfully compiled, compiler log)
+        """
+        from pysistem.compilers import cache as compile_cache
+        cached = compile_cache.get(source, self, exe)
+        if cached is not None:
+            return cached
+
+        with open(src, 'w') as source_file:
+            source_file.write(source)
+        success, log = self.compile(src, exe)
+        if log != COMPILE_TIMEOUT_LOG % COMPILE_TIME_LIMIT:
+            compile_cache.put(source, self, success, log, exe)
+        return success, log
+
+    def get_run_cmd(self, exe, src_path=''):
+        """Get command line that executes program, without sandbox
+
+        Arguments:
+        exe -- path to executable to run
+        src_path -- path to source file, required for intepretable languages
+
+        Returns:
+        List of command line arguments
+        """
+        return shlex.split(self.cmd_run.replace('%exe%', exe).replace('%src%', src_path))
+
+    def run(self, exe, src_path='', time_limit=1000, memory_limit=65536, stdin='', usage=None):
         """Run executable in sandbox
 
         Arguments:
@@ -77,43 +118,88 @@ class Compiler(db.Model):
         time_limit -- maximum execution time of program in milliseconds
         memory_limit -- maximum memory usage of program in KiB
         stdin -- stdin contents to pass to program
+        usage -- dict to fill with resource usage, see run_sandboxed
 
         Returns:
         Tuple: (Exit code: see runsbox(1), Program's stdout, Program's stderr: b'')
         """
-        hasher = hashlib.new('md5')
-        hasher.update(str.encode(exe))
-        dig = hasher.hexdigest()
-        input_path = tempfile.gettempdir() + '/pysistem_runner_input_%d%s' % (self.id, dig)
+        return run_sandboxed(self.get_run_cmd(exe, src_path), time_limit, memory_limit, stdin,
+                             usage=usage)
+
+    def is_available(self):
+        """Check if compiler is available on this machine, see pysistem.compilers.registry"""
+        return bool(registry.find(self.executable))
 
-        with open(input_path, 'w') as input_file:
+def run_sandboxed(cmd, time_limit=1000, memory_limit=65536, stdin='',
+                  stdin_path=None, stdout_path=None, usage=None, workdir=None, procs=None):
+    """Run command in sandbox, see pysistem.compilers.sandbox.
+    Safe to call from several threads at once
+
+    Arguments:
+    cmd -- command line, see Compiler.get_run_cmd
+    time_limit -- maximum execution time of program in milliseconds
+    memory_limit -- maximum memory usage of program in KiB
+    stdin -- stdin contents to pass to program
+    stdin_path -- path to file to use as stdin instead of 'stdin'
+    stdout_path -- path to file to keep program's stdout in. Caller reads and removes it
+    usage -- dict to fill with resource usage of sandbox and program:
+             cpu_time and wall_time in milliseconds, memory -- peak RSS in KiB
+    workdir -- working directory of program and directory of temporary files.
+               Default -- scratch directory, see pysistem.compilers.scratch
+    procs -- set to keep sandbox process in while it runs, to stop it with
+             pysistem.compilers.sandbox.kill_procs
+
+    Returns:
+    Tuple: (Exit code: see runsbox(1), Program's stdout or None if stdout_path is given,
+            Program's stderr: b'')
+    """
+    workdir = workdir or scratch.get_dir()
+    input_path = stdin_path
+    if input_path is None:
+        input_fd, input_path = tempfile.mkstemp(prefix='pysistem_runner_input_', dir=workdir)
+        with os.fdopen(input_fd, 'w') as input_file:
             input_file.write(stdin)
 
-        output_path = tempfile.gettempdir() + '/pysistem_runner_output_%d%s' % (self.id, dig)
+    output_path = stdout_path
+    if output_path is None:
+        output_fd, output_path = tempfile.mkstemp(prefix='pysistem_runner_output_', dir=workdir)
+        os.close(output_fd)
 
-        cmd = shlex.split(self.cmd_run.replace('%exe%', exe).replace('%src%', src_path))
+    if sandbox.get_backend() == 'native':
+        returncode = sandbox.run(cmd, time_limit, memory_limit, input_path, output_path,
+                                 workdir, usage, procs)
+    else:
         cmd = ['runsbox', str(time_limit), str(memory_limit), input_path, output_path] + cmd
-
-        if os.path.exists('/SANDBOX'): # pragma: no cover
-            proc = subprocess.Popen(cmd, cwd='/SANDBOX')
-        else:  # pragma: no cover
-            proc = subprocess.Popen(cmd)
-        proc.wait()
-        stdout = b''
+        start = time.monotonic()
+        proc = subprocess.Popen(cmd, cwd=workdir, start_new_session=True)
+        sandbox.add_proc(procs, proc)
+        # Not reaped before it is removed, so kill_procs never gets reused pid
+        os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+        sandbox.remove_proc(procs, proc)
+        # wait4 reports usage of runsbox together with the program it waited for
+        _, status, rusage = os.wait4(proc.pid, 0)
+        returncode = proc.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) \
+                                       else -os.WTERMSIG(status)
+        if usage is not None:
+            usage['wall_time'] = int((time.monotonic() - start) * 1000)
+            usage['cpu_time'] = int((rusage.ru_utime + rusage.ru_stime) * 1000)
+            usage['memory'] = rusage.ru_maxrss
+    stdout = None
+    if stdout_path is None:
         with open(output_path, "rb") as output_file:
             stdout = output_file.read()
 
+    if stdin_path is None:
         os.remove(input_path)
+    if stdout_path is None:
         os.remove(output_path)
-        return (proc.returncode, stdout, b'')
+    return (returncode, stdout, b'')
 
-    def is_available(self):
-        """Check if compiler is available on this machine"""
-        from distutils.spawn import find_executable
-        path = os.environ['PATH']
-        if app.config.get('PATH_EXTRA'): # pragma: no cover
-            path = path + os.pathsep + os.pathsep.join(app.config.get('PATH_EXTRA'))
-        return bool(find_executable(self.executable, path=path))
+# Python sources are compiled to bytecode once, so syntax errors are compilation
+# errors and tests do not parse source again. Run with '-c' to work on any version
+PYTHON_BUILD = ('__compiler__ -c "import py_compile, sys; '
+                'sys.excepthook = lambda *error: sys.stdout.write(str(error[1])); '
+                'py_compile.compile(sys.argv[1], sys.argv[2], None, True)" __src__ __exe__')
 
 detectable_compilers = {
     "gcc": {
@@ -145,49 +231,56 @@ detectable_compilers = {
         "executable": "python2.6",
         "lang": "py",
         "find_version": "%s 2>&1 --version | sed 's/^Python //'",
-        "run": "__compiler__ __src__"
+        "build": PYTHON_BUILD,
+        "run": "__compiler__ __exe__"
     },
     "python2.7": {
         "name": "Python %s",
         "executable": "python2.7",
         "lang": "py",
         "find_version": "%s 2>&1 --version | sed 's/^Python //'",
-        "run": "__compiler__ __src__"
+        "build": PYTHON_BUILD,
+        "run": "__compiler__ __exe__"
     },
     "python3.2": {
         "name": "Python %s",
         "executable": "python3.2",
         "lang": "py",
         "find_version": "%s 2>&1 --version | sed 's/^Python //'",
-        "run": "__compiler__ __src__"
+        "build": PYTHON_BUILD,
+        "run": "__compiler__ __exe__"
     },
     "python3.3": {
         "name": "Python %s",
         "executable": "python3.3",
         "lang": "py",
         "find_version": "%s 2>&1 --version | sed 's/^Python //'",
-        "run": "__compiler__ __src__"
+        "build": PYTHON_BUILD,
+        "run": "__compiler__ __exe__"
     },
     "python3.4": {
         "name": "Python %s",
         "executable": "python3.4",
         "lang": "py",
         "find_version": "%s 2>&1 --version | sed 's/^Python //'",
-        "run": "__compiler__ __src__"
+        "build": PYTHON_BUILD,
+        "run": "__compiler__ __exe__"
     },
     "python3.5": {
         "name": "Python %s",
         "executable": "python3.5",
         "lang": "py",
         "find_version": "%s 2>&1 --version | sed 's/^Python //'",
-        "run": "__compiler__ __src__"
+        "build": PYTHON_BUILD,
+        "run": "__compiler__ __exe__"
     },
     "python3.6": {
         "name": "Python %s",
         "executable": "python3.6",
         "lang": "py",
         "find_version": "%s 2>&1 --version | sed 's/^Python //'",
-        "run": "__compiler__ __src__"
+        "build": PYTHON_BUILD,
+        "run": "__compiler__ __exe__"
     },
     "ghc": {
         "name": "Glasgow Haskell Compiler %s",
@@ -198,38 +291,42 @@ detectable_compilers = {
     }
 }
 
+def find_compilers():
+    """Find compilers available on this machine, see pysistem.compilers.registry
+
+    Returns:
+    Dict: autodetect identifier -> Compiler object, not added to database
+    """
+    probed = registry.probe_all(dict(
+        (compilerid, (compiler['executable'], compiler.get('find_version')))
+        for compilerid, compiler in detectable_compilers.items()))
+    found = {}
+    for compilerid, (executable, ver) in probed.items():
+        compiler = detectable_compilers[compilerid]
+        run = compiler.get("run", "__exe__") \
+                .replace("__compiler__", executable) \
+                .replace("__src__", "%src%") \
+                .replace("__exe__", "%exe%")
+        build = compiler.get("build", "") \
+                .replace("__compiler__", executable) \
+                .replace("__src__", "%src%") \
+                .replace("__exe__", "%exe%")
+
+        comp = Compiler(compiler['name'] % ver, compiler.get('lang'), build, run)
+        comp.autodetect = compilerid
+        comp.executable = compiler['executable']
+        found[compilerid] = comp
+    return found
+
 def detect_compilers():
     """Detect and insert to database available compilers"""
-    from distutils.spawn import find_executable
-    path = os.environ['PATH']
-    if app.config.get('PATH_EXTRA'): # pragma: no cover
-        path = path + os.pathsep + os.pathsep.join(app.config.get('PATH_EXTRA'))
-    for compilerid in detectable_compilers:
-        compiler = detectable_compilers[compilerid]
-        executable = find_executable(compiler['executable'], path=path)
-        if executable:
-            run = compiler.get("run", "__exe__") \
-                    .replace("__compiler__", executable) \
-                    .replace("__src__", "%src%") \
-                    .replace("__exe__", "%exe%")
-            build = compiler.get("build", "") \
-                    .replace("__compiler__", executable) \
-                    .replace("__src__", "%src%") \
-                    .replace("__exe__", "%exe%")
-            if compiler.get('find_version'):
-                proc = subprocess.Popen(compiler['find_version'] % executable,
-                                     shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-                ver = proc.communicate()[0].decode().strip(' \t\n\r')
-            else:
-                ver = "" # pragma: no cover
-
-            name = compiler['name'] % ver
-            comp = Compiler.query.filter(Compiler.autodetect == compilerid).first() or Compiler()
-            comp.name = name
-            comp.lang = compiler.get('lang')
-            comp.cmd_compile = build
-            comp.cmd_run = run
-            comp.autodetect = compilerid
-            comp.executable = compiler['executable']
-            db.session.add(comp)
+    for compilerid, found in find_compilers().items():
+        comp = Compiler.query.filter(Compiler.autodetect == compilerid).first() or Compiler()
+        comp.name = found.name
+        comp.lang = found.lang
+        comp.cmd_compile = found.cmd_compile
+        comp.cmd_run = found.cmd_run
+        comp.autodetect = compilerid
+        comp.executable = found.executable
+        db.session.add(comp)
     db.session.commit()
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+"""Registry of compiler executables
+
+Finding an executable in PATH and asking it for its version are slow, so
+both are done once and remembered:
+- Path of every executable is cached in memory and looked up again in
+  background every COMPILER_REFRESH_TIME seconds, so installing or removing
+  a compiler is noticed without restart
+- Versions are cached by path and modification time of the executable in
+  STORAGE/compilers.json, shared by all processes and kept across restarts.
+  Updated compiler has new modification time and is asked again
+
+probe_all asks all compilers at once, in threads.
+"""
+
+import json
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from distutils.spawn import find_executable
+
+from pysistem import app, storage
+
+_lock = threading.Lock()
+# Executable name -> path or None
+_paths = {}
+_refresh_thread = [None]
+
+def get_search_path():
+    """Get PATH compilers are searched in, with PATH_EXTRA"""
+    path = os.environ['PATH']
+    if app.config.get('PATH_EXTRA'): # pragma: no cover
+        path = path + os.pathsep + os.pathsep.join(app.config.get('PATH_EXTRA'))
+    return path
+
+def get_versions_path():
+    """Get path to file with cached versions"""
+    return os.path.join(app.config['STORAGE'], 'compilers.json')
+
+def refresh():
+    """Look up all known executables again"""
+    with _lock:
+        names = list(_paths)
+    search_path = get_search_path()
+    found = dict((name, find_executable(name, path=search_path)) for name in names)
+    with _lock:
+        _paths.update(found)
+
+def refresh_thread_main():
+    """Refresh paths every COMPILER_REFRESH_TIME seconds"""
+    while True:
+        time.sleep(app.config.get('COMPILER_REFRESH_TIME', 60))
+        try:
+            refresh()
+        except Exception as exception: # pragma: no cover
+            print('Cannot refresh compilers:', exception)
+
+def start_refresh_thread():
+    """Start refreshing thread, if it is not running yet"""
+    with _lock:
+        if _refresh_thread[0] is not None:
+            return
+        _refresh_thread[0] = threading.Thread(target=refresh_thread_main, daemon=True)
+    _refresh_thread[0].start()
+
+def find(executable):
+    """Get path to executable, cached
+
+    Returns:
+    Absolute path or None if executable is not found
+    """
+    with _lock:
+        if executable in _paths:
+            return _paths[executable]
+    path = find_executable(executable, path=get_search_path())
+    if path:
+        path = os.path.abspath(path)
+    with _lock:
+        _paths[executable] = path
+    start_refresh_thread()
+    return path
+
+def load_versions():
+    """Load cached versions
+
+    Returns:
+    Dict: 'path:mtime' -> version
+    """
+    try:
+        with open(get_versions_path()) as versions_file:
+            return json.load(versions_file)
+    except (IOError, OSError, ValueError):
+        return {}
+
+def save_versions(versions):
+    """Replace cached versions with given dict, see load_versions"""
+    data = json.dumps(versions, indent=1, sort_keys=True).encode()
+    try:
+        storage.write_atomic(get_versions_path(), lambda versions_file: versions_file.write(data))
+    except (IOError, OSError) as exception: # pragma: no cover
+        print('Cannot save compiler versions:', exception)
+
+def get_version_key(path):
+    """Get key of executable's version in cache"""
+    return '%s:%d' % (path, os.stat(path).st_mtime_ns)
+
+def ask_version(path, find_version):
+    """Run command printing version of executable
+
+    Arguments:
+    path -- path to executable
+    find_version -- shell command pattern, '%s' is replaced by path
+
+    Returns:
+    Version string
+    """
+    proc = subprocess.Popen(find_version % path, shell=True,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    return proc.communicate()[0].decode().strip(' \t\n\r')
+
+def probe_all(executables):
+    """Find executables and get their versions, asking in parallel
+    only executables without cached version
+
+    Arguments:
+    executables -- dict: identifier -> (executable name, find_version pattern or None)
+
+    Returns:
+    Dict: identifier -> (path, version) for found executables
+    """
+    found = {}
+    for identifier, (executable, find_version) in executables.items():
+        path = find(executable)
+        if path:
+            found[identifier] = path
+    versions = load_versions()
+    keys = dict((identifier, get_version_key(path)) for identifier, path in found.items())
+    missing = [identifier for identifier in found
+               if executables[identifier][1] and keys[identifier] not in versions]
+    if missing:
+        with ThreadPoolExecutor(len(missing)) as executor:
+            asked = executor.map(lambda identifier: ask_version(found[identifier],
+                                                                executables[identifier][1]),
+                                 missing)
+            for identifier, version in zip(missing, asked):
+                versions[keys[identifier]] = version
+        # Forget versions of executables since replaced
+        current = set(keys.values())
+        for key in list(versions):
+            if key not in current and key.rsplit(':', 1)[0] in found.values():
+                del versions[key]
+        save_versions(versions)
+    return dict((identifier, (path, versions.get(keys[identifier], '')))
+                for identifier, path in found.items())
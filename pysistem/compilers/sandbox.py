@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+"""Sandbox backends
+
+SANDBOX_BACKEND selects how run_sandboxed runs programs:
+runsbox -- external runsbox(1) binary, one process started per run
+native -- fork-servers (see pysistem.compilers.forkserver) limiting
+          programs with setrlimit and, if SANDBOX_CGROUP is set, with
+          a cgroup v2 per run
+
+Native backend reports exact CPU time and peak memory: from the cgroup
+if there is one, else from wait4. Without cgroup, memory limit is
+checked against peak RSS after the run. Every fork-server runs one
+program at a time; with SANDBOX_CPUS set, servers are pinned to these
+CPUs in turn, so programs running at once do not share a CPU. Native
+backend does not filter system calls.
+
+Runs no longer needed, e.g. speculative runs of tests, are stopped with
+kill_procs: run_sandboxed adds sandbox processes to the set given to it
+while they run.
+"""
+
+import json
+import os
+import signal
+import sys
+import threading
+from subprocess import Popen, PIPE
+
+from pysistem import app
+
+BACKENDS = ('runsbox', 'native')
+SERVER_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'forkserver.py')
+
+def get_backend():
+    """Get name of sandbox backend"""
+    backend = app.config.get('SANDBOX_BACKEND', 'runsbox')
+    if backend not in BACKENDS: # pragma: no cover
+        raise ValueError('Unknown SANDBOX_BACKEND: %r' % backend)
+    return backend
+
+class ForkServer(object):
+    """Running fork-server
+
+    Fields:
+    cpu -- CPU programs are pinned to, or None
+    proc -- Popen object
+    killed -- if server was stopped by kill_procs, it must not be reused
+    """
+    def __init__(self, cpu=None):
+        self.cpu = cpu
+        self.killed = False
+        cmd = [sys.executable, SERVER_PATH] + ([str(cpu)] if cpu is not None else [])
+        self.proc = Popen(cmd, stdin=PIPE, stdout=PIPE)
+
+    def run(self, request):
+        """Run program, see pysistem.compilers.forkserver
+
+        Returns:
+        Response dict
+        """
+        self.proc.stdin.write((json.dumps(request) + '\n').encode())
+        self.proc.stdin.flush()
+        line = self.proc.stdout.readline()
+        if not line:
+            raise IOError('Sandbox fork-server exited')
+        return json.loads(line.decode())
+
+    def kill(self):
+        """Stop server together with the program it runs, see forkserver.main"""
+        try:
+            self.proc.terminate()
+        except OSError: # pragma: no cover
+            pass
+
+    def close(self):
+        """Stop server"""
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(1)
+        except Exception:
+            self.proc.kill()
+            self.proc.wait()
+
+_lock = threading.Lock()
+_idle = []
+_started = [0]
+_procs_lock = threading.Lock()
+
+def add_proc(procs, proc):
+    """Add started runsbox Popen object or ForkServer to set procs, if it is given"""
+    if procs is not None:
+        with _procs_lock:
+            procs.add(proc)
+
+def remove_proc(procs, proc):
+    """Remove finished process from set procs, before it is reused or reaped"""
+    if procs is not None:
+        with _procs_lock:
+            procs.discard(proc)
+
+def kill_procs(procs):
+    """Kill running sandbox processes in set procs and programs they run
+
+    Their run_sandboxed calls return or raise soon after,
+    callers have to drop results of these runs.
+    """
+    with _procs_lock:
+        for proc in procs:
+            if isinstance(proc, ForkServer):
+                proc.killed = True
+                proc.kill()
+                continue
+            # runsbox is started in its own session, so its program is killed too
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+def acquire():
+    """Take idle fork-server, or start new one"""
+    with _lock:
+        if _idle:
+            return _idle.pop()
+        cpus = app.config.get('SANDBOX_CPUS')
+        cpu = cpus[_started[0] % len(cpus)] if cpus else None
+        _started[0] += 1
+    return ForkServer(cpu)
+
+def release(server, reuse=True):
+    """Return fork-server to pool, or stop it if reuse is False"""
+    if not reuse:
+        server.close()
+        return
+    with _lock:
+        _idle.append(server)
+
+def run(cmd, time_limit, memory_limit, input_path, output_path, workdir, usage=None,
+        procs=None):
+    """Run command with native backend
+
+    Arguments:
+    see pysistem.compilers.model.run_sandboxed
+
+    Returns:
+    Exit code: see runsbox(1)
+    """
+    request = {'cmd': cmd, 'time_limit': time_limit, 'memory_limit': memory_limit,
+               'stdin': input_path, 'stdout': output_path, 'cwd': workdir,
+               'cgroup': app.config.get('SANDBOX_CGROUP')}
+    server = acquire()
+    add_proc(procs, server)
+    try:
+        response = server.run(request)
+    except:
+        remove_proc(procs, server)
+        release(server, False)
+        raise
+    remove_proc(procs, server)
+    # Server may be killed after it has answered
+    release(server, not server.killed)
+    if 'error' in response:
+        print('Sandbox error:', response['error'])
+    if usage is not None:
+        for field in ('cpu_time', 'wall_time', 'memory'):
+            usage[field] = response.get(field)
+    return response['exitcode']
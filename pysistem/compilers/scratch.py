@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""Scratch directories of judge workers
+
+Every judge job (checking a submission, compiling a checker) runs in its
+own directory inside SCRATCH_DIR, which is removed with everything in it
+when the job ends. Sources, compiler's intermediate files, program's input
+and output and the working directory of sandboxed programs all go there,
+so jobs running at once never share a file. Point SCRATCH_DIR at tmpfs,
+e.g. /dev/shm, to keep judging I/O in memory.
+
+Code running outside of a job uses SCRATCH_DIR itself and must pick
+unique file names, as tempfile does.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from pysistem import app
+
+try:
+    from pysistem.conf import DIR
+except ImportError: # pragma: no cover
+    from pysistem.conf_default import DIR
+
+# Headers checkers are compiled with, such as testlib.h
+INCLUDE_DIR = os.path.join(DIR, 'work', 'work')
+
+_local = threading.local()
+
+def get_base_dir():
+    """Get directory scratch directories are created in"""
+    base_dir = app.config.get('SCRATCH_DIR')
+    if base_dir:
+        os.makedirs(base_dir, exist_ok=True)
+        return base_dir
+    if os.path.exists('/SANDBOX'): # pragma: no cover
+        return '/SANDBOX'
+    return tempfile.gettempdir()
+
+def get_dir():
+    """Get scratch directory of job running in this thread, or base directory"""
+    return getattr(_local, 'path', None) or get_base_dir()
+
+def get_path(name):
+    """Get path to file in scratch directory, see get_dir"""
+    return os.path.join(get_dir(), name)
+
+@contextmanager
+def job():
+    """Context manager
+    Run job in new scratch directory, removed when job ends. Nested jobs
+    share directory of the outermost job
+
+    Yields:
+    Path to scratch directory
+    """
+    if getattr(_local, 'path', None):
+        yield _local.path
+        return
+    _local.path = tempfile.mkdtemp(prefix='pysistem_job_', dir=get_base_dir())
+    try:
+        yield _local.path
+    finally:
+        shutil.rmtree(_local.path, ignore_errors=True)
+        _local.path = None
+
+def link_includes():
+    """Make checker headers from INCLUDE_DIR available in scratch directory
+
+    Returns:
+    Path to scratch directory
+    """
+    directory = get_dir()
+    for name in os.listdir(INCLUDE_DIR):
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            try:
+                os.symlink(os.path.join(INCLUDE_DIR, name), path)
+            except FileExistsError: # pragma: no cover
+                pass
+    return directory
@@ -24,15 +24,98 @@ SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(DIR, 'pysistem.db')
 # Auto-created directories. Leave as is
 CREATE_DIRS = (
     'checkers_bin',
-    'submissions_bin'
+    'submissions_bin',
+    'compile_cache',
+    'run_cache',
+    'progress_cache',
+    'scoreboard_cache',
+    'scoreboard_locks',
+    'outputs'
 )
 
 # Extra paths to search compilers in
 PATH_EXTRA = []
 
+# How often to look for installed or removed compilers, in seconds.
+# See pysistem.compilers.registry
+COMPILER_REFRESH_TIME = 60
+
 # How often check submissions
 CHECK_THREAD_TIME = 1
 
+# Wake checker up as soon as a submission is queued, instead of polling
+# every CHECK_THREAD_TIME seconds. Idle checker still looks into database
+# every CHECK_THREAD_IDLE_TIME seconds
+JUDGE_NOTIFY = True
+CHECK_THREAD_IDLE_TIME = 60
+
+# Amount of submissions checked in parallel
+CHECK_THREAD_WORKERS = 1
+
+# Amount of submissions checked at once by all checkers and judge nodes.
+# Rejudge jobs take their share of it, see pysistem.judge.rejudge.
+# Default -- CHECK_THREAD_WORKERS
+JUDGE_CAPACITY = None
+
+# Order of checking submissions, see pysistem.judge.scheduler.
+# Add 'sjf' to check submissions to fast problems first
+JUDGE_SCHEDULER = ('contest', 'fresh', 'fair')
+
+# Amount of tests of one submission run in parallel
+JUDGE_TEST_WORKERS = 1
+
+# How often results of tests are written to database while checking, in
+# seconds. Results are also written after every test group
+JUDGE_FLUSH_INTERVAL = 5
+
+# Requeue submissions left compiling/checking by a stopped checker on start.
+# Disable if more than one checker process shares the database
+CHECK_THREAD_REQUEUE_STALE = True
+
+# Secret token of judge nodes, see 'manage.py run judge_node'.
+# Remote judging API is disabled if empty
+JUDGE_API_TOKEN = ''
+
+# Submission leased by judge node is returned to queue if node
+# does not report in this amount of seconds
+JUDGE_LEASE_TIMEOUT = 600
+
+# How often idle judge node asks for submissions, in seconds
+JUDGE_NODE_POLL_TIME = 5
+
+# How often judge node reports progress and renews its lease while
+# running tests, in seconds. Keep it well below JUDGE_LEASE_TIMEOUT
+JUDGE_NODE_PROGRESS_INTERVAL = 5
+
+# How to run programs, see pysistem.compilers.sandbox:
+# 'runsbox' -- external runsbox binary
+# 'native' -- fork-servers with setrlimit and cgroups v2
+SANDBOX_BACKEND = 'runsbox'
+# Native backend: cgroup v2 directory delegated to PySistem, in which a cgroup
+# is created for every run, e.g. '/sys/fs/cgroup/pysistem'. None -- rlimits only
+SANDBOX_CGROUP = None
+# Native backend: list of CPUs to pin programs to, e.g. [2, 3]. None -- any CPU
+SANDBOX_CPUS = None
+
+# Directory where judge workers create scratch directories for jobs.
+# Default -- /SANDBOX if it exists, else system temporary directory.
+# Use tmpfs, e.g. /dev/shm, to keep judging I/O in memory
+SCRATCH_DIR = None
+
+# Run C and C++ checkers as long-lived processes forking for every test
+# instead of starting them for every test, see pysistem.checkers.server.
+# Checker's main() must return or exit() with the verdict, as testlib does
+CHECKER_SERVER = False
+
+# How to store output of submissions on tests:
+# 'full' -- whole output in database
+# Opt-in, keep less output in database:
+# 'preview' -- first and last SUBMISSION_OUTPUT_PREVIEW bytes in database
+# 'hash' -- only hash and size of output
+# 'blob' -- preview in database and whole output compressed in STORAGE/outputs
+SUBMISSION_OUTPUT = 'full'
+SUBMISSION_OUTPUT_PREVIEW = 4096
+
 # Do check submissions?
 # Note: using this option may be unstable with Gunicorn
 LAUNCH_CHECK_THREAD = True
@@ -41,4 +124,26 @@ LAUNCH_CHECK_THREAD = True
 MAX_CONTENT_LENGTH = 16 * 1024 * 1024
 
 # Maximum compilation time, in seconds
-COMPILE_TIME_LIMIT = 15
\ No newline at end of file
+COMPILE_TIME_LIMIT = 15
+
+# Reuse binaries and logs of identical compilations
+COMPILE_CACHE = True
+
+# Maximum size of compilation cache, in bytes
+COMPILE_CACHE_SIZE = 512 * 1024 * 1024
+
+# Reuse results of identical runs: same binary on same test with same limits.
+# Rechecks of unchanged submissions then cost only checker runs.
+# See pysistem.checkers.runcache
+RUN_CACHE = False
+
+# Runs using more than this share of time or memory limit are not reused
+RUN_CACHE_MARGIN = 0.5
+
+# Maximum size of run result cache, in bytes
+RUN_CACHE_SIZE = 512 * 1024 * 1024
+
+# Scoreboards older than scoreboard_cache_timeout setting are still shown while
+# they are refreshed in background, until they are this old, in seconds.
+# See pysistem.contests.boardcache
+SCOREBOARD_CACHE_MAX_AGE = 3600
\ No newline at end of file
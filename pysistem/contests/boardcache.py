@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+"""Scoreboard cache shared by all worker processes
+
+Rendered scoreboards are stored in STORAGE/scoreboard_cache, so every
+worker of the WSGI server reuses a scoreboard rendered by any of them.
+Entry is fresh for scoreboard_cache_timeout seconds after rendering and
+is kept stale afterwards for up to SCOREBOARD_CACHE_MAX_AGE seconds:
+- Fresh entries are returned as is
+- Stale entries are returned as is too, while one request of all workers
+  starts refreshing it in background thread
+- Missing entries are rendered by one request, requests of the same
+  scoreboard coming meanwhile wait for it instead of rendering it again
+
+Renders are serialized by flock(2) on files in STORAGE/scoreboard_locks,
+locks of crashed workers are released by the OS.
+"""
+
+import fcntl
+import hashlib
+import os
+import threading
+import time
+
+from werkzeug.contrib.cache import FileSystemCache
+
+from pysistem import app
+
+_caches = {}
+
+def get_cache():
+    """Get FileSystemCache object for current STORAGE"""
+    cache_dir = os.path.join(app.config['STORAGE'], 'scoreboard_cache')
+    if cache_dir not in _caches:
+        _caches[cache_dir] = FileSystemCache(cache_dir,
+                                             default_timeout=app.config.get(
+                                                 'SCOREBOARD_CACHE_MAX_AGE', 3600))
+    return _caches[cache_dir]
+
+def lock(key, blocking=True):
+    """Lock cache entry for rendering
+
+    Arguments:
+    key -- cache key
+    blocking -- wait for lock if entry is locked by someone else
+
+    Returns:
+    Lock file object, close it to unlock. None if not blocking and entry is locked
+    """
+    lock_dir = os.path.join(app.config['STORAGE'], 'scoreboard_locks')
+    os.makedirs(lock_dir, exist_ok=True)
+    lock_file = open(os.path.join(lock_dir, hashlib.sha1(key.encode()).hexdigest()), 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+    except OSError:
+        lock_file.close()
+        if blocking: # pragma: no cover
+            raise
+        return None
+    return lock_file
+
+def put(key, value):
+    """Store rendered value as fresh"""
+    get_cache().set(key, (value, time.time()))
+
+def get(key, timeout, render, refresh):
+    """Get cached value, rendering or refreshing it if needed, see module's docstring
+
+    Arguments:
+    key -- cache key
+    timeout -- seconds entry is fresh for
+    render -- function to render missing value in current request
+    refresh -- function to render stale value in background thread,
+               has to set up application context itself
+
+    Returns:
+    Cached or rendered value
+    """
+    entry = get_cache().get(key)
+    if entry is not None:
+        value, rendered = entry
+        if time.time() - rendered >= timeout:
+            lock_file = lock(key, blocking=False)
+            if lock_file is not None:
+                thread = threading.Thread(target=_refresh, args=(key, refresh, lock_file),
+                                          name='scoreboard-refresh', daemon=True)
+                thread.start()
+        return value
+
+    started = time.time()
+    with lock(key):
+        # Someone could render it while we were waiting for the lock
+        entry = get_cache().get(key)
+        if entry is not None and entry[1] >= started:
+            return entry[0]
+        value = render()
+        put(key, value)
+    return value
+
+def get_version(key, version, render):
+    """Get cached value at least as new as given version, rendering it if needed
+
+    For values going out of date at known moments, e.g. on changes of contest's
+    standings: the key stays the same and value of older version is replaced.
+
+    Arguments:
+    key -- cache key
+    version -- minimum version of value
+    render -- function returning tuple: (value, its version), called in current request
+
+    Returns:
+    Tuple: (value, its version)
+    """
+    entry = get_cache().get(key)
+    if entry is not None and entry[0][1] >= version:
+        return entry[0]
+    with lock(key):
+        entry = get_cache().get(key)
+        if entry is not None and entry[0][1] >= version:
+            return entry[0]
+        value = render()
+        put(key, value)
+    return value
+
+def _refresh(key, refresh, lock_file):
+    """Render stale value and unlock it"""
+    try:
+        with lock_file:
+            put(key, refresh())
+    except Exception: # pragma: no cover
+        app.logger.exception('Failed to refresh %s', key)
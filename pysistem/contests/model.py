@@ -53,6 +53,8 @@ class Contest(db.Model):
     end -- contest end datetime
     freeze -- contest 'freeze scoreboard' datetime
     unfreeze_after_end -- if scoreboard should be automatically unfreezed after finish
+    standings_revision -- incremented on every change of standings
+    standings_reset -- revision changes before which can't be sent as scoreboard delta
 
     Relationships:
     problems -- problems in contest (ContestProblemAssociation)
@@ -66,6 +68,8 @@ class Contest(db.Model):
     end = db.Column(db.DateTime)
     freeze = db.Column(db.DateTime)
     unfreeze_after_end = db.Column(db.Boolean)
+    standings_revision = db.Column(db.Integer, default=0)
+    standings_reset = db.Column(db.Integer, default=0)
 
     problems = db.relationship('ContestProblemAssociation',
                                back_populates='contest', lazy="dynamic",
@@ -142,6 +146,15 @@ class Contest(db.Model):
                         penalty += max(0, (succ[1] - self.start).total_seconds() // 60)
             return solved, int(penalty)
 
+    def get_standings(self):
+        """Get standings for active user's view of scoreboard: frozen or not
+
+        Returns:
+        Query of ContestStanding objects
+        """
+        frozen = self.get_freeze_time() != self.end
+        return self.standings.filter(ContestStanding.frozen == frozen)
+
     def get_places(self):
         from pysistem.submissions.model import Submission
         from pysistem.problems.model import Problem
@@ -170,6 +183,54 @@ class Contest(db.Model):
             user_places[user[1]] = current_place
         return user_places
 
+class ContestStanding(db.Model):
+    """Aggregated results of user on problem in contest, see pysistem.contests.standings
+
+    Every user having submissions to problem has two rows: frozen one,
+    counting only submissions made before contest's freeze, and full one,
+    counting submissions made before contest's end.
+
+    Fields:
+    frozen -- if submissions after freeze are not counted
+    score -- best score
+    attempts -- failed attempts before first accepted submission
+    time -- minutes from contest's start to last counted submission, None if there is none
+    penalty -- ACM/ICPC penalty if problem is solved: 20 minutes per failed attempt plus time
+    revision -- contest's standings revision row was last changed in
+
+    Relationships:
+    contest, contest_id -- Contest
+    user, user_id -- User
+    problem, problem_id -- Problem
+    """
+    contest_id = db.Column(db.Integer, db.ForeignKey('contest.id'), primary_key=True)
+    frozen = db.Column(db.Boolean, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    problem_id = db.Column(db.Integer, db.ForeignKey('problem.id'), primary_key=True)
+    score = db.Column(db.Integer)
+    attempts = db.Column(db.Integer)
+    time = db.Column(db.Integer)
+    penalty = db.Column(db.Integer)
+    revision = db.Column(db.Integer, default=0)
+
+    contest = db.relationship('Contest', backref=db.backref('standings', lazy='dynamic',
+                                                            cascade='all,delete'))
+    user = db.relationship('User', backref=db.backref('standings', lazy='dynamic',
+                                                      cascade='all,delete'))
+    problem = db.relationship('Problem', backref=db.backref('standings', lazy='dynamic',
+                                                            cascade='all,delete'))
+
+    def __init__(self, contest_id=None, frozen=False, user_id=None, problem_id=None):
+        self.contest_id = contest_id
+        self.frozen = frozen
+        self.user_id = user_id
+        self.problem_id = problem_id
+
+    def __repr__(self):
+        return '<ContestStanding Contest=%r User=%r Problem=%r>' % (self.contest_id,
+                                                                    self.user_id,
+                                                                    self.problem_id)
+
 contest_rulesets = {
     "acm": "ACM/ICPC",
     "roi": "ROI"
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+"""Batch scoring of contests
+
+Computes results of all users at once from plain columns, with same
+semantics as Problem.user_score, Problem.get_user_failed_attempts and
+Contest.rate_user, which score one user on one problem from ORM objects:
+- aggregate folds submissions into (user, problem) cells
+- rate sums cells into users' scores by contest's rules
+- get_places assigns fair place ranges to sorted scores
+
+Group-bys are vectorized with NumPy if it is installed, else done in Python.
+"""
+
+from pysistem.submissions.const import STATUS_DONE, STATUS_ACT
+from pysistem.submissions.const import RESULT_IE, RESULT_UNKNOWN, RESULT_OK
+
+try:
+    import numpy
+except ImportError: # pragma: no cover
+    numpy = None
+
+def fold(submissions, cutoff):
+    """Aggregate submissions of user to problem
+
+    Arguments:
+    submissions -- list of tuples: (submitted, status, result, score), ordered by ID
+    cutoff -- datetime, submissions after which are not counted, None to count all
+
+    Returns:
+    Tuple: (best score, failed attempts before first accepted submission,
+            time of last counted submission or None)
+    """
+    score, attempts, submitted = 0, 0, None
+    accepted = False
+    for sub_submitted, status, result, sub_score in submissions:
+        if cutoff and sub_submitted > cutoff:
+            break
+        if status in [STATUS_DONE, STATUS_ACT] and result not in [RESULT_IE, RESULT_UNKNOWN]:
+            submitted = sub_submitted
+            score = max(score, sub_score or 0)
+            if result == RESULT_OK:
+                accepted = True
+            elif not accepted:
+                attempts += 1
+    return score, attempts, submitted
+
+def get_minutes(submitted, start):
+    """Get whole minutes from contest's start, 0 for submissions before start"""
+    return int(max(0, (submitted - start).total_seconds() // 60))
+
+def aggregate(columns, cutoff, start):
+    """Aggregate submissions into (user, problem) cells
+
+    Arguments:
+    columns -- tuple of equally long sequences, ordered by submission's ID:
+               (User's IDs, Problem's IDs, times submitted, statuses, results, scores)
+    cutoff -- datetime, submissions after which are not counted, None to count all
+    start -- contest's start, times are counted from
+
+    Returns:
+    Dict: (User's ID, Problem's ID) -> tuple: (best score, failed attempts before
+          first accepted submission, minutes to last counted submission or None)
+    """
+    if not len(columns[0]):
+        return {}
+    if numpy is None:
+        groups = {}
+        for user_id, problem_id, submitted, status, result, score in zip(*columns):
+            groups.setdefault((user_id, problem_id), []).append(
+                (submitted, status, result, score))
+        cells = {}
+        for key, submissions in groups.items():
+            score, attempts, submitted = fold(submissions, cutoff)
+            cells[key] = (score, attempts,
+                          None if submitted is None else get_minutes(submitted, start))
+        return cells
+
+    users, problems, submitted, statuses, results, scores = columns
+    count = len(users)
+    users = numpy.asarray(users, dtype=numpy.int64)
+    problems = numpy.asarray(problems, dtype=numpy.int64)
+    # Sort by cell keeping order of submissions inside of cell
+    order = numpy.lexsort((numpy.arange(count), problems, users))
+    users, problems = users[order], problems[order]
+    submitted = numpy.array(submitted, dtype='datetime64[us]')[order]
+    statuses = numpy.array([-1 if status is None else status for status in statuses],
+                           dtype=numpy.int64)[order]
+    results = numpy.array([-1 if result is None else result for result in results],
+                          dtype=numpy.int64)[order]
+    scores = numpy.array([score or 0 for score in scores], dtype=numpy.int64)[order]
+
+    is_start = numpy.ones(count, dtype=bool)
+    is_start[1:] = (users[1:] != users[:-1]) | (problems[1:] != problems[:-1])
+    starts = numpy.flatnonzero(is_start)
+    group = numpy.cumsum(is_start) - 1
+
+    def cell_cumsum(values):
+        """Cumulative sum restarting at every cell"""
+        total = numpy.cumsum(values)
+        return total - (total - values)[starts][group]
+
+    # Submissions from the first one made after cutoff on are not counted
+    if cutoff:
+        late = (submitted > numpy.datetime64(cutoff, 'us')).astype(numpy.int64)
+        counted = cell_cumsum(late) == 0
+    else:
+        counted = numpy.ones(count, dtype=bool)
+    counted &= numpy.isin(statuses, [STATUS_DONE, STATUS_ACT]) & \
+        ~numpy.isin(results, [RESULT_IE, RESULT_UNKNOWN])
+    accepted = counted & (results == RESULT_OK)
+    failed = counted & ~accepted & (cell_cumsum(accepted.astype(numpy.int64)) == 0)
+
+    best = numpy.maximum.reduceat(numpy.where(counted, scores, 0), starts)
+    attempts = numpy.add.reduceat(failed.astype(numpy.int64), starts)
+    last = numpy.maximum.reduceat(numpy.where(counted, numpy.arange(count), -1), starts)
+    minutes = numpy.maximum(0, (submitted - numpy.datetime64(start, 'us'))
+                            // numpy.timedelta64(60, 's'))
+
+    cells = {}
+    for index, first in enumerate(starts.tolist()):
+        cells[users[first].item(), problems[first].item()] = (
+            best[index].item(), attempts[index].item(),
+            None if last[index] < 0 else minutes[last[index]].item())
+    return cells
+
+def rate(cells, rules, max_scores):
+    """Get scores of users, see Contest.rate_user
+
+    Arguments:
+    cells -- list of tuples: (User's ID, Problem's ID, score, attempts, minutes or None),
+             see aggregate
+    rules -- contest's ruleset, 'acm' or 'roi'
+    max_scores -- dict: Problem's ID -> maximum score, required for 'acm' rules
+
+    Returns:
+    Dict: User's ID -> score: (sum of scores,) for 'roi', (solved, penalty) for 'acm'
+    """
+    if not cells:
+        return {}
+    if numpy is None:
+        users = {}
+        for user_id, problem_id, score, attempts, minutes in cells:
+            if rules == 'roi':
+                users[user_id] = (users.get(user_id, (0,))[0] + score,)
+                continue
+            solved, penalty = users.get(user_id, (0, 0))
+            if score and score >= max_scores[problem_id]:
+                solved += 1
+                penalty += attempts * 20 + minutes
+            users[user_id] = (solved, penalty)
+        return users
+
+    user_ids, index = numpy.unique(numpy.array([cell[0] for cell in cells], dtype=numpy.int64),
+                                   return_inverse=True)
+    scores = numpy.array([cell[2] for cell in cells], dtype=numpy.int64)
+    if rules == 'roi':
+        totals = numpy.bincount(index, weights=scores, minlength=len(user_ids))
+        return dict((user_id, (int(total),))
+                    for user_id, total in zip(user_ids.tolist(), totals.tolist()))
+    max_score = numpy.array([max_scores[cell[1]] for cell in cells], dtype=numpy.int64)
+    solved = (scores > 0) & (scores >= max_score)
+    penalties = numpy.array([cell[3] * 20 + (cell[4] or 0) for cell in cells],
+                            dtype=numpy.int64)
+    solved_count = numpy.bincount(index, weights=solved, minlength=len(user_ids))
+    penalty = numpy.bincount(index, weights=numpy.where(solved, penalties, 0),
+                             minlength=len(user_ids))
+    return dict((user_id, (int(count), int(total))) for user_id, count, total
+                in zip(user_ids.tolist(), solved_count.tolist(), penalty.tolist()))
+
+def get_places(scores):
+    """Get fair places of sorted scores: users with equal scores share place range
+
+    Arguments:
+    scores -- list of equally long tuples, best first
+
+    Returns:
+    List of tuples: (place, e.g. '3' or '3-5', first place of range)
+    """
+    count = len(scores)
+    if not count:
+        return []
+    if numpy is None:
+        starts = [index for index in range(count)
+                  if not index or scores[index] != scores[index - 1]]
+    else:
+        values = numpy.array(scores, dtype=numpy.int64).reshape(count, -1)
+        is_start = numpy.ones(count, dtype=bool)
+        is_start[1:] = (values[1:] != values[:-1]).any(axis=1)
+        starts = numpy.flatnonzero(is_start).tolist()
+    places = []
+    for first, end in zip(starts, starts[1:] + [count]):
+        place = str(first + 1) if end - first == 1 else '%d-%d' % (first + 1, end)
+        places.extend([(place, first + 1)] * (end - first))
+    return places
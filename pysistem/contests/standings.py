@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+"""Incrementally maintained contest standings
+
+Scoreboard is read from ContestStanding rows instead of going through all
+submissions of contest. Rows are kept up to date on every commit:
+- Flushed changes of submission's status, result or score mark its
+  (problem, user) as changed; rows of these pairs are recomputed
+  in every contest with the problem from their submissions
+- Changes of contest's start, end or freeze and adding or removing
+  problems rebuild all rows of contest
+
+Bulk updates bypass the session, so code doing them calls refresh itself,
+see pysistem.judge.rejudge. Contests never built, e.g. created before
+standings were introduced, are rebuilt when their scoreboard is shown.
+
+Every change increments contest's standings_revision and stamps changed rows
+with it, so scoreboard clients may fetch only rows changed since revision they
+have. Rows of users having no counted submissions anymore are zeroed instead of
+being deleted for that. Rebuilds and changes affecting all rows without changing
+them (contest's rules, problem's maximum score) reset revision: clients having
+older revision have to fetch the whole scoreboard.
+"""
+
+from itertools import chain, product
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from pysistem import db
+from pysistem.contests.model import Contest, ContestProblemAssociation, ContestStanding
+from pysistem.contests import scoring
+from pysistem.problems.model import Problem
+from pysistem.submissions.model import Submission
+from pysistem.users.model import User
+
+# Fields of Submission and Contest changes of which affect standings
+SUBMISSION_FIELDS = ('status', 'result', 'score', 'submitted', 'problem_id', 'user_id')
+CONTEST_FIELDS = ('start', 'end', 'freeze')
+# Fields of Contest and Problem changes of which reset standings' revision
+CONTEST_RESET_FIELDS = ('rules',)
+PROBLEM_RESET_FIELDS = ('max_score',)
+
+# Maximum amount of users to select submissions of by ID, more users are filtered in Python
+MAX_USER_FILTER = 500
+
+def refresh(pairs, session=None, contest_ids=None):
+    """Recompute standings of users on problems
+
+    Arguments:
+    pairs -- iterable of tuples: (Problem's ID, User's ID)
+    session -- SQLAlchemy session object to use. Default -- db.session
+    contest_ids -- recompute only standings in these contests. Default -- all contests
+    """
+    session = session or db.session
+    pairs = set(pair for pair in pairs if None not in pair)
+    if not pairs:
+        return
+    problem_ids = set(problem_id for problem_id, _ in pairs)
+    user_ids = set(user_id for _, user_id in pairs)
+
+    query = session.query(ContestProblemAssociation.problem_id, Contest) \
+        .join(Contest, Contest.id == ContestProblemAssociation.contest_id) \
+        .filter(ContestProblemAssociation.problem_id.in_(problem_ids))
+    if contest_ids is not None:
+        query = query.filter(Contest.id.in_(contest_ids))
+    contests = {}
+    for problem_id, contest in query:
+        contests.setdefault(problem_id, []).append(contest)
+    if not contests:
+        return
+
+    # Lock rows first, so concurrent refreshes see each other's submissions
+    conditions = [ContestStanding.contest_id.in_(set(contest.id for contest in
+                                                     chain(*contests.values()))),
+                  ContestStanding.problem_id.in_(problem_ids)]
+    if len(user_ids) <= MAX_USER_FILTER:
+        conditions.append(ContestStanding.user_id.in_(user_ids))
+    rows = dict(((row.contest_id, row.frozen, row.user_id, row.problem_id), row)
+                for row in session.query(ContestStanding).filter(db.and_(*conditions)) \
+                    .with_for_update())
+
+    conditions = [Submission.problem_id.in_(problem_ids)]
+    if len(user_ids) <= MAX_USER_FILTER:
+        conditions.append(Submission.user_id.in_(user_ids))
+    columns = ([], [], [], [], [], [])
+    for submission in session.query(
+            Submission.user_id, Submission.problem_id, Submission.submitted,
+            Submission.status, Submission.result, Submission.score) \
+            .filter(db.and_(*conditions)).order_by(Submission.id):
+        if (submission[1], submission[0]) in pairs:
+            for column, value in zip(columns, submission):
+                column.append(value)
+
+    for contest in set(chain(*contests.values())):
+        revision = None
+        for frozen in (True, False):
+            cells = scoring.aggregate(columns, contest.freeze if frozen else contest.end,
+                                      contest.start)
+            for problem_id, user_id in pairs:
+                if contest not in contests.get(problem_id, []):
+                    continue
+                row = rows.get((contest.id, frozen, user_id, problem_id))
+                cell = cells.get((user_id, problem_id))
+                if cell is None:
+                    if row is None:
+                        continue
+                    cell = (0, 0, None)
+                if row is None:
+                    row = ContestStanding(contest.id, frozen, user_id, problem_id)
+                    session.add(row)
+                elif (row.score, row.attempts, row.time) == cell:
+                    continue
+                if revision is None:
+                    revision = bump_revision(contest, session)
+                row.score, row.attempts, row.time = cell
+                row.penalty = row.attempts * 20 + (row.time or 0)
+                row.revision = revision
+
+def rebuild(contest, session=None):
+    """Recompute all standings of contest
+
+    Arguments:
+    contest -- Contest object
+    session -- SQLAlchemy session object to use. Default -- db.session
+    """
+    session = session or db.session
+    session.query(ContestStanding).filter(ContestStanding.contest_id == contest.id).delete()
+    problem_ids = session.query(ContestProblemAssociation.problem_id) \
+        .filter(ContestProblemAssociation.contest_id == contest.id)
+    pairs = session.query(Submission.problem_id, Submission.user_id) \
+        .filter(Submission.problem_id.in_(problem_ids)).distinct().all()
+    refresh(pairs, session, [contest.id])
+    bump_revision(contest, session, reset=True)
+
+def bump_revision(contest, session=None, reset=False):
+    """Increment contest's standings revision
+
+    Arguments:
+    contest -- Contest object
+    session -- SQLAlchemy session object to use. Default -- db.session
+    reset -- if clients have to fetch whole scoreboard, see module's docstring
+
+    Returns:
+    New revision
+    """
+    session = session or db.session
+    # Incremented in database, so concurrent transactions get different revisions
+    values = {Contest.standings_revision: db.func.coalesce(Contest.standings_revision, 0) + 1}
+    if reset:
+        values[Contest.standings_reset] = values[Contest.standings_revision]
+    session.query(Contest).filter(Contest.id == contest.id) \
+        .update(values, synchronize_session=False)
+    session.expire(contest, ['standings_revision', 'standings_reset'])
+    return contest.standings_revision
+
+def get_scoreboard(contest):
+    """Get scoreboard of contest for active user, see Contest.get_standings
+
+    Returns:
+    Tuple: (problems having submissions: ContestProblemAssociation objects ordered by prefix,
+            users having counted submissions: list of dicts with fields id, username,
+            score -- as Contest.rate_user returns it,
+            revision -- standings revision user's rows were last changed in,
+            is_solved -- dict: Problem's ID -> dict with fields succeed, failed,
+                         time -- minutes or None)
+    """
+    problems = {}
+    for problem in contest.problems:
+        problems[problem.problem_id] = problem
+    rows = [(row, username) for row, username in contest.get_standings() \
+            .join(User, User.id == ContestStanding.user_id) \
+            .with_entities(ContestStanding, User.username) if row.problem_id in problems]
+    problems = sorted((problems[problem_id] for problem_id in
+                       set(row.problem_id for row, _ in rows)),
+                      key=lambda problem: problem.prefix)
+    max_scores = dict((problem.problem_id, problem.get_max_score()) for problem in problems)
+    scores = scoring.rate([(row.user_id, row.problem_id, row.score, row.attempts, row.time)
+                           for row, _ in rows], contest.rules, max_scores)
+
+    users = {}
+    for row, username in rows:
+        user = users.setdefault(row.user_id, {
+            'id': row.user_id,
+            'username': username,
+            'score': scores[row.user_id],
+            'revision': 0,
+            'is_solved': dict((problem.problem_id, {
+                'succeed': 0, 'time': None, 'failed': 0
+            }) for problem in problems),
+            'active': False
+        })
+        succeed = row.score
+        if contest.rules == 'acm':
+            succeed = bool(row.score) and max_scores[row.problem_id] <= row.score
+        user['is_solved'][row.problem_id] = {
+            'succeed': succeed,
+            'time': row.time,
+            'failed': row.attempts
+        }
+        user['active'] = user['active'] or row.time is not None
+        user['revision'] = max(user['revision'], row.revision or 0)
+    return problems, [user for user in users.values() if user.pop('active')]
+
+def collect_changes(session, flush_context):
+    """Remember standings affected by flushed changes, see update_standings"""
+    pairs = session.info.setdefault('standings_pairs', set())
+    contest_ids = session.info.setdefault('standings_contests', set())
+    reset_ids = session.info.setdefault('standings_reset', set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Submission):
+            if obj in session.dirty and not has_changes(obj, SUBMISSION_FIELDS):
+                continue
+            pairs.update(product(get_values(obj, 'problem_id'), get_values(obj, 'user_id')))
+        elif isinstance(obj, ContestProblemAssociation):
+            contest_ids.add(obj.contest_id)
+        elif isinstance(obj, Contest) and obj in session.dirty:
+            if has_changes(obj, CONTEST_FIELDS):
+                contest_ids.add(obj.id)
+            elif has_changes(obj, CONTEST_RESET_FIELDS):
+                reset_ids.add(obj.id)
+        elif isinstance(obj, Problem) and obj in session.dirty:
+            if has_changes(obj, PROBLEM_RESET_FIELDS):
+                reset_ids.update(contest_id for contest_id, in session.query(
+                    ContestProblemAssociation.contest_id) \
+                    .filter(ContestProblemAssociation.problem_id == obj.id))
+
+def update_standings(session):
+    """Recompute standings affected by changes being committed"""
+    session.flush()
+    pairs = session.info.pop('standings_pairs', set())
+    contest_ids = session.info.pop('standings_contests', set())
+    reset_ids = session.info.pop('standings_reset', set()) - contest_ids
+    for contest_id in contest_ids:
+        contest = session.query(Contest).get(contest_id)
+        if contest is not None:
+            rebuild(contest, session)
+    for contest_id in reset_ids:
+        contest = session.query(Contest).get(contest_id)
+        if contest is not None:
+            bump_revision(contest, session, reset=True)
+    refresh(pairs, session)
+    forget_changes(session)
+
+def forget_changes(session):
+    """Forget changes rolled back"""
+    session.info.pop('standings_pairs', None)
+    session.info.pop('standings_contests', None)
+    session.info.pop('standings_reset', None)
+
+def has_changes(obj, fields):
+    """Check if any of object's fields was changed"""
+    attrs = inspect(obj).attrs
+    return any(attrs[field].history.has_changes() for field in fields)
+
+def get_values(obj, field):
+    """Get current and previous values of object's field"""
+    history = inspect(obj).attrs[field].history
+    return (history.added or [getattr(obj, field)]) + list(history.deleted)
+
+event.listen(Session, 'after_flush', collect_changes)
+event.listen(Session, 'before_commit', update_standings)
+event.listen(Session, 'after_rollback', forget_changes)
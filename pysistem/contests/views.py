@@ -3,13 +3,15 @@
 """Contest views"""
 
 from datetime import datetime
+from functools import partial
 
 from flask import render_template, g, flash, redirect, url_for, request, Blueprint
+from flask import Response, jsonify
 from flask_babel import gettext
 
-from pysistem import db, redirect_url, cache
+from pysistem import app, db, redirect_url
 from pysistem.contests.model import Contest, ContestProblemAssociation, contest_rulesets
-from pysistem.submissions.model import Submission
+from pysistem.contests import standings, scoring, boardcache
 from pysistem.users.model import User
 from pysistem.problems.model import Problem
 from pysistem.users.decorators import requires_admin
@@ -293,94 +295,53 @@ def format_time(mins):
            ("0" * (mins < 10) + str(mins))
 
 
-def render_scoreboard(contest, cache_name):
-    """Do actual scoreboard rendering"""
-    if contest.problems.count() == 0:
-        submissions = []
-        problems = []
-        qusers = []
-    else:
-        contest_problems = {}
-        for problem in contest.problems:
-            contest_problems[problem.id] = problem
-        problem_ids = [x.id for x in contest.problems]
-        submissions = Submission.query.filter(Submission.problem_id.in_(problem_ids))
-        problems = [contest_problems[x.problem.id] for x in
-                    submissions.distinct(Submission.problem_id)
-                               .group_by(Submission.problem_id)]
-        problems.sort(key=lambda x: x.prefix)
-        qusers = [x.user for x in submissions.distinct(Submission.user_id)
-                                             .group_by(Submission.user_id)]
-    subs = {}
-    for user in qusers:
-        subs[user.id] = {}
-        for problem in problems:
-            subs[user.id][problem.id] = []
-
-    for sub in submissions:
-        subs[sub.user_id][sub.problem_id].append(sub)
-
-    users = []
-
-    for user in qusers:
-        score = contest.rate_user(user, subs=subs[user.id])
-        solved_map = {}
-        add_user = False
-        for problem in problems:
-            succeed, submitted = problem.user_score(user, freeze=contest.get_freeze_time(),
-                                                    subs=subs[user.id][problem.id])
-            if contest.rules == 'acm':
-                succeed = bool(succeed) and (problem.get_max_score() <= succeed)
-            time = None
-            if submitted is not None:
-                time = int(max(0, (submitted - contest.start).total_seconds() // 60))
-                add_user = True
-            solved_map[problem.id] = {
-                "succeed": succeed,
-                "time": format_time(time),
-                "failed": problem.get_user_failed_attempts(user, subs=subs[user.id][problem.id],
-                                                           freeze=contest.get_freeze_time())
-            }
-        if add_user:
-            users.append({
-                "id": user.id,
-                "score": score,
-                "username": user.username,
-                "is_solved": solved_map
-            })
+def build_standings(contest):
+    """Build standings of contest, if they were never built"""
+    if not contest.standings_revision:
+        standings.rebuild(contest)
+        db.session.commit()
+
+def get_ranked_scoreboard(contest):
+    """Get scoreboard sorted by score with places, see standings.get_scoreboard"""
+    build_standings(contest)
+    problems, users = standings.get_scoreboard(contest)
+    for user in users:
+        for cell in user['is_solved'].values():
+            cell['time'] = format_time(cell['time'])
     if contest.rules == 'acm':
         users.sort(key=lambda x: (-x['score'][0], x['score'][1]))
     else:
         users.sort(key=lambda x: (-x['score'][0]))
 
     # Calculating fair places
-    if users:
-        last_idx = 0
-        cur_place = 1
-        cur_score = users[0]['score']
-        users[0]['place'] = '1'
-        users[0]['int_place'] = 1
-
-        for i in range(1, len(users)):
-            if cur_score != users[i]['score']:
-                cur_score = users[i]['score']
-                cur_place = i + 1
-                for j in range(i - 1, last_idx - 1, -1):
-                    if i != users[j]['int_place']:
-                        users[j]['place'] += '-' + str(i)
-                last_idx = i
-            users[i]['place'] = str(cur_place)
-            users[i]['int_place'] = cur_place
-
-        user_len = len(users)
-        for j in range(user_len - 1, last_idx - 1, -1):
-            if users[j]['int_place'] != user_len:
-                users[j]['place'] += '-' + str(user_len)
-
-    rawscore = (render_template('contests/raw_scoreboard.html',
-                                contest=contest, problems=problems, users=users), g.now)
-    cache.set(cache_name, rawscore, timeout=g.SETTINGS.get('scoreboard_cache_timeout', 60))
-    return rawscore
+    places = scoring.get_places([user['score'] for user in users])
+    for user, (place, int_place) in zip(users, places):
+        user['place'] = place
+        user['int_place'] = int_place
+    return problems, users
+
+def render_scoreboard(contest):
+    """Do actual scoreboard rendering
+
+    Returns:
+    Tuple: (rendered scoreboard, time of rendering)
+    """
+    problems, users = get_ranked_scoreboard(contest)
+    return (render_template('contests/raw_scoreboard.html',
+                            contest=contest, problems=problems, users=users), g.now)
+
+def refresh_scoreboard(contest_id, user_id, locale):
+    """Render scoreboard outside of request, see pysistem.contests.boardcache
+
+    Arguments:
+    contest_id -- Contest's ID
+    user_id -- ID of User scoreboard is shown to, None for guests
+    locale -- locale to render scoreboard in, None for default
+    """
+    with app.test_request_context(headers={'Accept-Language': locale} if locale else None):
+        g.now = datetime.now()
+        g.user = User.query.get(user_id) if user_id else User()
+        return render_scoreboard(Contest.query.get(contest_id))
 
 @mod.route('/<int:contest_id>/scoreboard')
 @yield_contest()
@@ -393,10 +354,11 @@ def scoreboard(contest_id, contest):
     Permissions required:
     None
     """
-    cache_name = '/contests/scoreboard/%d/%r' % (contest.id, g.user.is_admin(contest=contest))
-    rawscore = cache.get(cache_name)
-    if rawscore is None:
-        rawscore = render_scoreboard(contest, cache_name)
+    cache_name = '/contests/scoreboard/%d/%r/%s' % (contest.id, g.user.is_admin(contest=contest),
+                                                    g.locale)
+    rawscore = boardcache.get(cache_name, g.SETTINGS.get('scoreboard_cache_timeout', 60),
+                              lambda: render_scoreboard(contest),
+                              partial(refresh_scoreboard, contest.id, g.user.id, g.locale))
 
     if request.args.get('printing'):
         return render_template('contests/printing_scoreboard.html',
@@ -404,6 +366,103 @@ def scoreboard(contest_id, contest):
     return render_template('contests/scoreboard.html',
                            scoreboard=rawscore[0], contest=contest, updated=rawscore[1])
 
+def get_scoreboard_data(contest):
+    """Get whole scoreboard as JSON-serializable dict, see scoreboard_json
+
+    Returns:
+    Tuple: (dict, standings revision it is at least as new as)
+    """
+    build_standings(contest)
+    # Read before rows, so rows changed meanwhile are sent again rather than lost
+    revision, reset = contest.standings_revision, contest.standings_reset or 0
+    problems, users = get_ranked_scoreboard(contest)
+    return {
+        'reset': reset,
+        'rules': contest.rules,
+        'problems': [{
+            'id': problem.problem_id,
+            'prefix': problem.prefix,
+            'name': problem.name
+        } for problem in problems],
+        'users': [{
+            'id': user['id'],
+            'username': user['username'],
+            'place': user['place'],
+            'score': user['score'],
+            'revision': user['revision'],
+            'cells': dict((str(problem_id), cell) for problem_id, cell in user['is_solved'].items())
+        } for user in users]
+    }, revision
+
+def get_delta_since(since, revision, reset):
+    """Get revision scoreboard delta is sent since, None if whole scoreboard is sent
+
+    Arguments:
+    since -- revision client has, None if it has none
+    revision -- current standings revision
+    reset -- revision changes before which can't be sent as delta, see Contest
+    """
+    if since is None or not reset <= since <= revision:
+        return None
+    return since
+
+@mod.route('/<int:contest_id>/scoreboard/json')
+@yield_contest()
+def scoreboard_json(contest_id, contest):
+    """Get scoreboard as JSON, for clients polling it
+
+    Responses are tagged with contest's standings revision, so clients sending
+    If-None-Match get 304 while standings stay the same. With 'since' argument
+    only users changed after that revision are sent, rows of users missing in
+    'places' should be removed. Whole scoreboard is sent if revision is too old,
+    see pysistem.contests.standings.
+
+    ROUTE arguments:
+    contest_id -- Contest's ID
+
+    GET arguments:
+    since -- standings revision client has
+
+    Permissions required:
+    None
+
+    Returns:
+    JSON with fields: revision, full -- if whole scoreboard is sent, rules, problems,
+    places -- list of [User's ID, place] of all users, best first,
+    users -- list of users' rows, fields as in raw_scoreboard.html
+    """
+    frozen = contest.get_freeze_time() != contest.end
+    since = request.args.get('since', type=int)
+
+    def get_etag(revision, reset):
+        """Get ETag of response at standings revision"""
+        return '%d-%d-%d-%s' % (contest.id, revision, frozen,
+                                get_delta_since(since, revision, reset))
+
+    build_standings(contest)
+    revision, data = contest.standings_revision, None
+    etag = get_etag(revision, contest.standings_reset or 0)
+    if not request.if_none_match.contains(etag):
+        cache_name = '/contests/scoreboard/json/%d/%r' % (contest.id, frozen)
+        data, revision = boardcache.get_version(cache_name, revision,
+                                                lambda: get_scoreboard_data(contest))
+        etag = get_etag(revision, data['reset'])
+    if data is None or request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        since = get_delta_since(since, revision, data['reset'])
+        response = jsonify(
+            revision=revision,
+            full=since is None,
+            rules=data['rules'],
+            problems=data['problems'],
+            places=[[user['id'], user['place']] for user in data['users']],
+            users=[user for user in data['users'] if since is None or user['revision'] > since]
+        )
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @mod.route('/list', endpoint="list")
 def listcontests():
     """List active contests
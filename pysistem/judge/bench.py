@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+
+"""Judge benchmark
+
+Creates synthetic problems: sum of 'size' numbers on every test, and
+a mix of accepted, wrong, too slow and not compiling submissions for
+every detected compiler with a known solution template. All submissions
+are queued at once, like at the start of a contest, and checked by
+worker threads through claim_submission, Submission.compile and
+Submission.check, as the check thread does.
+
+Report, see make_report:
+submissions_per_sec -- checked submissions per second of wall time
+per_test_overhead_ms -- time spent checking a test beyond the program's own
+                        wall time: sandbox, checker, output and database
+latency_ms -- percentiles of time from queueing submission to its verdict
+compile_ms -- percentiles of compilation time
+verdicts -- amount of submissions of every kind and of those judged as expected
+
+Start with 'manage.py run bench_judge'. Benchmark should be run on its
+own database and storage, see pysistem.commands.run.bench_judge.
+"""
+
+import random
+import threading
+import time
+
+from pysistem import db
+from pysistem.users.model import User
+from pysistem.compilers.model import Compiler
+from pysistem.compilers import scratch
+from pysistem.problems.model import Problem
+from pysistem.checkers.model import Checker
+from pysistem.submissions.model import Submission
+from pysistem.test_pairs.model import TestPair, TestGroup
+from pysistem.submissions.const import STATUS_COMPILEFAIL, STATUS_DONE
+from pysistem.submissions.const import RESULT_OK, RESULT_WA, RESULT_TL
+
+KINDS = ('AC', 'WA', 'TL', 'CE')
+
+SOURCES = {
+    'c': {
+        'AC': '#include <stdio.h>\nint main() { long long s = 0, x; '
+              'while (scanf("%lld", &x) == 1) s += x; printf("%lld\\n", s); return 0; }\n',
+        'WA': '#include <stdio.h>\nint main() { long long s = 1, x; '
+              'while (scanf("%lld", &x) == 1) s += x; printf("%lld\\n", s); return 0; }\n',
+        'TL': 'int main() { volatile int x = 0; for (;;) x++; return 0; }\n',
+    },
+    'cpp': {
+        'AC': '#include <iostream>\nint main() { long long s = 0, x; '
+              'while (std::cin >> x) s += x; std::cout << s << std::endl; }\n',
+        'WA': '#include <iostream>\nint main() { long long s = 1, x; '
+              'while (std::cin >> x) s += x; std::cout << s << std::endl; }\n',
+        'TL': 'int main() { volatile int x = 0; for (;;) x++; }\n',
+    },
+    'py': {
+        'AC': 'import sys\nprint(sum(map(int, sys.stdin.read().split())))\n',
+        'WA': 'import sys\nprint(sum(map(int, sys.stdin.read().split())) + 1)\n',
+        'TL': 'while True:\n    pass\n',
+    },
+    'pas': {
+        'AC': 'var s, x: int64;\nbegin\n  s := 0;\n  while not seekeof do\n'
+              '  begin\n    read(x);\n    s := s + x;\n  end;\n  writeln(s);\nend.\n',
+        'WA': 'var s, x: int64;\nbegin\n  s := 1;\n  while not seekeof do\n'
+              '  begin\n    read(x);\n    s := s + x;\n  end;\n  writeln(s);\nend.\n',
+        'TL': 'begin\n  while true do ;\nend.\n',
+    },
+    'hs': {
+        'AC': 'main = interact $ (++ "\\n") . show . sum . map read . words\n',
+        'WA': 'main = interact $ (++ "\\n") . show . (+ 1) . sum . map read . words\n',
+        'TL': 'main = print (length [1 ..])\n',
+    },
+}
+
+CHECKER_SOURCE = '''#include <stdio.h>
+int main(int argc, char** argv) {
+    FILE* output = fopen(argv[2], "r");
+    FILE* pattern = fopen(argv[3], "r");
+    long long found, expected;
+    if (fscanf(output, "%lld", &found) != 1) { printf("number expected"); return 2; }
+    if (fscanf(pattern, "%lld", &expected) != 1) return 3;
+    printf("expected %lld, found %lld", expected, found);
+    return found == expected ? 0 : 1;
+}
+'''
+
+def get_source(compiler, kind):
+    """Get source of submission of given kind
+
+    Returns:
+    Source or None, if language is not supported or compiler has no
+    compilation step to fail
+    """
+    if compiler.lang not in SOURCES:
+        return None
+    if kind == 'CE':
+        return '$' + SOURCES[compiler.lang]['AC'] if compiler.cmd_compile else None
+    return SOURCES[compiler.lang][kind]
+
+def is_expected(kind, status, result):
+    """Check if submission of given kind is judged as expected"""
+    if kind == 'CE':
+        return status == STATUS_COMPILEFAIL
+    return status == STATUS_DONE and result == {'AC': RESULT_OK, 'WA': RESULT_WA,
+                                                'TL': RESULT_TL}[kind]
+
+def percentiles(values, points=(50, 95, 99)):
+    """Get nearest-rank percentiles of values
+
+    Returns:
+    Dict: 'p50', 'p95', 'p99' and 'max' -> value, empty if there are no values
+    """
+    values = sorted(values)
+    if not values:
+        return {}
+    result = dict(('p%d' % point, values[max(0, -(-point * len(values) // 100) - 1)])
+                  for point in points)
+    result['max'] = values[-1]
+    return result
+
+def make_problems(problems=2, tests=10, size=1000, time_limit=1000, checker_compiler=None):
+    """Create synthetic problems
+
+    Arguments:
+    problems -- amount of problems
+    tests -- amount of tests in every problem
+    size -- amount of numbers in every test
+    time_limit -- time limit, in milliseconds
+    checker_compiler -- C or C++ Compiler to compile checker with.
+                        Default -- use built-in comparator
+
+    Returns:
+    List of Problem objects
+    """
+    generator = random.Random(42)
+    result = []
+    for index in range(problems):
+        problem = Problem('Benchmark %d' % (index + 1), 'Sum of numbers', 'Sum numbers',
+                          time_limit=time_limit, memory_limit=262144)
+        if checker_compiler is None:
+            problem.builtin_checker = 'token'
+        test_group = TestGroup(problem)
+        for _ in range(tests):
+            numbers = [generator.randint(-10 ** 9, 10 ** 9) for _ in range(size)]
+            test = TestPair(' '.join(map(str, numbers)) + '\n', '%d\n' % sum(numbers))
+            test.test_group = test_group
+            db.session.add(test)
+        db.session.add_all([problem, test_group])
+        db.session.commit()
+        if checker_compiler is not None:
+            checker = Checker('Benchmark', CHECKER_SOURCE, problem)
+            checker.compiler = checker_compiler
+            db.session.add(checker)
+            db.session.commit()
+            if not checker.compile()[0]:
+                raise RuntimeError('Benchmark checker failed to compile: %s'
+                                   % checker.compile_log)
+        result.append(problem)
+    return result
+
+def make_submissions(problems, compilers, user, amount=2):
+    """Queue submissions of every kind for every problem and compiler
+
+    Arguments:
+    problems -- list of Problem objects
+    compilers -- list of Compiler objects, unsupported languages are skipped
+    user -- User object, author of submissions
+    amount -- amount of submissions of every kind for every problem and compiler
+
+    Returns:
+    Dict: Submission's ID -> (kind, Compiler's name)
+    """
+    kinds = {}
+    submissions = []
+    for problem in problems:
+        for compiler in compilers:
+            for kind in KINDS:
+                source = get_source(compiler, kind)
+                if source is None:
+                    continue
+                for _ in range(amount):
+                    submission = Submission(source, user, compiler, problem)
+                    submissions.append((submission, kind, compiler.name))
+    random.Random(42).shuffle(submissions)
+    db.session.add_all([submission for submission, _, _ in submissions])
+    db.session.commit()
+    for submission, kind, compiler_name in submissions:
+        kinds[submission.id] = (kind, compiler_name)
+    return kinds
+
+def run_workers(workers, started):
+    """Check all queued submissions
+
+    Arguments:
+    workers -- amount of checking threads
+    started -- time.monotonic() when submissions were queued
+
+    Returns:
+    List of dicts: id, latency, compile_time, check_time, in seconds
+    """
+    from pysistem.checkthread import Session, claim_submission
+    timings = []
+    lock = threading.Lock()
+    def work():
+        """Claim and check submissions until the queue is empty"""
+        while True:
+            session = Session()
+            try:
+                submission = claim_submission(session)
+                if submission is None:
+                    return
+                with scratch.job():
+                    compile_start = time.monotonic()
+                    compiled = submission.compile()[0]
+                    check_start = time.monotonic()
+                    if compiled:
+                        submission.check(session)
+                session.commit()
+                finished = time.monotonic()
+                with lock:
+                    timings.append({'id': submission.id, 'latency': finished - started,
+                                    'compile_time': check_start - compile_start,
+                                    'check_time': finished - check_start if compiled else None})
+            finally:
+                Session.remove()
+
+    threads = [threading.Thread(target=work) for _ in range(max(1, workers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return timings
+
+def make_report(timings, elapsed, judged, kinds):
+    """Summarize benchmark
+
+    Arguments:
+    timings -- result of run_workers
+    elapsed -- wall time of checking all submissions, in seconds
+    judged -- dict: Submission's ID -> (status, result, amount of tests run,
+              sum of program's wall time on tests in milliseconds)
+    kinds -- result of make_submissions
+
+    Returns:
+    Report dict, see module documentation
+    """
+    check_time = sum(timing['check_time'] for timing in timings if timing['check_time'])
+    tests = sum(judged[timing['id']][2] for timing in timings)
+    program_time = sum(judged[timing['id']][3] for timing in timings) / 1000.0
+    verdicts = dict((kind, {'submitted': 0, 'expected': 0}) for kind in KINDS)
+    unexpected = []
+    for submission_id, (kind, compiler_name) in sorted(kinds.items()):
+        status, result = judged.get(submission_id, (None, None, 0, 0))[:2]
+        verdicts[kind]['submitted'] += 1
+        if is_expected(kind, status, result):
+            verdicts[kind]['expected'] += 1
+        else:
+            unexpected.append({'id': submission_id, 'kind': kind, 'compiler': compiler_name,
+                               'status': status, 'result': result})
+
+    def milliseconds(values):
+        """Percentiles of seconds in milliseconds"""
+        return dict((key, round(value * 1000, 1)) for key, value in percentiles(values).items())
+
+    return {
+        'submissions': len(timings),
+        'tests': tests,
+        'elapsed': round(elapsed, 3),
+        'submissions_per_sec': round(len(timings) / elapsed, 3) if elapsed else None,
+        'tests_per_sec': round(tests / elapsed, 3) if elapsed else None,
+        'per_test_overhead_ms': round((check_time - program_time) * 1000 / tests, 3) \
+                                if tests else None,
+        'latency_ms': milliseconds([timing['latency'] for timing in timings]),
+        'compile_ms': milliseconds([timing['compile_time'] for timing in timings]),
+        'verdicts': verdicts,
+        'unexpected': unexpected,
+    }
+
+def run_benchmark(problems=2, tests=10, size=1000, time_limit=1000, amount=2, workers=1,
+                  compilers=None):
+    """Run judge benchmark on configured database and storage
+
+    Arguments:
+    problems, tests, size, time_limit -- see make_problems
+    amount -- see make_submissions
+    workers -- amount of checking threads
+    compilers -- list of Compiler objects. Default -- all available compilers
+
+    Returns:
+    Report dict, see make_report
+    """
+    if compilers is None:
+        compilers = [compiler for compiler in Compiler.query if compiler.is_available()]
+    compilers = [compiler for compiler in compilers if compiler.lang in SOURCES]
+    checker_compiler = next((compiler for compiler in compilers
+                             if compiler.lang in ('c', 'cpp')), None)
+
+    user = User.query.filter(User.username == 'benchmark').first()
+    if user is None:
+        user = User(username='benchmark', password='benchmark', role='user',
+                    email='benchmark@localhost')
+        db.session.add(user)
+        db.session.commit()
+
+    problem_list = make_problems(problems, tests, size, time_limit, checker_compiler)
+    kinds = make_submissions(problem_list, compilers, user, amount)
+    started = time.monotonic()
+    timings = run_workers(workers, started)
+    elapsed = time.monotonic() - started
+
+    db.session.expire_all()
+    judged = {}
+    for submission in Submission.query.filter(Submission.id.in_(list(kinds))):
+        logs = submission.submission_logs.all()
+        judged[submission.id] = (submission.status, submission.result, len(logs),
+                                 sum(log.wall_time or 0 for log in logs))
+    report = make_report(timings, elapsed, judged, kinds)
+    report['config'] = {'problems': problems, 'tests': tests, 'size': size,
+                        'time_limit': time_limit, 'amount': amount, 'workers': workers,
+                        'compilers': sorted(compiler.name for compiler in compilers),
+                        'checker': checker_compiler.name if checker_compiler else 'token'}
+    return report
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+"""Judge API decorators"""
+
+import hmac
+from functools import wraps
+
+from flask import request, jsonify
+
+from pysistem import app
+
+def requires_judge_token(func):
+    """Decorator
+    Call view if request carries JUDGE_API_TOKEN in X-Judge-Token header,
+    else return 403 Forbidden error
+    """
+    @wraps(func)
+    def decorated_function(*args, **kwargs):
+        """Decorated of requires_judge_token"""
+        token = app.config.get('JUDGE_API_TOKEN')
+        if not token or not hmac.compare_digest(
+                request.headers.get('X-Judge-Token', '').encode(), token.encode()):
+            return jsonify(error='forbidden'), 403
+        return func(*args, **kwargs)
+    return decorated_function
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+"""Judge node
+
+Standalone checker which does not need access to the database. It leases
+submissions from PySistem web application over the judge API (see
+pysistem.judge.views), compiles and runs them locally and posts verdicts
+back. Test data is fetched by hash into the local test store and checkers
+are compiled once per checker source, so a node downloads every file
+only once. Output blobs are uploaded only if the server does not have them.
+
+Start one or more nodes with 'manage.py run judge_node'.
+"""
+
+import json
+import os
+import threading
+import time
+import traceback
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from pysistem import app
+from pysistem.compilers.model import find_compilers
+from pysistem.checkers.model import TestRunner, Verdict
+from pysistem.checkers import server, runcache
+from pysistem.compilers import scratch
+from pysistem.test_pairs import store
+from pysistem.test_pairs.model import get_version
+from pysistem.submissions import output
+
+class LeaseExpired(Exception):
+    """Submission was given to another node"""
+
+class JudgeClient(object):
+    """Client of judge API
+
+    Fields:
+    url -- URL of PySistem web application
+    token -- JUDGE_API_TOKEN of web application
+    timeout -- timeout of HTTP requests, in seconds
+    """
+    def __init__(self, url, token, timeout=60):
+        self.url = url.rstrip('/') + '/judge/api'
+        self.token = token
+        self.timeout = timeout
+
+    def request(self, path, data=None):
+        """Make API request
+
+        Arguments:
+        path -- API path, e.g. '/lease'
+        data -- object to POST as JSON, or bytes to POST as is. Default -- make GET request
+
+        Returns:
+        Tuple: (HTTP status, response body bytes)
+        """
+        body = None
+        headers = {'X-Judge-Token': self.token}
+        if isinstance(data, bytes):
+            body = data
+            headers['Content-Type'] = 'application/octet-stream'
+        elif data is not None:
+            body = json.dumps(data).encode()
+            headers['Content-Type'] = 'application/json'
+        try:
+            response = urlopen(Request(self.url + path, data=body, headers=headers),
+                               timeout=self.timeout)
+            with response:
+                return response.getcode(), response.read()
+        except HTTPError as error:
+            if error.code == 409:
+                raise LeaseExpired(path)
+            raise
+
+    def lease(self, compilers):
+        """Lease submission, see pysistem.judge.views.lease
+
+        Returns:
+        Job dict or None, if there is nothing to check
+        """
+        status, body = self.request('/lease', {'compilers': sorted(compilers)})
+        if status == 204 or not body:
+            return None
+        return json.loads(body.decode())
+
+    def get_checker_source(self, checker_id):
+        """Get checker's source code"""
+        return self.request('/checker/%d/source' % checker_id)[1].decode()
+
+    def get_test(self, digest):
+        """Get test data by hash"""
+        return self.request('/test/' + digest)[1]
+
+    def upload_outputs(self, hashes):
+        """Upload output blobs missing on server, see pysistem.submissions.output"""
+        status, body = self.request('/outputs/missing', {'hashes': sorted(hashes)})
+        for digest in json.loads(body.decode())['missing']:
+            self.request('/output/' + digest, output.get_blob(digest))
+
+    def progress(self, job, test_id):
+        """Report test being checked and renew lease"""
+        self.request('/submission/%d/progress' % job['id'],
+                     {'lease': job['lease'], 'current_test_id': test_id})
+
+    def post_result(self, job, report):
+        """Post verdict, see pysistem.judge.views.result"""
+        report['lease'] = job['lease']
+        self.request('/submission/%d/result' % job['id'], report)
+
+    def post_error(self, job, error):
+        """Report failure to check submission, it gets Internal Error"""
+        self.post_result(job, {'error': error})
+
+def decode_log(log):
+    """Convert compiler log to str"""
+    if isinstance(log, bytes):
+        return log.decode(errors='replace')
+    return log or ''
+
+class JudgeNode(object):
+    """Leases and checks submissions
+
+    Fields:
+    client -- JudgeClient
+    compilers -- dict: autodetect identifier -> Compiler, see find_compilers
+    poll_time -- how often idle worker asks for submissions, in seconds
+    """
+    def __init__(self, client, compilers=None, poll_time=None):
+        self.client = client
+        self.compilers = compilers if compilers is not None else find_compilers()
+        self.poll_time = poll_time or app.config.get('JUDGE_NODE_POLL_TIME', 5)
+        self.checker_lock = threading.Lock()
+        self.checker_sources = {}
+
+    def get_checker_exe(self, checker):
+        """Get compiled checker, fetching and compiling it on first use
+
+        Arguments:
+        checker -- checker dict of job
+
+        Returns:
+        Tuple: (path to checker, path to checker server or None)
+        """
+        exe = os.path.join(app.config['STORAGE'], 'checkers_bin', 'node_' + checker['hash'])
+        compiler = self.compilers[checker['compiler']]
+        with self.checker_lock:
+            source = self.checker_sources.get(exe)
+            if source is None and (not os.path.exists(exe) or server.is_enabled()):
+                source = self.checker_sources[exe] = \
+                    self.client.get_checker_source(checker['id'])
+            if not os.path.exists(exe):
+                tmp_exe = '%s.%d.tmp' % (exe, os.getpid())
+                with scratch.job():
+                    src = os.path.join(scratch.link_includes(), 'checker.' + compiler.lang)
+                    success, log = compiler.compile_source(source, src, tmp_exe)
+                if not success:
+                    raise RuntimeError('Checker #%d failed to compile: %s'
+                                       % (checker['id'], decode_log(log)))
+                os.replace(tmp_exe, exe)
+        return exe, server.get_server(compiler, source, exe)
+
+    def get_group_tests(self, job, group):
+        """Get function fetching tests of group into test store"""
+        def load():
+            """Fetch tests of group and report progress"""
+            if group['tests']:
+                self.client.progress(job, group['tests'][0][0])
+            client = self.client
+            return [(test_id,
+                     store.get_path(input_hash, lambda: client.get_test(input_hash)),
+                     store.get_path(pattern_hash, lambda: client.get_test(pattern_hash)))
+                    for test_id, input_hash, pattern_hash in group['tests']]
+        return load
+
+    def judge(self, job):
+        """Compile and check leased submission, then post its verdict"""
+        print("Judging submission #%d" % job['id'])
+        compiler = self.compilers[job['compiler']]
+        with scratch.job() as workdir:
+            src = os.path.join(workdir, 'source.' + compiler.lang)
+            exe = os.path.join(workdir, 'source')
+            success, log = compiler.compile_source(job['source'], src, exe)
+            report = {'compiled': success, 'compile_log': decode_log(log), 'logs': []}
+            if success:
+                with open(src, 'w') as source_file:
+                    source_file.write(job['source'])
+                checker_exe = checker_server = None
+                if job['checker']:
+                    checker_exe, checker_server = self.get_checker_exe(job['checker'])
+                runner = TestRunner(checker_exe, compiler.get_run_cmd(exe, src),
+                                    job['time_limit'], job['memory_limit'],
+                                    'node_%d' % job['id'], output_mode=job['output_mode'],
+                                    comparator=job['comparator'], checker_server=checker_server,
+                                    program_key=runcache.get_program_key(compiler, exe,
+                                                                         job['source']))
+                groups = [(group['score'], group['score_per_test'], group['check_all'],
+                           self.get_group_tests(job, group)) for group in job['groups']]
+                verdict = Verdict()
+                reuse = dict((log[0], log[1:]) for log in job.get('reuse') or [])
+                # Versions of tests as they were run, tests may change meanwhile
+                versions = dict((test_id, get_version(input_hash, pattern_hash))
+                                for group in job['groups']
+                                for test_id, input_hash, pattern_hash in group['tests'])
+                # Lease is renewed while tests run, not only when a group starts
+                interval = app.config.get('JUDGE_NODE_PROGRESS_INTERVAL', 5)
+                last_progress = time.time()
+                for test_id, result, cstdout, stdout in runner.run_groups(groups, verdict, reuse):
+                    stdout = dict(stdout, test_version=versions[test_id])
+                    report['logs'].append([test_id, result, cstdout, stdout])
+                    if time.time() - last_progress >= interval:
+                        self.client.progress(job, test_id)
+                        last_progress = time.time()
+                report['result'] = verdict.result
+                report['score'] = verdict.score
+                report['usage'] = verdict.usage
+                if job['output_mode'] == 'blob':
+                    self.client.upload_outputs(set(log[3]['stdout_hash']
+                                                   for log in report['logs']))
+            self.client.post_result(job, report)
+
+    def wake(self):
+        """Lease and check one submission
+
+        Returns:
+        True if a submission was checked, False if the queue is empty
+        """
+        job = None
+        try:
+            job = self.client.lease(self.compilers.keys())
+            if job is None:
+                return False
+            self.judge(job)
+        except LeaseExpired as exception:
+            print("Lease expired:", exception)
+        except Exception as exception:
+            traceback.print_exc()
+            if job is not None:
+                # Not left leased, or it would be retried after the lease
+                # expires and fail again
+                try:
+                    self.client.post_error(job, repr(exception))
+                except Exception:
+                    traceback.print_exc()
+            return False
+        return True
+
+    def main(self, worker_id=0):
+        """Check submissions forever"""
+        print('Starting judge node worker #%d' % worker_id)
+        while True:
+            if not self.wake():
+                time.sleep(self.poll_time)
+
+    def run(self, workers=1):
+        """Start workers and wait for them"""
+        print('Judge node compilers: %s' % ', '.join(sorted(self.compilers)))
+        threads = [threading.Thread(target=self.main, args=(worker_id,), daemon=True)
+                   for worker_id in range(max(1, workers))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
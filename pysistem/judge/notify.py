@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""Judge queue notifications
+
+Views call notify_judge() after queueing a submission. Checking threads of
+this process are woken through an Event, and checkers running in other
+processes on this machine through datagrams sent to their UNIX sockets in
+JUDGE_NOTIFY_DIR. An idle checker waits for a notification instead of
+polling the database.
+"""
+
+import atexit
+import os
+import socket
+import threading
+
+from pysistem import app
+
+judge_event = threading.Event()
+_listener = None
+
+def is_enabled():
+    """Check if judge notifications are enabled"""
+    return app.config.get('JUDGE_NOTIFY', True) and hasattr(socket, 'AF_UNIX')
+
+def get_notify_dir():
+    """Get directory with sockets of listening checkers"""
+    return app.config.get('JUDGE_NOTIFY_DIR') or \
+           os.path.join(app.config['STORAGE'], 'judge_notify')
+
+def notify_judge():
+    """Wake up checking threads of all checkers on this machine"""
+    judge_event.set()
+    if is_enabled():
+        broadcast()
+
+def broadcast():
+    """Send wake up datagram to every listening checker process"""
+    directory = get_notify_dir()
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+    try:
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                sock.sendto(b'!', path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Checker is gone, remove its socket
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            except OSError:
+                # Queue of listener is full: it is going to wake up anyway
+                pass
+    finally:
+        sock.close()
+
+def wait(timeout=None):
+    """Wait for notification
+
+    Arguments:
+    timeout -- maximum time to wait, in seconds. Default -- forever
+
+    Returns:
+    True if notified, False on timeout
+    """
+    return judge_event.wait(timeout)
+
+class NotifyListener(threading.Thread):
+    """Thread receiving wake up datagrams for this process"""
+    def __init__(self):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        directory = get_notify_dir()
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, 'judge_%d.sock' % os.getpid())
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        atexit.register(self.close)
+
+    def run(self):
+        while True:
+            try:
+                self.sock.recv(64)
+            except OSError:
+                return
+            judge_event.set()
+
+    def close(self):
+        """Stop receiving notifications"""
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+        self.sock.close()
+
+def listen():
+    """Start receiving notifications from other processes, if enabled"""
+    global _listener
+    if _listener is None and is_enabled():
+        _listener = NotifyListener()
+        _listener.start()
+    return _listener
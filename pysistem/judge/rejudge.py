@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+"""Rejudge jobs
+
+A rejudge job queues all submissions matching a filter (problem, contest,
+list of IDs, verdict) for recheck with one UPDATE and tracks how many of
+them are checked, see RejudgeJob.get_progress. Submissions being checked
+when job starts are left alone.
+
+Job's submissions may take only 'share' percent of judge capacity at once
+(JUDGE_CAPACITY, default -- CHECK_THREAD_WORKERS), so checking of new
+submissions goes on during large rejudge. Job always gets at least one
+worker, fraction of worker is rounded up only while no other submissions
+wait, see get_limit. New submissions are also checked first by 'fresh'
+scheduler policy, see pysistem.judge.scheduler.
+
+Delta job runs every submission only on tests added or changed since it
+was checked: results of other tests are taken from its SubmissionLog rows,
+whose test_version still matches TestPair.get_version, see get_reusable.
+Score and verdict are computed again over all tests, so changes of groups
+are taken into account too. Changes of checker or limits need full rejudge.
+
+Cancelled job returns its submissions not checked yet to status they had
+before job. Contest standings are recomputed when job starts and is
+cancelled. Start, watch and cancel jobs at /submission/rejudge or with
+'manage.py rejudge'.
+"""
+
+import math
+from datetime import datetime
+
+from pysistem import app, db
+from pysistem.contests import standings
+from pysistem.submissions.const import STATUS_CWAIT, STATUS_WAIT, STATUS_DONE
+from pysistem.submissions.const import STATUS_COMPILING, STATUS_CHECKING, STR_RESULT
+
+def get_capacity():
+    """Get amount of submissions judged at once"""
+    return app.config.get('JUDGE_CAPACITY') or app.config.get('CHECK_THREAD_WORKERS', 1)
+
+def get_limit(share, busy=True):
+    """Get amount of submissions job with given share may have checked at once
+
+    Share of capacity is usually fractional, e.g. 0.5 of single worker. It is
+    rounded down while other submissions wait, else up, so idle workers are
+    used. Job may always have one submission checked, or it would never finish.
+
+    Arguments:
+    share -- job's percentage of judge capacity
+    busy -- if submissions of other jobs or new ones are waiting
+    """
+    limit = get_capacity() * share / 100
+    if busy:
+        return max(1, int(limit))
+    return max(1, int(math.ceil(limit)))
+
+def make_filter(problem_id=None, contest_id=None, ids=None, result=None):
+    """Make filter of submissions to recheck
+
+    Arguments:
+    problem_id -- recheck submissions to problem
+    contest_id -- recheck submissions to problems of contest
+    ids -- recheck submissions with these IDs
+    result -- recheck only checked submissions with this verdict
+
+    Returns:
+    Tuple: (list of SQLAlchemy conditions, description)
+    """
+    from pysistem.submissions.model import Submission
+    from pysistem.contests.model import ContestProblemAssociation
+    conditions = [~Submission.status.in_([STATUS_COMPILING, STATUS_CHECKING])]
+    description = []
+    if problem_id is not None:
+        conditions.append(Submission.problem_id == problem_id)
+        description.append('problem #%d' % problem_id)
+    if contest_id is not None:
+        conditions.append(Submission.problem_id.in_(
+            db.session.query(ContestProblemAssociation.problem_id) \
+                .filter(ContestProblemAssociation.contest_id == contest_id)))
+        description.append('contest #%d' % contest_id)
+    if ids is not None:
+        conditions.append(Submission.id.in_(ids))
+        description.append('submissions ' + ', '.join(str(submission_id) for submission_id
+                                                      in sorted(ids)))
+    if result is not None:
+        conditions.append(db.and_(Submission.status == STATUS_DONE,
+                                  Submission.result == result))
+        description.append(STR_RESULT[result])
+    return conditions, '; '.join(description) or 'all submissions'
+
+def start(user=None, share=100, delta=False, **filters):
+    """Start rejudge job
+
+    Arguments:
+    user -- User starting job, None if started from console
+    share -- percentage of judge capacity job may take, 1 to 100
+    delta -- run only added or changed tests
+    filters -- see make_filter
+
+    Returns:
+    RejudgeJob object
+    """
+    from pysistem.submissions.model import Submission, RejudgeJob
+    from pysistem.judge.notify import notify_judge
+    if not 1 <= share <= 100:
+        raise ValueError('Share must be from 1 to 100 percent')
+    conditions, description = make_filter(**filters)
+    if delta:
+        description = 'changed tests of ' + description
+    job = RejudgeJob(description[:256], share, user, delta)
+    db.session.add(job)
+    db.session.flush()
+    job.total = Submission.query.filter(db.and_(*conditions)).update({
+        Submission.previous_status: Submission.status,
+        Submission.status: STATUS_CWAIT,
+        Submission.current_test_id: 0,
+        Submission.is_recheck: True,
+        Submission.rejudge_job_id: job.id
+    }, synchronize_session=False)
+    if not job.total:
+        job.finished = job.created
+    standings.refresh(get_pairs(job))
+    db.session.commit()
+    notify_judge()
+    return job
+
+def cancel(job):
+    """Cancel rejudge job, returning submissions not checked yet to previous status
+
+    Returns:
+    Amount of returned submissions
+    """
+    from pysistem.submissions.model import Submission
+    if not job.is_active():
+        return 0
+    pairs = get_pairs(job)
+    returned = Submission.query.filter(db.and_(
+        Submission.rejudge_job_id == job.id,
+        Submission.status.in_([STATUS_CWAIT, STATUS_WAIT])
+    )).update({
+        Submission.status: Submission.previous_status,
+        Submission.rejudge_job_id: None,
+        Submission.is_recheck: False
+    }, synchronize_session=False)
+    job.cancelled = returned
+    job.finished = datetime.now()
+    standings.refresh(pairs)
+    db.session.commit()
+    return returned
+
+def get_pairs(job):
+    """Get problems and users of job's submissions, whose standings change with them
+
+    Returns:
+    List of tuples: (Problem's ID, User's ID)
+    """
+    from pysistem.submissions.model import Submission
+    return db.session.query(Submission.problem_id, Submission.user_id) \
+        .filter(Submission.rejudge_job_id == job.id).distinct().all()
+
+def get_throttled(session):
+    """Get rejudge jobs having as many submissions being checked as their share allows
+
+    Arguments:
+    session -- SQLAlchemy session object to use
+
+    Returns:
+    Set of RejudgeJob's IDs
+    """
+    from pysistem.submissions.model import Submission, RejudgeJob
+    shares = dict(session.query(RejudgeJob.id, RejudgeJob.share) \
+        .filter(db.and_(RejudgeJob.finished == None, RejudgeJob.share < 100)))
+    if not shares:
+        return set()
+    running = dict(session.query(Submission.rejudge_job_id, db.func.count(Submission.id)) \
+        .filter(db.and_(Submission.rejudge_job_id.in_(list(shares)),
+                        Submission.status.in_([STATUS_COMPILING, STATUS_CHECKING]))) \
+        .group_by(Submission.rejudge_job_id).all())
+    waiting = dict(session.query(Submission.rejudge_job_id, db.func.count(Submission.id)) \
+        .filter(Submission.status.in_([STATUS_CWAIT, STATUS_WAIT])) \
+        .group_by(Submission.rejudge_job_id).all())
+    total_waiting = sum(waiting.values())
+    return set(job_id for job_id, share in shares.items()
+               if running.get(job_id, 0) >= get_limit(
+                   share, total_waiting > waiting.get(job_id, 0)))
+
+def get_reusable(submission, session):
+    """Get results of tests submission does not need to run again
+
+    Only submissions queued by delta job have them: results of tests
+    whose version did not change since submission was run on them.
+
+    Arguments:
+    submission -- Submission object, before its logs are deleted
+    session -- SQLAlchemy session object to use
+
+    Returns:
+    Dict: TestPair's ID -> (Result, Checker output, SubmissionLog fields), see TestRunner.run
+    """
+    from pysistem.submissions.model import SubmissionLog, RejudgeJob
+    from pysistem.submissions.const import USAGE_FIELDS
+    from pysistem.test_pairs.model import TestPair, get_version
+    if submission.rejudge_job_id is None or \
+       not session.query(RejudgeJob.delta).filter(RejudgeJob.id == submission.rejudge_job_id) \
+           .scalar():
+        return {}
+    reusable = {}
+    for log, input_hash, pattern_hash in session.query(
+            SubmissionLog, TestPair.input_hash, TestPair.pattern_hash) \
+            .join(TestPair, TestPair.id == SubmissionLog.test_pair_id) \
+            .filter(SubmissionLog.submission_id == submission.id):
+        if log.test_version and log.test_version == get_version(input_hash, pattern_hash):
+            fields = dict((field, getattr(log, field)) for field in
+                          ('stdout', 'stdout_hash', 'stdout_size') + USAGE_FIELDS)
+            reusable[log.test_pair_id] = (log.result, log.log, fields)
+    return reusable
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+"""Judge queue scheduling
+
+Waiting submissions are ranked by a chain of policies listed in
+JUDGE_SCHEDULER. Every policy maps queue entries to sort keys, smaller
+keys are judged first; ties are broken by the next policy and finally
+by submission ID (oldest first).
+
+Built-in policies:
+contest -- submissions to problems of running contests go first
+fresh -- new submissions go before rechecks made by administrators
+fair -- round-robin between users, counting submissions being judged
+sjf -- shortest expected job first: tests count * time limit
+"""
+
+from datetime import datetime
+
+from pysistem import app, db
+from pysistem.submissions.const import STATUS_CWAIT, STATUS_WAIT
+from pysistem.submissions.const import STATUS_COMPILING, STATUS_CHECKING
+
+DEFAULT_POLICIES = ('contest', 'fresh', 'fair')
+
+policies = {}
+
+def policy(name):
+    """Decorator
+    Register function(entries, session) returning dict: submission ID -> sort key
+    as scheduling policy 'name'
+    """
+    def decorator(func):
+        """Decorator of policy"""
+        policies[name] = func
+        return func
+    return decorator
+
+class QueueEntry(object):
+    """Waiting submission, as seen by scheduler
+
+    Fields:
+    id, status, compiler_id, user_id, problem_id, is_recheck, rejudge_job_id --
+        same as in Submission
+    """
+    def __init__(self, id, status, compiler_id, user_id, problem_id, is_recheck,
+                 rejudge_job_id=None):
+        self.id = id
+        self.status = status
+        self.compiler_id = compiler_id
+        self.user_id = user_id
+        self.problem_id = problem_id
+        self.is_recheck = bool(is_recheck)
+        self.rejudge_job_id = rejudge_job_id
+
+    def __repr__(self):
+        return '<QueueEntry #%s>' % str(self.id)
+
+def load_queue(session):
+    """Get all waiting submissions as list of QueueEntry"""
+    from pysistem.submissions.model import Submission
+    return [QueueEntry(*row) for row in session.query(
+        Submission.id, Submission.status, Submission.compiler_id,
+        Submission.user_id, Submission.problem_id, Submission.is_recheck,
+        Submission.rejudge_job_id
+    ).filter(Submission.status.in_([STATUS_CWAIT, STATUS_WAIT]))]
+
+def rank(entries, session, names=None):
+    """Sort queue entries in order they should be judged
+
+    Arguments:
+    entries -- list of QueueEntry
+    session -- SQLAlchemy session object to use
+    names -- policy names. Default -- JUDGE_SCHEDULER
+    """
+    if names is None:
+        names = app.config.get('JUDGE_SCHEDULER', DEFAULT_POLICIES)
+    if not entries:
+        return []
+    keys = [policies[name](entries, session) for name in names]
+    return sorted(entries, key=lambda entry: tuple(key[entry.id] for key in keys) + (entry.id,))
+
+@policy('contest')
+def contest_policy(entries, session):
+    """Submissions to problems of running contests go first"""
+    from pysistem.contests.model import Contest, ContestProblemAssociation
+    now = datetime.now()
+    live = set(row[0] for row in session.query(ContestProblemAssociation.problem_id) \
+        .join(Contest, Contest.id == ContestProblemAssociation.contest_id) \
+        .filter(db.and_(Contest.start <= now, Contest.end >= now)))
+    return dict([(entry.id, 0 if entry.problem_id in live else 1) for entry in entries])
+
+@policy('fresh')
+def fresh_policy(entries, session):
+    """New submissions go before rechecks"""
+    return dict([(entry.id, int(entry.is_recheck)) for entry in entries])
+
+@policy('fair')
+def fair_policy(entries, session):
+    """Round-robin between users
+
+    Key is amount of user's submissions being judged plus
+    amount of user's submissions ahead in queue
+    """
+    from pysistem.submissions.model import Submission
+    load = dict(session.query(Submission.user_id, db.func.count(Submission.id)) \
+        .filter(Submission.status.in_([STATUS_COMPILING, STATUS_CHECKING])) \
+        .group_by(Submission.user_id).all())
+    keys = {}
+    for entry in sorted(entries, key=lambda entry: entry.id):
+        keys[entry.id] = load.get(entry.user_id, 0)
+        load[entry.user_id] = keys[entry.id] + 1
+    return keys
+
+@policy('sjf')
+def sjf_policy(entries, session):
+    """Shortest expected job first: tests count * time limit"""
+    from pysistem.problems.model import Problem
+    from pysistem.test_pairs.model import TestPair, TestGroup
+    problem_ids = set(entry.problem_id for entry in entries)
+    tests = dict(session.query(TestGroup.problem_id, db.func.count(TestPair.id)) \
+        .join(TestPair, TestPair.test_group_id == TestGroup.id) \
+        .filter(TestGroup.problem_id.in_(problem_ids)) \
+        .group_by(TestGroup.problem_id).all())
+    time_limits = dict(session.query(Problem.id, Problem.time_limit) \
+        .filter(Problem.id.in_(problem_ids)).all())
+    return dict([(entry.id, tests.get(entry.problem_id, 0) * \
+                            (time_limits.get(entry.problem_id) or 0)) for entry in entries])
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+"""Judge API views
+
+Judge nodes (see pysistem.judge.node) lease waiting submissions, fetch
+checker sources and test data by content hash and post verdicts back.
+Every request must carry JUDGE_API_TOKEN in X-Judge-Token header.
+
+A leased submission is bound to a random lease token. Reports with other
+token are rejected, so a result of a node whose lease has expired and was
+given to another node is dropped.
+"""
+
+import binascii
+import os
+from datetime import datetime
+
+from flask import Blueprint, Response, request, jsonify
+
+from pysistem import app, db, cache
+from pysistem.judge.decorators import requires_judge_token
+from pysistem.judge import rejudge
+from pysistem.submissions.model import Submission, SubmissionLog
+from pysistem.checkers.model import Checker
+from pysistem.test_pairs.model import TestPair, TestGroup
+from pysistem.test_pairs.store import get_hash
+from pysistem.submissions import output
+from pysistem.submissions.const import STATUS_ACT, STATUS_COMPILING, STATUS_CHECKING
+from pysistem.submissions.const import STATUS_COMPILEFAIL, USAGE_FIELDS, RESULT_IE
+
+mod = Blueprint('judge', __name__, url_prefix='/judge/api')
+
+def make_job(submission, lease):
+    """Describe leased submission for judge node
+
+    Returns:
+    Dict: submission's source and limits, checker's hash or built-in comparator,
+    output storage mode, test groups, where every test is list:
+    [TestPair's ID, input hash, pattern hash] (node reports version of test it ran
+    by these hashes, see result), and results of tests not to run
+    again: list of [TestPair's ID, Result, Checker output, SubmissionLog fields],
+    see pysistem.judge.rejudge.get_reusable
+    """
+    problem = submission.problem
+    checker = None
+    if not problem.builtin_checker:
+        checker = problem.checkers.filter(Checker.status == STATUS_ACT).first()
+    groups = []
+    for test_group in problem.test_groups:
+        groups.append({
+            'score': test_group.score,
+            'score_per_test': test_group.score_per_test,
+            'check_all': bool(test_group.check_all),
+            'tests': [[test.id, test.input_hash, test.pattern_hash]
+                      for test in test_group.test_pairs]
+        })
+    return {
+        'id': submission.id,
+        'lease': lease,
+        'source': submission.source,
+        'compiler': submission.compiler.autodetect,
+        'time_limit': problem.time_limit,
+        'memory_limit': problem.memory_limit,
+        'output_mode': output.get_mode(),
+        'comparator': problem.builtin_checker,
+        'checker': checker and {
+            'id': checker.id,
+            'hash': get_hash(checker.source),
+            'compiler': checker.compiler.autodetect
+        },
+        'groups': groups,
+        'reuse': [[test_id] + list(result) for test_id, result
+                  in rejudge.get_reusable(submission, db.session).items()]
+    }
+
+def get_leased_submission(submission_id, lease):
+    """Get submission being checked under lease, or None if lease is not valid"""
+    submission = Submission.query.get(submission_id)
+    if submission is None or not lease or submission.lease != lease or \
+       submission.status not in [STATUS_COMPILING, STATUS_CHECKING]:
+        return None
+    return submission
+
+@mod.route('/lease', methods=['POST'])
+@requires_judge_token
+def lease():
+    """Lease one waiting submission to judge node
+
+    JSON arguments:
+    compilers -- autodetect identifiers of compilers available on node
+
+    Returns:
+    JSON job, see make_job, or 204 No Content if there is nothing to check
+    """
+    from pysistem.checkthread import claim_submission, requeue_expired_leases
+    compilers = set((request.get_json(force=True) or {}).get('compilers') or [])
+    requeue_expired_leases(db.session)
+    token = binascii.hexlify(os.urandom(16)).decode()
+    submission = claim_submission(db.session,
+                                  is_available=lambda compiler: compiler.autodetect in compilers,
+                                  values={'lease': token, 'lease_time': datetime.now()})
+    if submission is None:
+        return Response(status=204)
+    return jsonify(make_job(submission, token))
+
+@mod.route('/checker/<int:checker_id>/source')
+@requires_judge_token
+def checker_source(checker_id):
+    """Get checker's source code"""
+    checker = Checker.query.get(checker_id)
+    if checker is None:
+        return jsonify(error='not found'), 404
+    return Response(checker.source, mimetype='text/plain')
+
+@mod.route('/test/<digest>')
+@requires_judge_token
+def test_data(digest):
+    """Get test input or pattern by its hash, see pysistem.test_pairs.store"""
+    test = TestPair.query.filter(TestPair.input_hash == digest).first()
+    if test is not None:
+        return Response(test.input, mimetype='application/octet-stream')
+    test = TestPair.query.filter(TestPair.pattern_hash == digest).first()
+    if test is not None:
+        return Response(test.pattern, mimetype='application/octet-stream')
+    return jsonify(error='not found'), 404
+
+@mod.route('/outputs/missing', methods=['POST'])
+@requires_judge_token
+def missing_outputs():
+    """Find which output blobs are not stored yet
+
+    JSON arguments:
+    hashes -- list of output hashes
+    """
+    hashes = (request.get_json(force=True) or {}).get('hashes') or []
+    return jsonify(missing=[digest for digest in hashes
+                            if not os.path.exists(output.get_blob_path(digest))])
+
+@mod.route('/output/<digest>', methods=['POST'])
+@requires_judge_token
+def upload_output(digest):
+    """Store compressed output blob, see pysistem.submissions.output"""
+    if not output.put_blob(digest, request.get_data()):
+        return jsonify(error='hash mismatch'), 400
+    return jsonify(status='ok')
+
+@mod.route('/submission/<int:submission_id>/progress', methods=['POST'])
+@requires_judge_token
+def progress(submission_id):
+    """Report progress of checking and renew lease
+
+    JSON arguments:
+    lease -- lease token
+    current_test_id -- TestPair's ID being checked
+    """
+    data = request.get_json(force=True) or {}
+    submission = get_leased_submission(submission_id, data.get('lease'))
+    if submission is None:
+        return jsonify(error='lease expired'), 409
+    submission.status = STATUS_CHECKING
+    submission.lease_time = datetime.now()
+    db.session.commit()
+    submission.set_progress(data.get('current_test_id') or 0)
+    return jsonify(status='ok')
+
+@mod.route('/submission/<int:submission_id>/result', methods=['POST'])
+@requires_judge_token
+def result(submission_id):
+    """Post verdict of leased submission
+
+    JSON arguments:
+    lease -- lease token
+    compiled -- if submission compiled successfully
+    compile_log -- compiler's log
+    result, score -- submission's verdict, if compiled
+    usage -- submission's resource usage, see Verdict.usage
+    logs -- list of [TestPair's ID, Result, Checker output, SubmissionLog fields],
+            see TestRunner.run. Fields include test_version: version of test node
+            ran, see TestPair.get_version
+    error -- description of node's failure instead of other arguments,
+             submission then gets Internal Error
+    """
+    data = request.get_json(force=True) or {}
+    submission = get_leased_submission(submission_id, data.get('lease'))
+    if submission is None:
+        return jsonify(error='lease expired'), 409
+
+    SubmissionLog.query.filter(SubmissionLog.submission_id == submission.id) \
+        .delete(synchronize_session=False)
+    submission.compile_log = data.get('compile_log') or ''
+    submission.set_usage(data.get('usage') or {})
+    if data.get('error'):
+        app.logger.warning('Judge node failed to check submission #%d: %s',
+                           submission.id, data['error'])
+        submission.result = RESULT_IE
+        submission.score = 0
+        submission.done()
+    elif data.get('compiled'):
+        test_pairs = dict([(test.id, test) for test in TestPair.query \
+            .join(TestGroup, TestGroup.id == TestPair.test_group_id) \
+            .filter(TestGroup.problem_id == submission.problem_id)])
+        for test_id, test_result, log, fields in data.get('logs') or []:
+            if test_id in test_pairs:
+                submission_log = SubmissionLog(test_result, log, fields.get('stdout'),
+                                               submission, test_pairs[test_id])
+                for field in ('stdout_hash', 'stdout_size', 'test_version') + USAGE_FIELDS:
+                    setattr(submission_log, field, fields.get(field))
+                db.session.add(submission_log)
+        submission.result = data.get('result')
+        submission.score = data.get('score') or 0
+        submission.done()
+    else:
+        submission.status = STATUS_COMPILEFAIL
+    submission.current_test_id = 0
+    submission.lease = None
+    db.session.commit()
+    submission.set_progress(0)
+    cache.delete("/submission/view/%d/%r" % (submission.id, True))
+    cache.delete("/submission/view/%d/%r" % (submission.id, False))
+    return jsonify(status='ok')
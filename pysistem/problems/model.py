@@ -25,6 +25,10 @@ class Problem(db.Model):
     statement -- problem's statement with HTML markup
     time_limit -- maximum time problem's solutions are allowed to execute for, in milliseconds
     memory_limit -- maximum memory problem's solutions are allowed to consume, in KiB
+    builtin_checker -- name of built-in comparator used instead of checkers,
+                       see pysistem.checkers.builtin. None if checkers are used
+    max_score -- maximum achievable score, see update_max_score. None if not computed yet
+    test_count -- amount of test pairs in all test groups
 
     Relationships:
     submissions -- All user-made submissions to this problem
@@ -39,6 +43,9 @@ class Problem(db.Model):
     statement = db.Column(db.Text)
     time_limit = db.Column(db.Integer)
     memory_limit = db.Column(db.Integer)
+    builtin_checker = db.Column(db.String(32))
+    max_score = db.Column(db.Integer)
+    test_count = db.Column(db.Integer)
 
     submissions = db.relationship('Submission', cascade='all,delete',
                                   backref='problem', lazy="dynamic")
@@ -131,6 +138,7 @@ class Problem(db.Model):
             'memory_limit': self.memory_limit,
             'description': self.description,
             'statement': self.statement,
+            'builtin_checker': self.builtin_checker,
             'checkers': [{
                 'name': checker.name,
                 'compiler': checker.compiler.autodetect or checker.compiler.lang,
@@ -171,6 +179,7 @@ class Problem(db.Model):
             self.memory_limit = data.get('memory_limit', self.memory_limit)
             self.description = data.get('description', self.description)
             self.statement = data.get('statement', self.statement)
+            self.builtin_checker = data.get('builtin_checker', self.builtin_checker)
             for checker in data.get('checkers', ()):
                 c = Checker(
                     checker['name'],
@@ -213,6 +222,8 @@ class Problem(db.Model):
                         )
                         test_group.test_pairs.append(test_pair)
                     db.session.add(test_group)
+            db.session.flush()
+            self.update_max_score()
             db.session.commit()
             return True
         except:
@@ -239,11 +250,19 @@ class Problem(db.Model):
 
     def get_max_score(self):
         """Get problem's maximum achievable score"""
-        score = 0
-        try:
-            for test_group in self.test_groups:
-                score += test_group.score
-                score += test_group.test_pairs.count() * test_group.score_per_test
-        except:
-            score = 0
-        return score
+        if self.max_score is None:
+            self.update_max_score()
+        return self.max_score
+
+    def update_max_score(self):
+        """Recompute max_score and test_count, must be called after tests or groups change"""
+        from pysistem.test_pairs.model import TestGroup, TestPair
+        self.max_score = self.test_count = 0
+        if self.id is None:
+            return
+        for score, score_per_test, count in db.session.query(
+                TestGroup.score, TestGroup.score_per_test, db.func.count(TestPair.id)) \
+                .outerjoin(TestPair, TestPair.test_group_id == TestGroup.id) \
+                .filter(TestGroup.problem_id == self.id).group_by(TestGroup.id):
+            self.max_score += (score or 0) + count * (score_per_test or 0)
+            self.test_count += count
@@ -14,12 +14,15 @@ from pysistem.test_pairs.decorators import yield_test_pair, yield_test_group
 from pysistem.checkers.decorators import yield_checker
 from pysistem.test_pairs.model import TestPair, TestGroup
 from pysistem.checkers.model import Checker
+from pysistem.checkers import builtin
 from pysistem.submissions.model import Submission
 from pysistem.compilers.model import Compiler
 from pysistem.users.model import User
 from pysistem.contests.model import Contest, ContestProblemAssociation
 from pysistem.users.decorators import requires_login, requires_admin
 from pysistem.submissions.const import STATUS_CWAIT
+from pysistem.judge.notify import notify_judge
+from pysistem.judge import rejudge as rejudge_jobs
 
 mod = Blueprint('problems', __name__, url_prefix='/problem')
 
@@ -220,6 +223,23 @@ def tests(problem_id, problem):
     test_groups = problem.test_groups.all()
     return render_template('problems/tests.html', problem=problem, test_groups=test_groups)
 
+@mod.route('/<int:problem_id>/rejudge', methods=['POST'])
+@yield_problem()
+@requires_admin(problem="problem")
+def rejudge(problem_id, problem):
+    """Rejudge problem's submissions on added and changed tests only,
+    see pysistem.judge.rejudge
+
+    ROUTE arguments:
+    problem_id -- Problem's ID
+
+    Permissions required:
+    Problem Administrator
+    """
+    job = rejudge_jobs.start(g.user, delta=True, problem_id=problem.id)
+    flash(gettext('submissions.rejudge.started', total=job.total))
+    return redirect(url_for('problems.tests', problem_id=problem.id))
+
 @mod.route('/<int:problem_id>/testgroup/new', methods=['POST'])
 @mod.route('/<int:problem_id>/testgroup/<int:group_id>', methods=['POST'])
 @yield_problem()
@@ -245,6 +265,7 @@ def update_test_group(problem_id, problem, group_id=None):
     else:
         flash(gettext('problems.modtestgroup.success'))
     db.session.add(test_group)
+    problem.update_max_score()
     db.session.commit()
     return redirect(redirect_url())
 
@@ -260,7 +281,9 @@ def delete_test_group(test_group_id, test_group):
     Permissions required:
     Problem Administrator
     """
+    problem = test_group.problem
     db.session.delete(test_group)
+    problem.update_max_score()
     db.session.commit()
     flash(gettext('problems.deltestgroup.success'))
     return redirect(redirect_url())
@@ -277,7 +300,9 @@ def deltest(test_pair_id, test):
     Permissions required:
     Problem Administrator
     """
+    problem = test.test_group.problem
     db.session.delete(test)
+    problem.update_max_score()
     db.session.commit()
     flash(gettext('problems.deltest.success'))
     return redirect(redirect_url())
@@ -316,6 +341,7 @@ def addtest(test_group_id, test_group):
 
     test_pair = TestPair(input_str, pattern_str)
     test_group.test_pairs.append(test_pair)
+    test_group.problem.update_max_score()
     db.session.commit()
     return redirect(url_for('problems.tests', problem_id=test_group.problem_id))
 
@@ -353,6 +379,7 @@ def addtestzip(test_group_id, test_group):
                 pat = zipf.read(pattern_names[i]).decode()
 
             test_group.test_pairs.append(TestPair(inp, pat))
+        test_group.problem.update_max_score()
         db.session.commit()
     except:
         flash('::danger ' + gettext('problems.addtestzip.invalid'))
@@ -376,7 +403,29 @@ def checkers(problem_id, problem):
     checkers = problem.checkers.all()
     compilers = Compiler.query.all()
     return render_template('problems/checkers.html', problem=problem,
-                           checkers=checkers, compilers=compilers)
+                           checkers=checkers, compilers=compilers,
+                           comparators=sorted(builtin.comparators))
+
+@mod.route('/<int:problem_id>/builtinchecker', methods=['POST'])
+@yield_problem()
+@requires_admin(problem="problem")
+def builtinchecker(problem_id, problem):
+    """Select built-in comparator instead of checkers
+
+    ROUTE arguments:
+    problem_id -- Problem's ID
+
+    Permissions required:
+    Problem Administrator
+    """
+    name = request.form.get('builtin_checker', '').strip()
+    if name and not builtin.is_valid(name):
+        flash('::danger ' + gettext('problems.builtinchecker.invalid'))
+        return redirect(url_for('problems.checkers', problem_id=problem_id))
+    problem.builtin_checker = name or None
+    db.session.commit()
+    flash(gettext('problems.builtinchecker.success'))
+    return redirect(url_for('problems.checkers', problem_id=problem_id))
 
 @mod.route('/<int:problem_id>/addchecker', methods=['POST'])
 @yield_problem()
@@ -516,6 +565,7 @@ def submissions(problem_id, problem, username=None):
         sub.current_test_id = 0
         db.session.add(sub)
         db.session.commit()
+        notify_judge()
         flash(gettext('problems.submit.success'))
         return redirect(url_for('problems.submissions', problem_id=problem_id))
 
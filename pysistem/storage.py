@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""Helpers of on-disk stores and caches in STORAGE
+
+Files are written via temporary files named '.tmp*' in the same directory,
+so readers never see partial files. Caches mark entries as used by
+touching them and evict least recently used entries.
+"""
+
+import os
+import tempfile
+
+def write_atomic(path, writer, mode=None):
+    """Write file via temporary file, creating its directory if needed
+
+    Arguments:
+    path -- path to file
+    writer -- function writing contents to binary file object
+    mode -- permissions to set before file appears, e.g. 0o444
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            writer(file)
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except:
+        os.remove(tmp_path)
+        raise
+
+def evict(directory, max_size, get_entry=None):
+    """Remove least recently used entries until directory fits into max_size bytes
+
+    Arguments:
+    directory -- directory of cache
+    max_size -- size budget, in bytes
+    get_entry -- function mapping file name to key of entry it belongs to,
+                 None to leave file alone. Default -- every file is an entry.
+                 Entry was last used when its newest file was modified
+    """
+    entries = {}
+    total = 0
+    for name in os.listdir(directory):
+        if name.startswith('.tmp'):
+            continue
+        key = get_entry(name) if get_entry else name
+        if key is None:
+            continue
+        try:
+            stat = os.stat(os.path.join(directory, name))
+        except OSError: # pragma: no cover
+            continue
+        entry = entries.setdefault(key, [0, 0, []])
+        entry[0] += stat.st_size
+        entry[1] = max(entry[1], stat.st_mtime)
+        entry[2].append(name)
+        total += stat.st_size
+
+    for key, (size, used, names) in sorted(entries.items(), key=lambda x: x[1][1]):
+        if total <= max_size:
+            break
+        for name in names:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError: # pragma: no cover
+                pass
+        total -= size
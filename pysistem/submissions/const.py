@@ -22,6 +22,12 @@ RESULT_PE = 7 # Presentation error
 RESULT_RJ = 8 # Rejected
 RESULT_UNKNOWN = -1 # Not tested
 
+# Resource usage of program on test, see run_sandboxed
+USAGE_FIELDS = ('cpu_time', 'wall_time', 'memory')
+# Resource usage of submission, see Verdict.add_usage
+USAGE_AGGREGATES = ('max_cpu_time', 'total_cpu_time', 'max_wall_time', 'total_wall_time',
+                    'max_memory')
+
 STR_STATUS = (
     "Waiting...",
     "Compiling...",
@@ -2,20 +2,35 @@
 
 """Submissions models"""
 
-import tempfile
 import os
 from datetime import datetime
 
 from flask_babel import gettext
+from werkzeug.contrib.cache import FileSystemCache
 
 from pysistem import db, app, cache
 from pysistem.submissions.const import RESULT_UNKNOWN, RESULT_OK, STATUS_DONE, STR_STATUS
 from pysistem.submissions.const import STATUS_WAIT, STATUS_COMPILEFAIL, STATUS_ACT, STR_RESULT
 from pysistem.submissions.const import STATUS_COMPILING, STATUS_CHECKING, STATUS_CWAIT
+from pysistem.submissions.const import USAGE_FIELDS, USAGE_AGGREGATES
 from pysistem.users.model import User
 from pysistem.compilers.model import Compiler
+from pysistem.compilers import scratch
 from pysistem.problems.model import Problem
-from pysistem.checkers.model import Checker
+from pysistem.checkers.model import Checker, check_submission
+
+_progress_caches = {}
+
+def get_progress_cache():
+    """Get cache of submissions' progress in STORAGE/progress_cache, see Submission.set_progress
+
+    Checking threads, standalone checker processes and web workers receiving
+    judge nodes' reports all share it, unlike per-process cache.
+    """
+    cache_dir = os.path.join(app.config['STORAGE'], 'progress_cache')
+    if cache_dir not in _progress_caches:
+        _progress_caches[cache_dir] = FileSystemCache(cache_dir)
+    return _progress_caches[cache_dir]
 
 class Submission(db.Model):
     """An attempt to solve a problem
@@ -28,12 +43,20 @@ class Submission(db.Model):
     compile_log -- submissions's compilation log
     score -- submissions's score
     submitted -- submission datetime
+    is_recheck -- if submission is queued for recheck by administrator
+    lease -- token of judge node checking this submission, see pysistem.judge.views
+    lease_time -- when judge node last reported about this submission
+    max_cpu_time, total_cpu_time -- CPU time used on a test: maximum and sum, in milliseconds
+    max_wall_time, total_wall_time -- wall time used on a test: maximum and sum, in milliseconds
+    max_memory -- peak memory used on a test, in KiB
+    previous_status -- status before submission was queued by rejudge job
 
     Relationships:
     user, user_id -- whose this submission is
     compiler, compiler_id -- compiler this submission is sent via
     problem, problem_id -- what problem is this submission attempting to solve
     submission_logs -- logs linked with tests in problem
+    rejudge_job, rejudge_job_id -- rejudge job that queued submission last
     """
     id = db.Column(db.Integer, primary_key=True)
     source = db.Column(db.Text)
@@ -42,10 +65,20 @@ class Submission(db.Model):
     compile_log = db.Column(db.Text)
     score = db.Column(db.Integer)
     submitted = db.Column(db.DateTime)
+    is_recheck = db.Column(db.Boolean, default=False)
+    lease = db.Column(db.String(32))
+    lease_time = db.Column(db.DateTime)
+    max_cpu_time = db.Column(db.Integer)
+    total_cpu_time = db.Column(db.Integer)
+    max_wall_time = db.Column(db.Integer)
+    total_wall_time = db.Column(db.Integer)
+    max_memory = db.Column(db.Integer)
+    previous_status = db.Column(db.Integer)
 
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     compiler_id = db.Column(db.Integer, db.ForeignKey('compiler.id'))
     problem_id = db.Column(db.Integer, db.ForeignKey('problem.id'))
+    rejudge_job_id = db.Column(db.Integer, db.ForeignKey('rejudge_job.id'))
     submission_logs = db.relationship('SubmissionLog', cascade="all,delete",
                                       backref="submission", lazy="dynamic")
 
@@ -71,6 +104,7 @@ class Submission(db.Model):
         self.problem = problem
         self.score = 0
         self.submitted = datetime.now()
+        self.is_recheck = False
 
     def __repr__(self):
         return '<Submission #%s>' % str(self.id)
@@ -83,14 +117,21 @@ class Submission(db.Model):
         return storage_dir + '/submissions_bin/' + str(self.id)
 
     def get_source_path(self):
-        """Get submission's source path"""
+        """Get submission's source path in scratch directory"""
         if not self.id:
             db.session.commit()
-        if os.path.exists('/SANDBOX'):
-            return '/SANDBOX/pysistem_submission_' + str(self.id) + '.' + self.compiler.lang
-        else: # pragma: no cover
-            return tempfile.gettempdir() + '/pysistem_submission_' \
-                   + str(self.id) + '.' + self.compiler.lang
+        return scratch.get_path('pysistem_submission_%d.%s' % (self.id, self.compiler.lang))
+
+    def write_source(self):
+        """Write submission's source to get_source_path()
+
+        Returns:
+        Path to written source file
+        """
+        source_path = self.get_source_path()
+        with open(source_path, 'w') as source_file:
+            source_file.write(self.source)
+        return source_path
 
     def compile(self):
         """Compile submission
@@ -101,16 +142,14 @@ class Submission(db.Model):
         self.status = STATUS_COMPILING
         db.session.commit()
         source_path = self.get_source_path()
-        source_file = open(source_path, 'w')
-        source_file.write(self.source)
-        source_file.close()
 
         try:
             os.remove(self.get_exe_path())
         except: # pragma: no cover
             pass
 
-        result, output = self.compiler.compile(source_path, self.get_exe_path())
+        result, output = self.compiler.compile_source(self.source, source_path,
+                                                      self.get_exe_path())
         if result:
             self.status = STATUS_WAIT
         else:
@@ -141,12 +180,8 @@ class Submission(db.Model):
 
         """
         self.status = STATUS_CHECKING
-        db.session.commit()
 
-        source_path = self.get_source_path()
-        source_file = open(source_path, 'w')
-        source_file.write(self.source)
-        source_file.close()
+        source_path = self.write_source()
 
         result, stdout, stderr = self.compiler.run(self.get_exe_path(), source_path, \
             time_limit, memory_limit, stdin)
@@ -163,6 +198,43 @@ class Submission(db.Model):
         """Set status to done"""
         self.status = STATUS_DONE
 
+    def set_progress(self, test_id):
+        """Publish test being checked through cache shared by all processes
+        instead of updating database, see get_progress_cache
+
+        Arguments:
+        test_id -- TestPair's ID, 0 when checking is over
+        """
+        if test_id:
+            get_progress_cache().set('/submission/progress/%d' % self.id, test_id,
+                                     timeout=app.config.get('JUDGE_LEASE_TIMEOUT', 600))
+        else:
+            get_progress_cache().delete('/submission/progress/%d' % self.id)
+
+    def set_usage(self, usage):
+        """Set resource usage of submission
+
+        Arguments:
+        usage -- dict of USAGE_AGGREGATES fields, see Verdict.usage
+        """
+        for field in USAGE_AGGREGATES:
+            setattr(self, field, usage.get(field))
+
+    def get_usage(self):
+        """Get resource usage of submission and of every test as dict"""
+        usage = dict((field, getattr(self, field)) for field in USAGE_AGGREGATES)
+        usage['tests'] = [dict([('test_pair_id', log.test_pair_id), ('result', log.result)] +
+                               [(field, getattr(log, field)) for field in USAGE_FIELDS])
+                          for log in self.submission_logs.order_by(SubmissionLog.test_pair_id)]
+        return usage
+
+    def get_current_test_id(self):
+        """Get ID of test being checked, see set_progress"""
+        if self.status != STATUS_CHECKING:
+            return 0
+        return get_progress_cache().get('/submission/progress/%d' % self.id) or \
+            self.current_test_id or 0
+
     def get_str_result(self, color=False, score=True, only_color=False, result=None, status=None):
         """Get formatted verdict string
 
@@ -201,8 +273,13 @@ class Submission(db.Model):
         """Check if compilation error occurred"""
         return self.status == STATUS_COMPILEFAIL
 
-    def check(self, session=None):
-        """Start sync checking of submission"""
+    def check(self, session=None, reuse=None):
+        """Start sync checking of submission
+
+        Arguments:
+        session -- SQLAlchemy session object to use. Default -- db.session
+        reuse -- results of tests not to run again, see pysistem.judge.rejudge.get_reusable
+        """
         session = session or db.session
         if not self.id:
             session.commit()
@@ -212,10 +289,10 @@ class Submission(db.Model):
         except: pass
         checker = self.problem.checkers.filter(Checker.status == STATUS_ACT).first()
 
-        if checker is None:
+        if checker is None and not self.problem.builtin_checker:
             return -1
         self.current_test_id = 0
-        return checker.check(self, session)
+        return check_submission(self, checker, session, reuse)
 
 class SubmissionLog(db.Model):
     """A submission <-> test pair log
@@ -223,7 +300,13 @@ class SubmissionLog(db.Model):
     Fields:
     result -- pysistem.submissions.const result
     log -- checker's log
-    stdout -- submission's output
+    stdout -- submission's output or its preview, see pysistem.submissions.output
+    stdout_hash -- SHA-256 hash of submission's output
+    stdout_size -- size of submission's output, in bytes
+    cpu_time -- CPU time used by submission, in milliseconds
+    wall_time -- wall time used by submission, in milliseconds
+    memory -- peak memory used by submission, in KiB
+    test_version -- version of test when it was run, see TestPair.get_version
 
     Relationships:
     submission, submission_id -- submission
@@ -232,6 +315,12 @@ class SubmissionLog(db.Model):
     result = db.Column(db.Integer)
     log = db.Column(db.Text)
     stdout = db.Column(db.Text)
+    stdout_hash = db.Column(db.String(64))
+    stdout_size = db.Column(db.Integer)
+    cpu_time = db.Column(db.Integer)
+    wall_time = db.Column(db.Integer)
+    memory = db.Column(db.Integer)
+    test_version = db.Column(db.String(64))
     submission_id = db.Column(db.Integer, db.ForeignKey('submission.id'), primary_key=True)
     test_pair_id = db.Column(db.Integer, db.ForeignKey('test_pair.id'), primary_key=True)
 
@@ -247,3 +336,82 @@ class SubmissionLog(db.Model):
             return '<SubmissionLog Submission=%s TestPair=%s>' % (self.submission, self.test_pair)
         else:
             return '<SubmissionLog Unknown>'
+
+
+class RejudgeJob(db.Model):
+    """Recheck of many submissions at once, see pysistem.judge.rejudge
+
+    Fields:
+    id -- unique rejudge job identifier
+    description -- which submissions are rechecked
+    share -- percentage of judge capacity job's submissions may take at once
+    delta -- run only tests added or changed since submission was checked
+    total -- amount of submissions queued by job
+    cancelled -- amount of submissions returned to previous status on cancel
+    created -- when job was started
+    finished -- when job's last submission was checked or job was cancelled
+
+    Relationships:
+    user, user_id -- who started job, None if started from console
+    submissions -- submissions queued by job
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    description = db.Column(db.String(256))
+    share = db.Column(db.Integer)
+    delta = db.Column(db.Boolean, default=False)
+    total = db.Column(db.Integer)
+    cancelled = db.Column(db.Integer)
+    created = db.Column(db.DateTime)
+    finished = db.Column(db.DateTime)
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    user = db.relationship('User')
+    submissions = db.relationship('Submission', backref='rejudge_job', lazy='dynamic')
+
+    def __init__(self, description='', share=100, user=None, delta=False):
+        self.description = description
+        self.share = share
+        self.delta = delta
+        self.user = user
+        self.total = 0
+        self.cancelled = 0
+        self.created = datetime.now()
+
+    def __repr__(self):
+        return '<RejudgeJob #%s>' % str(self.id)
+
+    def is_active(self):
+        """Check if job has submissions left to check"""
+        return self.finished is None
+
+    def get_progress(self):
+        """Get progress of job, marking it finished when nothing is left
+
+        Returns:
+        Dict: id, description, share, delta, total, done, pending, cancelled -- amounts of
+        submissions, active, created, finished and eta -- seconds left or None
+        """
+        pending = self.submissions.filter(Submission.status.in_(
+            [STATUS_CWAIT, STATUS_WAIT, STATUS_COMPILING, STATUS_CHECKING])).count() \
+            if self.is_active() else 0
+        if pending == 0 and self.is_active():
+            self.finished = datetime.now()
+        done = self.total - self.cancelled - pending
+        eta = None
+        if pending and done:
+            elapsed = (datetime.now() - self.created).total_seconds()
+            eta = int(elapsed * pending / done)
+        return {
+            'id': self.id,
+            'description': self.description,
+            'share': self.share,
+            'delta': bool(self.delta),
+            'total': self.total,
+            'done': done,
+            'pending': pending,
+            'cancelled': self.cancelled,
+            'active': self.is_active(),
+            'created': self.created.isoformat(),
+            'finished': self.finished.isoformat() if self.finished else None,
+            'eta': eta
+        }
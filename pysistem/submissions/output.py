@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+"""Storage of program output on tests
+
+SubmissionLog keeps output of a test according to SUBMISSION_OUTPUT:
+full -- whole output in database, default
+preview -- first and last SUBMISSION_OUTPUT_PREVIEW bytes of output
+hash -- only hash and size of output
+blob -- preview in database, whole output compressed in STORAGE/outputs
+        under its SHA-256 hash, so identical outputs are stored once
+
+Hash and size are stored in every mode. Output is read from file in
+chunks and never loaded into memory whole, except in 'full' mode.
+"""
+
+import hashlib
+import os
+import zlib
+
+from pysistem import app, storage
+
+MODES = ('full', 'preview', 'hash', 'blob')
+CHUNK_SIZE = 1024 * 1024
+
+def get_mode():
+    """Get storage mode of program output"""
+    mode = app.config.get('SUBMISSION_OUTPUT', 'full')
+    if mode not in MODES: # pragma: no cover
+        raise ValueError('Unknown SUBMISSION_OUTPUT: %r' % mode)
+    return mode
+
+def get_output_dir():
+    """Get directory where output blobs are stored"""
+    return app.config.get('OUTPUT_STORE') or os.path.join(app.config['STORAGE'], 'outputs')
+
+def get_blob_path(digest):
+    """Get path to compressed output with given hash"""
+    return os.path.join(get_output_dir(), digest[:2], digest + '.z')
+
+def make_preview(head, tail=b'', skipped=0):
+    """Make text preview of output
+
+    Arguments:
+    head, tail -- first and last bytes of output
+    skipped -- amount of bytes between head and tail
+    """
+    if not skipped:
+        return (head + tail).decode(errors='replace')
+    return head.decode(errors='replace') + \
+           '\n[... %d bytes skipped ...]\n' % skipped + \
+           tail.decode(errors='replace')
+
+def limit_text(text, limit=None):
+    """Truncate text such as checker's log to preview, unless in 'full' mode"""
+    limit = limit or app.config.get('SUBMISSION_OUTPUT_PREVIEW', 4096)
+    if get_mode() == 'full' or len(text) <= 2 * limit:
+        return text
+    return text[:limit] + '\n[... %d characters skipped ...]\n' % (len(text) - 2 * limit) + \
+           text[-limit:]
+
+def read_output(path, mode=None):
+    """Read output file into SubmissionLog fields
+
+    Arguments:
+    path -- path to output file
+    mode -- storage mode. Default -- SUBMISSION_OUTPUT
+
+    Returns:
+    Dict: stdout, stdout_hash, stdout_size
+    """
+    mode = mode or get_mode()
+    limit = app.config.get('SUBMISSION_OUTPUT_PREVIEW', 4096)
+    digest = hashlib.sha256()
+    size = os.path.getsize(path)
+    with open(path, 'rb') as output_file:
+        if mode == 'full':
+            data = output_file.read()
+            digest.update(data)
+            stdout = data.decode(errors='replace')
+        else:
+            head = output_file.read(limit)
+            digest.update(head)
+            for chunk in iter(lambda: output_file.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+            tail = b''
+            if size > 2 * limit:
+                output_file.seek(size - limit)
+                tail = output_file.read(limit)
+            elif size > limit:
+                output_file.seek(limit)
+                tail = output_file.read()
+            stdout = None if mode == 'hash' else \
+                     make_preview(head, tail, max(0, size - len(head) - len(tail)))
+
+    digest = digest.hexdigest()
+    if mode == 'blob' and not os.path.exists(get_blob_path(digest)):
+        write_blob(digest, path)
+    return {'stdout': stdout, 'stdout_hash': digest, 'stdout_size': size}
+
+def write_blob(digest, path):
+    """Compress output file into blob store"""
+    compressor = zlib.compressobj()
+    def write(blob_file):
+        """Write compressed output"""
+        with open(path, 'rb') as output_file:
+            for chunk in iter(lambda: output_file.read(CHUNK_SIZE), b''):
+                blob_file.write(compressor.compress(chunk))
+        blob_file.write(compressor.flush())
+    storage.write_atomic(get_blob_path(digest), write)
+
+def put_blob(digest, compressed):
+    """Store compressed output received from judge node
+
+    Arguments:
+    digest -- SHA-256 hash of output
+    compressed -- zlib-compressed output
+
+    Returns:
+    True if stored, False if hash does not match
+    """
+    if hashlib.sha256(zlib.decompress(compressed)).hexdigest() != digest:
+        return False
+    if not os.path.exists(get_blob_path(digest)):
+        storage.write_atomic(get_blob_path(digest), lambda blob_file: blob_file.write(compressed))
+    return True
+
+def get_blob(digest):
+    """Get compressed output by hash, None if not stored"""
+    try:
+        with open(get_blob_path(digest), 'rb') as blob_file:
+            return blob_file.read()
+    except (IOError, OSError):
+        return None
@@ -2,14 +2,22 @@
 
 """Submission views"""
 
+import os
+import zlib
+
 from pysistem import db, redirect_url, cache
-from flask import render_template, g, redirect, Blueprint, Response
-from pysistem.submissions.model import Submission, SubmissionLog
+from flask import render_template, g, redirect, Blueprint, Response, jsonify
+from flask import request, flash, url_for
+from flask_babel import gettext
+from pysistem.submissions.model import Submission, SubmissionLog, RejudgeJob
 from pysistem.users.decorators import requires_admin
 from pysistem.submissions.decorators import yield_submission
+from pysistem.judge.notify import notify_judge
+from pysistem.judge import rejudge
+from pysistem.submissions import output
 from pysistem.test_pairs.model import TestGroup
 from pysistem.submissions.const import STATUS_DONE, STATUS_CWAIT, STATUS_ACT
-from pysistem.submissions.const import RESULT_OK, RESULT_UNKNOWN, RESULT_RJ
+from pysistem.submissions.const import RESULT_OK, RESULT_UNKNOWN, RESULT_RJ, STR_RESULT
 
 mod = Blueprint('submissions', __name__, url_prefix='/submission')
 
@@ -49,15 +57,23 @@ def view(submission_id, submission):
                 "result": sub.result,
                 "log": sub.log,
                 "stdout": sub.stdout,
+                "stdout_hash": sub.stdout_hash,
+                "stdout_size": sub.stdout_size,
+                "cpu_time": sub.cpu_time,
+                "wall_time": sub.wall_time,
+                "memory": sub.memory,
+                "has_blob": bool(sub.stdout_hash) and \
+                            os.path.exists(output.get_blob_path(sub.stdout_hash)),
                 "input": sub.test_pair.input,
                 "pattern": sub.test_pair.pattern,
                 "id": sub.test_pair.id,
                 "score": sub.test_pair.test_group.score_per_test if sub.result == RESULT_OK else 0
             })
-        if submission.current_test_id > 0:
-            test_pair = TestPair.query.get(submission.current_test_id)
-            if test_pair and (test_pair.test_group_id in logs):
-                logs[test_pair.test_group_id].append({
+        current_test_id = submission.get_current_test_id()
+        if current_test_id > 0:
+            test_pair = TestPair.query.get(current_test_id)
+            if test_pair:
+                logs.setdefault(test_pair.test_group_id, []).append({
                     "result": RESULT_UNKNOWN,
                     "log": "",
                     "stdout": "",
@@ -86,7 +102,8 @@ def view(submission_id, submission):
                                        disable_all_actions=True, hide_source=True)
 
         rawview = render_template('submissions/rawview.html', submission=submission,
-                                  logs=logs_list, rendered_sub=rendered_sub)
+                                  logs=logs_list, rendered_sub=rendered_sub,
+                                  current_test_id=current_test_id)
         if submission.status in [STATUS_DONE, STATUS_ACT]:
             cache.set(cache_name, rawview)
     return render_template('submissions/view.html', rawview=rawview, submission_id=submission.id)
@@ -107,6 +124,46 @@ def source(submission_id, submission):
         return render_template('errors/403.html'), 403
     return Response(submission.source, mimetype='text/plain')
 
+@mod.route('/<int:submission_id>/usage')
+@yield_submission()
+def usage(submission_id, submission):
+    """Get submission's resource usage as JSON, see Submission.get_usage
+
+    ROUTE arguments:
+    submission_id -- Submission's ID
+
+    Permissions Required (at least one):
+    Submission owner
+    Submission Administrator
+    """
+    if not g.user.is_admin(submission=submission) and (submission.user_id != g.user.id):
+        return jsonify(error='forbidden'), 403
+    return jsonify(id=submission.id, status=submission.status, result=submission.result,
+                   **submission.get_usage())
+
+@mod.route('/<int:submission_id>/output/<int:test_pair_id>')
+@yield_submission()
+def full_output(submission_id, submission, test_pair_id):
+    """Download submission's whole output on test, stored in 'blob' mode
+
+    ROUTE arguments:
+    submission_id -- Submission's ID
+    test_pair_id -- Test Pair's ID
+
+    Permissions Required (at least one):
+    Submission owner
+    Submission Administrator
+    """
+    if not g.user.is_admin(submission=submission) and (submission.user_id != g.user.id):
+        return render_template('errors/403.html'), 403
+    submission_log = submission.submission_logs \
+        .filter(SubmissionLog.test_pair_id == test_pair_id).first()
+    blob = submission_log and submission_log.stdout_hash and \
+           output.get_blob(submission_log.stdout_hash)
+    if not blob:
+        return render_template('errors/404.html'), 404
+    return Response(zlib.decompress(blob), mimetype='text/plain')
+
 @mod.route('/<int:submission_id>/compilelog')
 @yield_submission()
 def compilelog(submission_id, submission):
@@ -138,8 +195,11 @@ def recheck(submission_id, submission):
     """
     submission.status = STATUS_CWAIT
     submission.current_test_id = 0
+    submission.is_recheck = True
+    submission.rejudge_job_id = None
     db.session.add(submission)
     db.session.commit()
+    notify_judge()
     return redirect(redirect_url())
 
 @mod.route('/<int:submission_id>/reject')
@@ -179,19 +239,89 @@ def delete(submission_id, submission):
 @mod.route('/recheck/<int_list:ids>')
 @requires_admin
 def recheck_all(ids):
-    """Recheck list of submissions
+    """Recheck list of submissions with rejudge job
 
     ROUTE arguments:
-    submission_id -- Submission's ID
+    ids -- Submissions' IDs
 
     Permissions Required:
     Server Administrator (TODO)
     """
-    subs = Submission.query.filter(Submission.id.in_(ids))
-    for submission in subs:
-        submission.status = STATUS_CWAIT
-        db.session.commit()
-    return redirect(redirect_url())
+    rejudge.start(g.user, ids=ids)
+    return redirect(url_for('submissions.rejudge_jobs'))
+
+@mod.route('/rejudge', methods=['GET', 'POST'])
+@requires_admin
+def rejudge_jobs():
+    """List and start rejudge jobs, see pysistem.judge.rejudge
+
+    POST arguments:
+    problem_id, contest_id -- recheck submissions to problem or contest
+    ids -- comma-separated IDs of submissions to recheck
+    result -- recheck only submissions with this verdict
+    share -- percentage of judge capacity job may take, at least one worker
+    delta -- run only added or changed tests
+
+    Permissions Required:
+    Server Administrator
+    """
+    if request.method == 'POST':
+        filters = {}
+        try:
+            for field in ('problem_id', 'contest_id', 'result'):
+                if request.form.get(field, '').strip():
+                    filters[field] = int(request.form[field])
+            if request.form.get('ids', '').strip():
+                filters['ids'] = [int(submission_id) for submission_id
+                                  in request.form['ids'].split(',')]
+            share = int(request.form.get('share') or 100)
+            job = rejudge.start(g.user, share, bool(request.form.get('delta')), **filters)
+        except ValueError:
+            flash('::danger ' + gettext('submissions.rejudge.invalid'))
+            return redirect(url_for('submissions.rejudge_jobs'))
+        flash(gettext('submissions.rejudge.started', total=job.total))
+        return redirect(url_for('submissions.rejudge_jobs'))
+
+    jobs = RejudgeJob.query.order_by(RejudgeJob.id.desc()).limit(50).all()
+    progress = [job.get_progress() for job in jobs]
+    db.session.commit()
+    return render_template('submissions/rejudge.html', jobs=jobs, progress=progress,
+                           results=STR_RESULT[:-1])
+
+@mod.route('/rejudge/<int:job_id>')
+@requires_admin
+def rejudge_progress(job_id):
+    """Get progress of rejudge job as JSON, see RejudgeJob.get_progress
+
+    ROUTE arguments:
+    job_id -- RejudgeJob's ID
+
+    Permissions Required:
+    Server Administrator
+    """
+    job = RejudgeJob.query.get(job_id)
+    if job is None:
+        return jsonify(error='not found'), 404
+    progress = job.get_progress()
+    db.session.commit()
+    return jsonify(**progress)
+
+@mod.route('/rejudge/<int:job_id>/cancel', methods=['POST'])
+@requires_admin
+def rejudge_cancel(job_id):
+    """Cancel rejudge job
+
+    ROUTE arguments:
+    job_id -- RejudgeJob's ID
+
+    Permissions Required:
+    Server Administrator
+    """
+    job = RejudgeJob.query.get(job_id)
+    if job is None:
+        return render_template('errors/404.html'), 404
+    rejudge.cancel(job)
+    return redirect(url_for('submissions.rejudge_jobs'))
 
 @mod.route('/reject/<int_list:ids>')
 @requires_admin
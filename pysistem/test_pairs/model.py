@@ -1,15 +1,22 @@
 # -*- coding: utf-8 -*-
 from pysistem import db
+from pysistem.test_pairs.store import get_hash, get_path
 
 """TestPair and TestGroup models"""
 
+def get_version(input_hash, pattern_hash):
+    """Get version of test with given content hashes, see TestPair.get_version"""
+    return get_hash('%s:%s' % (input_hash, pattern_hash))
+
 class TestPair(db.Model):
     """Test case for checking solutions. Part of test group
 
     Fields:
     id -- unique test pair identifier
-    input -- test pair input file
-    pattern -- jury's answer to test pair's input
+    input -- test pair input file, loaded on access
+    pattern -- jury's answer to test pair's input, loaded on access
+    input_hash -- content hash of input, see pysistem.test_pairs.store
+    pattern_hash -- content hash of pattern, see also get_version
 
     Relationships:
     test_group, test_group_id -- parent test group
@@ -17,8 +24,10 @@ class TestPair(db.Model):
 
     """
     id = db.Column(db.Integer, primary_key=True)
-    input = db.Column(db.Text)
-    pattern = db.Column(db.Text)
+    input = db.deferred(db.Column(db.Text))
+    pattern = db.deferred(db.Column(db.Text))
+    input_hash = db.Column(db.String(64))
+    pattern_hash = db.Column(db.String(64))
 
     test_group_id = db.Column(db.Integer, db.ForeignKey('test_group.id'))
     submission_logs = db.relationship('SubmissionLog', cascade="all,delete",
@@ -31,6 +40,28 @@ class TestPair(db.Model):
     def __repr__(self):
         return '<TestPair of %r>' % self.test_group.problem.name
 
+    @db.validates('input', 'pattern')
+    def update_hash(self, key, value):
+        """Keep content hashes in sync with test data"""
+        setattr(self, key + '_hash', get_hash(value))
+        return value
+
+    def get_version(self):
+        """Get version of test, changed whenever its input or pattern changes"""
+        return get_version(self.input_hash, self.pattern_hash)
+
+    def get_input_path(self):
+        """Get path to input file in test store"""
+        if self.input_hash is None: # pragma: no cover
+            self.input_hash = get_hash(self.input)
+        return get_path(self.input_hash, lambda: self.input)
+
+    def get_pattern_path(self):
+        """Get path to pattern file in test store"""
+        if self.pattern_hash is None: # pragma: no cover
+            self.pattern_hash = get_hash(self.pattern)
+        return get_path(self.pattern_hash, lambda: self.pattern)
+
 class TestGroup(db.Model):
     """Group of test cases
 
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+"""Content-addressed on-disk store of test data
+
+Every test file is written once to TEST_STORE (STORAGE/tests by default)
+under its SHA-256 hash and then handed to the sandbox and checkers by path.
+Files are read-only and never change, so identical tests share one file.
+"""
+
+import hashlib
+import os
+
+from pysistem import app, storage
+
+def get_store_dir():
+    """Get directory where test files are stored on this node"""
+    return app.config.get('TEST_STORE') or os.path.join(app.config['STORAGE'], 'tests')
+
+def get_hash(data):
+    """Get content hash of test data
+
+    Arguments:
+    data -- test data, str or bytes
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    return hashlib.sha256(data or b'').hexdigest()
+
+def get_path(digest, loader):
+    """Get path to test file with given hash, storing it on first access
+
+    Arguments:
+    digest -- content hash, see get_hash
+    loader -- function returning test data, called only if file is not stored yet
+
+    Returns:
+    Path to read-only test file
+    """
+    directory = os.path.join(get_store_dir(), digest[:2])
+    path = os.path.join(directory, digest)
+    if os.path.exists(path):
+        return path
+
+    data = loader()
+    if isinstance(data, str):
+        data = data.encode()
+    storage.write_atomic(path, lambda file: file.write(data or b''), 0o444)
+    return path
@@ -2,6 +2,8 @@
 
 import unittest
 import os
+import multiprocessing
+import json
 from io import BytesIO
 from datetime import datetime, timedelta
 import warnings
@@ -14,10 +16,11 @@ from pysistem.users.model import User
 from pysistem.compilers.model import Compiler, detect_compilers
 from pysistem.contests.model import Contest, ContestProblemAssociation
 from pysistem.problems.model import Problem
-from pysistem.submissions.model import Submission
+from pysistem.submissions.model import Submission, SubmissionLog
 from pysistem.submissions.const import STATUS_ACT, STATUS_WAIT, STATUS_DONE
 from pysistem.submissions.const import STATUS_COMPILEFAIL, RESULT_OK, RESULT_WA
-from pysistem.submissions.const import RESULT_PE, RESULT_UNKNOWN
+from pysistem.submissions.const import STATUS_COMPILING, STATUS_CHECKING, STATUS_CWAIT
+from pysistem.submissions.const import RESULT_PE, RESULT_UNKNOWN, RESULT_IE
 from pysistem.checkers.model import Checker
 from pysistem.test_pairs.model import TestPair, TestGroup
 from pysistem.settings.model import Setting
@@ -302,6 +305,7 @@ class TestCase(unittest.TestCase):
         self.assertEqual(problem1.name, 'A+B')
         self.assertEqual(problem1.test_groups.count(), 1)
         self.assertEqual(problem1.test_groups[0].test_pairs.count(), 7)
+        self.assertEqual(problem1.test_count, 7)
 
         db.session.add(problem1)
         db.session.commit()
@@ -794,6 +798,1026 @@ class TestCase(unittest.TestCase):
         for compiler in Compiler.query:
             self.assertTrue(compiler.is_available())
 
+    def test_compiler_registry(self):
+        import shutil
+        from pysistem.compilers import registry
+        bin_dir = os.path.join(app.config['STORAGE'], 'registry_bin')
+        os.makedirs(bin_dir, exist_ok=True)
+        executable = os.path.join(bin_dir, 'pysistem_test_cc')
+        calls = os.path.join(bin_dir, 'calls')
+        app.config['PATH_EXTRA'] = [bin_dir]
+        try:
+            self.assertIsNone(registry.find('pysistem_test_cc'))
+            with open(executable, 'w') as executable_file:
+                executable_file.write('#!/bin/sh\necho x >> %s\necho 1.0\n' % calls)
+            os.chmod(executable, 0o755)
+            self.assertIsNone(registry.find('pysistem_test_cc'))
+            registry.refresh()
+            self.assertEqual(registry.find('pysistem_test_cc'), executable)
+
+            probe = {'test': ('pysistem_test_cc', '%s --version'),
+                     'missing': ('pysistem_missing_cc', '%s --version')}
+            self.assertEqual(registry.probe_all(probe), {'test': (executable, '1.0')})
+            self.assertEqual(registry.probe_all(probe), {'test': (executable, '1.0')})
+            with open(calls) as calls_file:
+                self.assertEqual(len(calls_file.readlines()), 1)
+            stat = os.stat(executable)
+            os.utime(executable, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+            registry.probe_all(probe)
+            with open(calls) as calls_file:
+                self.assertEqual(len(calls_file.readlines()), 2)
+        finally:
+            app.config['PATH_EXTRA'] = []
+            shutil.rmtree(bin_dir)
+            os.remove(registry.get_versions_path())
+
+    def test_claim_submission(self):
+        from pysistem.checkthread import Session, claim_submission
+        detect_compilers()
+        problem = Problem(name='A+B', description='Add two numbers',
+            statement='Just do it', time_limit=1234, memory_limit=54321)
+        db.session.add(problem)
+        submission = Submission('', user=User.query.first(),
+            compiler=Compiler.query.first(), problem=problem)
+        db.session.add(submission)
+        db.session.commit()
+        submission_id = submission.id
+
+        session = Session()
+        self.assertIsNone(claim_submission(session))
+        checker = Checker('Checker', '', problem)
+        checker.compiler = Compiler.query.first()
+        checker.status = STATUS_ACT
+        db.session.add(checker)
+        db.session.commit()
+        claimed = claim_submission(session)
+        self.assertEqual(claimed.id, submission_id)
+        self.assertEqual(claimed.status, STATUS_COMPILING)
+        self.assertIsNone(claim_submission(session))
+        Session.remove()
+
+    def test_check_thread_failure(self):
+        from pysistem.checkthread import check_thread_wake
+        detect_compilers()
+        problem = Problem(name='A+B', time_limit=1000)
+        problem.builtin_checker = 'token'
+        submission = Submission('', user=User.query.first(),
+            compiler=Compiler.query.first(), problem=problem)
+        db.session.add_all([problem, submission])
+        db.session.commit()
+        submission_id = submission.id
+
+        def compile(self):
+            raise RuntimeError('Broken compiler')
+        original = Submission.compile
+        Submission.compile = compile
+        try:
+            self.assertTrue(check_thread_wake())
+        finally:
+            Submission.compile = original
+        db.session.expire_all()
+        submission = Submission.query.get(submission_id)
+        # Not left compiling until restart
+        self.assertEqual((submission.status, submission.result), (STATUS_DONE, RESULT_IE))
+
+    def test_judge_api(self):
+        import json
+        detect_compilers()
+        compiler = Compiler.query.first()
+        problem = Problem(name='A+B', description='Add two numbers',
+            statement='Just do it', time_limit=1234, memory_limit=54321)
+        db.session.add(problem)
+        checker = Checker('Checker', 'checker source', problem)
+        checker.compiler = compiler
+        checker.status = STATUS_ACT
+        test_group = TestGroup(problem=problem)
+        test_group.score = 10
+        test = TestPair('1 2', '3')
+        test.test_group = test_group
+        submission = Submission('source', user=User.query.first(),
+            compiler=compiler, problem=problem)
+        db.session.add_all([checker, test_group, test, submission])
+        db.session.commit()
+        submission_id, test_id = submission.id, test.id
+        autodetect, hashes = compiler.autodetect, [test.input_hash, test.pattern_hash]
+
+        app.config['JUDGE_API_TOKEN'] = 'secret'
+        headers = {'X-Judge-Token': 'secret'}
+        request = self.app.post('/judge/api/lease', data='{"compilers": []}')
+        self.assertEqual(request.status_code, 403)
+        request = self.app.post('/judge/api/lease', data='{"compilers": []}', headers=headers)
+        self.assertEqual(request.status_code, 204)
+        request = self.app.post('/judge/api/lease', headers=headers,
+                                data=json.dumps({'compilers': [autodetect]}))
+        job = json.loads(request.data.decode())
+        self.assertEqual(job['id'], submission_id)
+        self.assertEqual(job['source'], 'source')
+        self.assertEqual(job['groups'][0]['tests'], [[test_id] + hashes])
+
+        request = self.app.get('/judge/api/test/' + hashes[1], headers=headers)
+        self.assertEqual(request.data, b'3')
+        request = self.app.get('/judge/api/checker/%d/source' % job['checker']['id'],
+                               headers=headers)
+        self.assertEqual(request.data, b'checker source')
+
+        report = {'lease': 'wrong', 'compiled': True, 'result': RESULT_OK, 'score': 11,
+                  'logs': [[test_id, RESULT_OK, 'ok', {'stdout': '3', 'stdout_size': 1,
+                                                       'test_version': 'old'}]]}
+        request = self.app.post('/judge/api/submission/%d/result' % submission_id,
+                                data=json.dumps(report), headers=headers)
+        self.assertEqual(request.status_code, 409)
+        report['lease'] = job['lease']
+        request = self.app.post('/judge/api/submission/%d/result' % submission_id,
+                                data=json.dumps(report), headers=headers)
+        self.assertEqual(request.status_code, 200)
+        db.session.expire_all()
+        submission = Submission.query.get(submission_id)
+        self.assertEqual(submission.status, STATUS_DONE)
+        self.assertEqual(submission.score, 11)
+        self.assertEqual(submission.submission_logs.first().log, 'ok')
+        self.assertEqual(submission.submission_logs.first().stdout_size, 1)
+        # Version of test node ran is kept, even if test has changed since
+        self.assertEqual(submission.submission_logs.first().test_version, 'old')
+
+        submission = Submission('source', user=User.query.first(),
+            compiler=compiler, problem=problem)
+        db.session.add(submission)
+        db.session.commit()
+        submission_id = submission.id
+        request = self.app.post('/judge/api/lease', headers=headers,
+                                data=json.dumps({'compilers': [autodetect]}))
+        report = {'lease': json.loads(request.data.decode())['lease'], 'error': 'KeyError()'}
+        request = self.app.post('/judge/api/submission/%d/result' % submission_id,
+                                data=json.dumps(report), headers=headers)
+        self.assertEqual(request.status_code, 200)
+        submission = Submission.query.get(submission_id)
+        self.assertEqual((submission.status, submission.result), (STATUS_DONE, RESULT_IE))
+        self.assertIsNone(submission.lease)
+        app.config['JUDGE_API_TOKEN'] = ''
+
+    def test_submission_usage(self):
+        import json
+        from pysistem.checkers.model import Verdict
+        verdict = Verdict()
+        verdict.add_usage({'cpu_time': 10, 'wall_time': 15, 'memory': 2048})
+        verdict.add_usage({'cpu_time': 30, 'wall_time': 40, 'memory': 1024})
+        verdict.add_usage({'stdout_size': 0})
+        self.assertEqual(verdict.usage, {'max_cpu_time': 30, 'total_cpu_time': 40,
+                                         'max_wall_time': 40, 'total_wall_time': 55,
+                                         'max_memory': 2048})
+
+        problem = Problem(name='A+B', description='Add two numbers', statement='Just do it')
+        test_group = TestGroup(problem=problem)
+        test = TestPair('1 2', '3')
+        test.test_group = test_group
+        submission = Submission('source', user=User.query.first(), problem=problem)
+        submission.set_usage(verdict.usage)
+        submission_log = SubmissionLog(RESULT_OK, 'ok', '3', submission, test)
+        submission_log.cpu_time, submission_log.wall_time, submission_log.memory = 10, 15, 2048
+        db.session.add_all([problem, test_group, test, submission, submission_log])
+        db.session.commit()
+        submission_id, test_id = submission.id, test.id
+
+        self.login('admin', 'admin')
+        request = self.app.get('/submission/%d/usage' % submission_id)
+        usage = json.loads(request.data.decode())
+        self.assertEqual(usage['max_cpu_time'], 30)
+        self.assertEqual(usage['max_memory'], 2048)
+        self.assertEqual(usage['tests'], [{'test_pair_id': test_id, 'result': RESULT_OK,
+                                           'cpu_time': 10, 'wall_time': 15, 'memory': 2048}])
+        request = self.app.get('/submission/%d' % submission_id)
+        self.assertIn(('/submission/%d/usage' % submission_id).encode(), request.data)
+        self.logout()
+        self.login('default', 'default')
+        request = self.app.get('/submission/%d/usage' % submission_id)
+        self.assertEqual(request.status_code, 403)
+
+    def test_submission_progress(self):
+        submission = Submission('', user=User.query.first(),
+            compiler=None, problem=None)
+        db.session.add(submission)
+        db.session.commit()
+        submission.set_progress(42)
+        self.assertEqual(submission.get_current_test_id(), 0)
+        submission.status = STATUS_CHECKING
+        self.assertEqual(submission.get_current_test_id(), 42)
+        submission.set_progress(0)
+        self.assertEqual(submission.get_current_test_id(), 0)
+
+        # Progress published by another process, e.g. standalone checker
+        process = multiprocessing.get_context('fork').Process(
+            target=Submission.set_progress, args=(submission, 43))
+        process.start()
+        process.join()
+        self.assertEqual(process.exitcode, 0)
+        self.assertEqual(submission.get_current_test_id(), 43)
+        submission.set_progress(0)
+
+    def test_submission_output(self):
+        import hashlib, zlib
+        from pysistem.submissions import output
+        data = b'0123456789' * 1000
+        path = os.path.join(app.config['STORAGE'], 'output_test')
+        with open(path, 'wb') as output_file:
+            output_file.write(data)
+        digest = hashlib.sha256(data).hexdigest()
+
+        fields = output.read_output(path, 'full')
+        self.assertEqual(fields['stdout'], data.decode())
+        self.assertEqual(fields['stdout_hash'], digest)
+        self.assertEqual(fields['stdout_size'], len(data))
+        self.assertIsNone(output.read_output(path, 'hash')['stdout'])
+        preview = output.read_output(path, 'preview')['stdout']
+        self.assertIn('[... 1808 bytes skipped ...]', preview)
+        self.assertTrue(preview.startswith('0123') and preview.endswith('789'))
+        self.assertEqual(output.read_output(path, 'blob')['stdout'], preview)
+        self.assertEqual(zlib.decompress(output.get_blob(digest)), data)
+        self.assertFalse(output.put_blob(digest[::-1], output.get_blob(digest)))
+        os.remove(path)
+
+    def test_builtin_comparators(self):
+        from pysistem.checkers import builtin
+        output_path = os.path.join(app.config['STORAGE'], 'comparator_output')
+        pattern_path = os.path.join(app.config['STORAGE'], 'comparator_pattern')
+        def compare(name, output, pattern):
+            with open(output_path, 'wb') as output_file:
+                output_file.write(output)
+            with open(pattern_path, 'wb') as pattern_file:
+                pattern_file.write(pattern)
+            return builtin.compare(name, output_path, pattern_path)[0]
+
+        self.assertEqual(compare('exact', b'1 2\n3\n\n', b'1 2\n3'), RESULT_OK)
+        self.assertEqual(compare('exact', b'1  2\n3', b'1 2\n3'), RESULT_WA)
+        self.assertEqual(compare('exact', b'', b''), RESULT_OK)
+        self.assertEqual(compare('line', b'1 2  \n3\n\n', b'1 2\n3'), RESULT_OK)
+        self.assertEqual(compare('line', b'1 2 3', b'1 2\n3'), RESULT_WA)
+        self.assertEqual(compare('token', b'1\n2   3', b'1 2 3\n'), RESULT_OK)
+        self.assertEqual(compare('token', b'1 2', b'1 2 3'), RESULT_WA)
+        self.assertEqual(compare('float', b'0.3000001 1e6', b'0.3 1000000.5'), RESULT_OK)
+        self.assertEqual(compare('float', b'0.31', b'0.3'), RESULT_WA)
+        self.assertEqual(compare('float:0.1', b'0.31', b'0.3'), RESULT_OK)
+        self.assertEqual(compare('float', b'YES 0.5', b'YES 0.5'), RESULT_OK)
+        self.assertEqual(compare('float', b'NO 0.5', b'YES 0.5'), RESULT_WA)
+        self.assertEqual(compare('float', b'abc', b'0.5'), RESULT_PE)
+        for token in (b'1_000', b'inf', b'nan', b'0x10', b'1e'):
+            self.assertEqual(compare('float', token, b'1000'), RESULT_PE)
+        self.assertEqual(compare('float', b'-.5e+3 2.', b'-500 2'), RESULT_OK)
+        self.assertEqual(compare('float', b'1 2', b'1 2 3'), RESULT_WA)
+        self.assertEqual(compare('float', b'', b''), RESULT_OK)
+        # Tokens are compared in batches, up to the first mismatch
+        numbers = [str(i).encode() for i in range(builtin.BATCH_SIZE * 2 + 10)]
+        self.assertEqual(compare('float', b' '.join(numbers), b'\n'.join(numbers)), RESULT_OK)
+        wrong = numbers[:builtin.BATCH_SIZE + 5] + [b'-1'] + numbers[builtin.BATCH_SIZE + 6:]
+        self.assertEqual(compare('float', b' '.join(wrong) + b' extra', b' '.join(numbers)),
+                         RESULT_WA)
+        self.assertIn('Token %d differs' % (builtin.BATCH_SIZE + 6),
+                      builtin.compare('float', output_path, pattern_path)[1])
+        self.assertTrue(builtin.is_valid('float:1e-9'))
+        self.assertFalse(builtin.is_valid('token:1'))
+        self.assertFalse(builtin.is_valid('wcmp'))
+        os.remove(output_path)
+        os.remove(pattern_path)
+
+    def test_checker_server(self):
+        from pysistem.checkers import server
+        detect_compilers()
+        compiler = Compiler.query.filter(Compiler.lang == 'c').first()
+        if not compiler:
+            self.skipTest('C compiler not found')
+        source = '#include <stdio.h>\n#include <stdlib.h>\n' \
+                 'static int calls;\n' \
+                 'int main(int argc, char** argv) {\n' \
+                 '    FILE* f = fopen(argv[2], "r"); int x = -1;\n' \
+                 '    if (fscanf(f, "%d", &x) != 1) exit(2);\n' \
+                 '    printf("calls %d got %d", ++calls, x);\n' \
+                 '    return x == 42 ? 0 : 1;\n}\n'
+        storage = app.config['STORAGE']
+        src = os.path.join(storage, 'server_test.c')
+        exe = os.path.join(storage, 'server_test')
+        paths = [os.path.join(storage, 'server_test_%d' % i) for i in range(3)]
+        for path, data in zip(paths, ('42', '7', 'x')):
+            with open(path, 'w') as data_file:
+                data_file.write(data)
+        self.assertTrue(compiler.compile_source(source, src, exe)[0])
+
+        app.config['CHECKER_SERVER'] = False
+        self.assertIsNone(server.get_server(compiler, source, exe))
+        app.config['CHECKER_SERVER'] = True
+        try:
+            server_exe = server.get_server(compiler, source, exe)
+            self.assertIsNotNone(server_exe)
+            for _ in range(2):
+                self.assertEqual(server.check(server_exe, paths[0], paths[0], paths[0]),
+                                 (0, b'calls 1 got 42'))
+                self.assertEqual(server.check(server_exe, paths[0], paths[1], paths[0]),
+                                 (1, b'calls 1 got 7'))
+                self.assertEqual(server.check(server_exe, paths[0], paths[2], paths[0])[0], 2)
+        finally:
+            app.config['CHECKER_SERVER'] = False
+            for path in paths + [src, exe, exe + '_server']:
+                os.remove(path)
+
+    def test_compile_cache(self):
+        from pysistem.compilers import cache as compile_cache
+        detect_compilers()
+        compiler = Compiler.query.filter(Compiler.lang == 'c').first()
+        if not compiler:
+            self.skipTest('C compiler not found')
+        source = 'int main() { return 0; }'
+        src = os.path.join(app.config['STORAGE'], 'cache_test.c')
+        exe = os.path.join(app.config['STORAGE'], 'cache_test')
+        compile_cache.evict(0)
+
+        self.assertTrue(compiler.compile_source(source, src, exe)[0])
+        os.remove(exe)
+        compiler.compile = lambda src, exe: self.fail('Compiled twice')
+        self.assertTrue(compiler.compile_source(source, src, exe)[0])
+        self.assertTrue(os.access(exe, os.X_OK))
+
+        compile_cache.evict(0)
+        self.assertIsNone(compile_cache.get(source, compiler, exe))
+        os.remove(src)
+        os.remove(exe)
+
+    def test_storage_evict(self):
+        import shutil
+        from pysistem import storage
+        directory = os.path.join(app.config['STORAGE'], 'evict_test')
+        try:
+            for used, name in enumerate(('a.meta', 'a.exe', 'b.meta', 'b.exe', 'c.meta')):
+                storage.write_atomic(os.path.join(directory, name), lambda file: file.write(b'x'))
+                os.utime(os.path.join(directory, name), (used, used))
+            os.utime(os.path.join(directory, 'a.meta'), (10, 10))
+            # Entry is used when its newest file was, its files go together
+            storage.evict(directory, 3, lambda name: name[0])
+            self.assertEqual(sorted(os.listdir(directory)), ['a.exe', 'a.meta', 'c.meta'])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_native_sandbox(self):
+        import sys
+        from pysistem.compilers.model import run_sandboxed
+        from pysistem.compilers import sandbox
+        app.config['SANDBOX_BACKEND'] = 'native'
+        try:
+            usage = {}
+            result = run_sandboxed([sys.executable, '-c', 'print(sum(map(int, input().split())))'],
+                                   1000, 65536, '1 2\n', usage=usage)
+            self.assertEqual(result[:2], (0, b'3\n'))
+            self.assertEqual(sorted(usage), ['cpu_time', 'memory', 'wall_time'])
+            self.assertEqual(run_sandboxed([sys.executable, '-c', 'exit(3)'])[0], 2)
+            self.assertEqual(run_sandboxed([sys.executable, '-c', 'while True: pass'], 200)[0], 1)
+            self.assertEqual(run_sandboxed([sys.executable, '-c', 'x = bytearray(60 << 20)'],
+                                           1000, 40960)[0], 4)
+            # Memory of fork-server before exec is not counted
+            usage = {}
+            self.assertEqual(run_sandboxed(['true'], 1000, 4096, usage=usage)[0], 0)
+            self.assertLess(usage['memory'], 4096)
+            self.assertEqual(run_sandboxed([os.path.join(app.config['STORAGE'], 'nothing')])[0], 8)
+
+            # Server killed after it has answered is not reused
+            procs, run = set(), sandbox.ForkServer.run
+            def run_and_kill(server, request):
+                response = run(server, request)
+                sandbox.kill_procs(procs)
+                return response
+            sandbox.ForkServer.run = run_and_kill
+            try:
+                self.assertEqual(run_sandboxed(['true'], procs=procs)[0], 0)
+            finally:
+                sandbox.ForkServer.run = run
+            self.assertFalse(procs)
+            self.assertFalse([server for server in sandbox._idle if server.killed])
+        finally:
+            app.config['SANDBOX_BACKEND'] = 'runsbox'
+
+    def test_scratch_dirs(self):
+        import threading
+        from pysistem.compilers import scratch
+        app.config['SCRATCH_DIR'] = os.path.join(app.config['STORAGE'], 'scratch')
+        try:
+            self.assertEqual(scratch.get_dir(), app.config['SCRATCH_DIR'])
+            dirs = []
+            def job():
+                with scratch.job() as workdir:
+                    with scratch.job() as nested:
+                        self.assertEqual(nested, workdir)
+                    self.assertEqual(scratch.get_dir(), workdir)
+                    self.assertTrue(os.path.exists(
+                        os.path.join(scratch.link_includes(), 'testlib.h')))
+                    dirs.append(workdir)
+            threads = [threading.Thread(target=job) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(len(set(dirs)), 2)
+            self.assertTrue(all(not os.path.exists(workdir) for workdir in dirs))
+            self.assertEqual(os.listdir(app.config['SCRATCH_DIR']), [])
+        finally:
+            app.config['SCRATCH_DIR'] = None
+
+    def test_python_bytecode(self):
+        import sys
+        from pysistem.compilers.model import PYTHON_BUILD
+        from pysistem.compilers import scratch
+        compiler = Compiler('Python', 'py', PYTHON_BUILD.replace('__compiler__', sys.executable) \
+                            .replace('__src__', '%src%').replace('__exe__', '%exe%'),
+                            sys.executable + ' %exe%')
+        app.config['SANDBOX_BACKEND'] = 'native'
+        try:
+            with scratch.job() as workdir:
+                src, exe = os.path.join(workdir, 'source.py'), os.path.join(workdir, 'source.pyc')
+                with open(src, 'w') as source_file:
+                    source_file.write('print(sum(map(int, input().split())))\n')
+                self.assertTrue(compiler.compile(src, exe)[0])
+                os.remove(src)
+                self.assertEqual(compiler.run(exe, stdin='1 2\n')[:2], (0, b'3\n'))
+
+                with open(src, 'w') as source_file:
+                    source_file.write('print(1 +)\n')
+                success, log = compiler.compile(src, exe)
+                self.assertFalse(success)
+                self.assertIn(b'SyntaxError', log)
+        finally:
+            app.config['SANDBOX_BACKEND'] = 'runsbox'
+
+    def test_run_cache(self):
+        import sys
+        from pysistem.checkers import model as checkers_model, runcache
+        from pysistem.checkers.model import TestRunner
+        from pysistem.test_pairs import store
+        input_path = store.get_path(store.get_hash('5\n'), lambda: '5\n')
+        pattern_path = store.get_path(store.get_hash('6\n'), lambda: '6\n')
+        app.config['RUN_CACHE'] = True
+        app.config['SANDBOX_BACKEND'] = 'native'
+        run_sandboxed = checkers_model.run_sandboxed
+        try:
+            runcache.evict(0)
+            compiler = Compiler('Python', 'py', '', sys.executable + ' %exe%')
+            key = runcache.get_program_key(compiler, '', 'print(int(input()) + 1)')
+            cmd = [sys.executable, '-c', 'print(int(input()) + 1)']
+            runner = TestRunner(None, cmd, 1000, 1 << 20, 'cache', comparator='token',
+                                program_key=key)
+            result, _, output = runner.run(1, input_path, pattern_path)
+            self.assertEqual(result, RESULT_OK)
+
+            checkers_model.run_sandboxed = lambda *args, **kwargs: self.fail('Run twice')
+            self.assertEqual(runner.run(1, input_path, pattern_path)[::2], (result, output))
+            # Another checker gets cached output
+            runner = TestRunner(None, cmd, 1000, 1 << 20, 'cache', comparator='exact',
+                                program_key=key)
+            self.assertEqual(runner.run(1, input_path, input_path)[0], RESULT_WA)
+
+            self.assertFalse(runcache.is_cacheable(1, {'cpu_time': 1000, 'memory': 0},
+                                                   1000, 65536))
+            self.assertFalse(runcache.is_cacheable(0, {'cpu_time': 900, 'memory': 0},
+                                                   1000, 65536))
+            self.assertTrue(runcache.is_cacheable(2, {'cpu_time': 10, 'memory': 0},
+                                                  1000, 65536))
+        finally:
+            checkers_model.run_sandboxed = run_sandboxed
+            runcache.evict(0)
+            app.config['RUN_CACHE'] = False
+            app.config['SANDBOX_BACKEND'] = 'runsbox'
+
+    def test_test_store(self):
+        test1 = TestPair('1 2', '3')
+        test2 = TestPair('1 2', '4')
+        self.assertEqual(test1.input_hash, test2.input_hash)
+        self.assertNotEqual(test1.pattern_hash, test2.pattern_hash)
+        self.assertEqual(test1.get_input_path(), test2.get_input_path())
+        with open(test1.get_pattern_path()) as pattern_file:
+            self.assertEqual(pattern_file.read(), '3')
+        test2.pattern = '3'
+        self.assertEqual(test1.get_pattern_path(), test2.get_pattern_path())
+
+    def test_judge_node(self):
+        import sys
+        from pysistem.compilers.model import PYTHON_BUILD
+        from pysistem.judge.node import JudgeClient, JudgeNode
+        from pysistem.test_pairs.model import get_version
+        from pysistem.test_pairs.store import get_hash
+        compiler = Compiler('Python', 'py', PYTHON_BUILD.replace('__compiler__', sys.executable) \
+                            .replace('__src__', '%src%').replace('__exe__', '%exe%'),
+                            sys.executable + ' %exe%')
+        data = dict((get_hash(value), value) for value in ('1 2', '3', '2 2', '4', '5'))
+
+        class FakeClient(JudgeClient):
+            def __init__(self, job=None):
+                JudgeClient.__init__(self, 'http://localhost', '')
+                self.job, self.calls = job, []
+            def lease(self, compilers):
+                return self.job
+            def get_test(self, digest):
+                return data[digest]
+            def progress(self, job, test_id):
+                self.calls.append(('progress', test_id))
+            def post_result(self, job, report):
+                self.calls.append(('result', report))
+
+        tests = [[1, get_hash('1 2'), get_hash('3')], [2, get_hash('2 2'), get_hash('4')],
+                 [3, get_hash('2 2'), get_hash('5')]]
+        job = {'id': 1, 'lease': 'lease', 'source': 'print(sum(map(int, input().split())))',
+               'compiler': 'python', 'time_limit': 1000, 'memory_limit': 1 << 20,
+               'output_mode': 'preview', 'comparator': 'token', 'checker': None,
+               'groups': [{'score': 10, 'score_per_test': 1, 'check_all': True,
+                           'tests': tests}]}
+        app.config['SANDBOX_BACKEND'] = 'native'
+        app.config['JUDGE_NODE_PROGRESS_INTERVAL'] = 0
+        try:
+            client = FakeClient()
+            JudgeNode(client, {'python': compiler}).judge(job)
+            # Lease is renewed after every test
+            self.assertEqual([call[1] for call in client.calls[:-1]], [1, 1, 2, 3])
+            report = client.calls[-1][1]
+            self.assertEqual((report['result'], report['score']), (RESULT_WA, 2))
+            self.assertEqual([log[:2] for log in report['logs']],
+                             [[1, RESULT_OK], [2, RESULT_OK], [3, RESULT_WA]])
+            self.assertEqual(report['logs'][2][3]['test_version'],
+                             get_version(get_hash('2 2'), get_hash('5')))
+
+            # Failed job is reported, not left leased
+            client = FakeClient(dict(job, compiler='unknown'))
+            self.assertFalse(JudgeNode(client, {'python': compiler}).wake())
+            self.assertEqual(client.calls[0][0], 'result')
+            self.assertIn('unknown', client.calls[0][1]['error'])
+        finally:
+            app.config['SANDBOX_BACKEND'] = 'runsbox'
+            app.config['JUDGE_NODE_PROGRESS_INTERVAL'] = 5
+
+    def test_judge_notify(self):
+        from pysistem.judge import notify
+        if not notify.is_enabled():
+            self.skipTest('Judge notifications are disabled')
+        listener = notify.NotifyListener()
+        listener.start()
+        try:
+            notify.judge_event.clear()
+            notify.broadcast()
+            self.assertTrue(notify.wait(5))
+        finally:
+            listener.close()
+        self.assertFalse(os.path.exists(listener.path))
+
+    def test_judge_scheduler(self):
+        from pysistem.judge import scheduler
+        problem = Problem(name='A+B', time_limit=1000)
+        live_problem = Problem(name='Live A+B', time_limit=1000)
+        contest = Contest(name='Live', start=datetime.now() - timedelta(hours=1),
+            end=datetime.now() + timedelta(hours=1), freeze=datetime.now() + timedelta(hours=1))
+        assoc = ContestProblemAssociation(prefix='A')
+        assoc.problem = live_problem
+        contest.problems.append(assoc)
+        db.session.add(contest)
+        admin = User.query.filter(User.username == 'admin').first()
+        default = User.query.filter(User.username == 'default').first()
+        subs = [Submission(user=admin, problem=problem) for i in range(3)] + \
+               [Submission(user=default, problem=problem),
+                Submission(user=default, problem=live_problem),
+                Submission(user=admin, problem=problem)]
+        subs[5].is_recheck = True
+        for sub in subs:
+            db.session.add(sub)
+        db.session.commit()
+
+        queue = scheduler.load_queue(db.session)
+        order = [x.id for x in scheduler.rank(queue, db.session)]
+        self.assertEqual(order, [subs[i].id for i in (4, 0, 3, 1, 2, 5)])
+        order = [x.id for x in scheduler.rank(queue, db.session, names=())]
+        self.assertEqual(order, [sub.id for sub in subs])
+
+    def test_rejudge_jobs(self):
+        import json
+        from pysistem.judge import rejudge
+        from pysistem.submissions.model import RejudgeJob
+        problem = Problem(name='A+B', time_limit=1000)
+        admin = User.query.filter(User.username == 'admin').first()
+        subs = [Submission(user=admin, problem=problem) for i in range(4)]
+        for sub, result in zip(subs, (RESULT_OK, RESULT_WA, RESULT_WA, RESULT_WA)):
+            sub.status, sub.result = STATUS_DONE, result
+        subs[3].status = STATUS_COMPILING
+        db.session.add_all(subs)
+        db.session.commit()
+
+        job = rejudge.start(admin, 50, problem_id=problem.id, result=RESULT_WA)
+        self.assertEqual(job.total, 2)
+        db.session.expire_all()
+        self.assertEqual([sub.status for sub in subs],
+                         [STATUS_DONE, STATUS_CWAIT, STATUS_CWAIT, STATUS_COMPILING])
+        self.assertEqual(subs[1].previous_status, STATUS_DONE)
+        self.assertEqual(job.get_progress()['pending'], 2)
+
+        app.config['JUDGE_CAPACITY'] = 2
+        try:
+            self.assertEqual(rejudge.get_throttled(db.session), set())
+            subs[1].status = STATUS_CHECKING
+            db.session.commit()
+            self.assertEqual(rejudge.get_throttled(db.session), {job.id})
+            # Fraction of worker is used only if nothing else waits
+            app.config['JUDGE_CAPACITY'] = 10
+            self.assertEqual((rejudge.get_limit(25), rejudge.get_limit(25, False)), (2, 3))
+            app.config['JUDGE_CAPACITY'] = 1
+            self.assertEqual((rejudge.get_limit(25), rejudge.get_limit(25, False)), (1, 1))
+            # Half of 3 workers: 2 while only job's submissions wait, else 1
+            app.config['JUDGE_CAPACITY'] = 3
+            self.assertEqual(rejudge.get_throttled(db.session), set())
+            subs[0].status = STATUS_CWAIT
+            db.session.commit()
+            self.assertEqual(rejudge.get_throttled(db.session), {job.id})
+            subs[0].status = STATUS_DONE
+            db.session.commit()
+        finally:
+            app.config['JUDGE_CAPACITY'] = None
+
+        subs[1].status = STATUS_DONE
+        db.session.commit()
+        self.assertEqual(rejudge.cancel(job), 1)
+        db.session.expire_all()
+        self.assertEqual(subs[2].status, STATUS_DONE)
+        self.assertEqual(subs[2].result, RESULT_WA)
+        progress = job.get_progress()
+        self.assertEqual((progress['done'], progress['cancelled'], progress['active']),
+                         (1, 1, False))
+
+        ids = [sub.id for sub in subs]
+        self.login('admin', 'admin')
+        request = self.app.get('/submission/recheck/%d,%d' % (ids[0], ids[1]))
+        self.assertEqual(request.status_code, 302)
+        job = RejudgeJob.query.order_by(RejudgeJob.id.desc()).first()
+        self.assertEqual(job.total, 2)
+        job_id = job.id
+        request = self.app.get('/submission/rejudge/%d' % job_id)
+        self.assertEqual(json.loads(request.data.decode())['pending'], 2)
+        request = self.app.post('/submission/rejudge', data={'ids': str(ids[2]),
+                                                             'share': '10'})
+        self.assertEqual(request.status_code, 302)
+        self.assertEqual(RejudgeJob.query.count(), 3)
+        request = self.app.get('/submission/rejudge')
+        self.assertEqual(request.status_code, 200)
+        self.assertIn(('/submission/rejudge/%d/cancel' % job_id).encode(), request.data)
+        # Cancel changes state, so it is not done by GET
+        request = self.app.get('/submission/rejudge/%d/cancel' % job_id)
+        self.assertEqual(request.status_code, 405)
+        request = self.app.post('/submission/rejudge/%d/cancel' % job_id)
+        self.assertEqual(request.status_code, 302)
+        self.assertFalse(RejudgeJob.query.get(job_id).get_progress()['active'])
+
+    def test_contest_standings(self):
+        from pysistem.contests import standings
+        from pysistem.judge import rejudge
+        admin = User.query.filter(User.username == 'admin').first()
+        user = User.query.filter(User.username == 'default').first()
+        problem = Problem(name='A+B', time_limit=1000)
+        test_group = TestGroup(problem)
+        test_group.score = 100
+        contest = Contest(name='Standings', start=datetime(2016, 1, 10),
+                          end=datetime(2016, 1, 20), freeze=datetime(2016, 1, 16))
+        assoc = ContestProblemAssociation('A')
+        assoc.problem = problem
+        contest.problems.append(assoc)
+        subs = []
+        for author, day, result, score in ((admin, 14, RESULT_WA, 0), (admin, 15, RESULT_WA, 42),
+                                           (admin, 17, RESULT_OK, 100), (user, 12, RESULT_OK, 100)):
+            sub = Submission(user=author, problem=problem)
+            sub.submitted = datetime(2016, 1, day)
+            sub.status, sub.result, sub.score = STATUS_DONE, result, score
+            subs.append(sub)
+        db.session.add_all([problem, test_group, contest] + subs)
+        db.session.commit()
+
+        def board():
+            return dict((row['username'], row['score'])
+                        for row in standings.get_scoreboard(contest)[1])
+        with app.test_request_context():
+            g.user = User()
+            self.assertEqual(board(), {'admin': (0, 0), 'default': (1, 2880)})
+            self.assertEqual(board()['admin'], contest.rate_user(admin))
+            g.user = admin
+            self.assertEqual(board(), {'admin': (1, 10120), 'default': (1, 2880)})
+            self.assertEqual(board()['admin'], contest.rate_user(admin))
+
+            subs[2].result, subs[2].score = RESULT_WA, 0
+            db.session.commit()
+            self.assertEqual(board()['admin'], (0, 0))
+            contest.rules = 'roi'
+            self.assertEqual(board()['admin'], contest.rate_user(admin))
+            self.assertEqual(board()['admin'], (42,))
+
+            g.user = User()
+            contest.freeze = datetime(2016, 1, 14, 12)
+            db.session.commit()
+            self.assertEqual(board()['admin'], (0,))
+
+            rejudge.start(admin, problem_id=problem.id)
+            self.assertEqual(board(), {})
+
+    def test_contest_scoring(self):
+        import random
+        from pysistem.contests import scoring
+        from pysistem.submissions.const import RESULT_IE, RESULT_TL
+        rng = random.Random(2016)
+        admin = User.query.filter(User.username == 'admin').first()
+        users = User.query.all() + [User(username='user%d' % i, password='user',
+                                         email='user%d@user.com' % i) for i in range(4)]
+        contest = Contest(name='Scoring', start=datetime(2016, 1, 10),
+                          end=datetime(2016, 1, 20), freeze=datetime(2016, 1, 16))
+        problems = [Problem(name='Problem %d' % i) for i in range(3)]
+        for problem in problems:
+            test_group = TestGroup(problem)
+            test_group.score = 100
+            assoc = ContestProblemAssociation()
+            assoc.problem = problem
+            contest.problems.append(assoc)
+            db.session.add(test_group)
+        for i in range(200):
+            sub = Submission(user=rng.choice(users), problem=rng.choice(problems))
+            sub.submitted = datetime(2016, 1, 8) + timedelta(minutes=rng.randrange(20 * 24 * 60))
+            sub.status = rng.choice([STATUS_DONE, STATUS_DONE, STATUS_ACT, STATUS_CWAIT])
+            sub.result = rng.choice([RESULT_OK, RESULT_WA, RESULT_WA, RESULT_PE, RESULT_TL,
+                                     RESULT_IE, RESULT_UNKNOWN])
+            sub.score = 100 if sub.result == RESULT_OK else rng.choice([0, 30, 60])
+            db.session.add(sub)
+        db.session.add_all(users + problems + [contest])
+        db.session.commit()
+        columns = tuple(zip(*db.session.query(
+            Submission.user_id, Submission.problem_id, Submission.submitted,
+            Submission.status, Submission.result, Submission.score).order_by(Submission.id)))
+        max_scores = dict((problem.id, problem.get_max_score()) for problem in problems)
+
+        module = scoring.numpy
+        try:
+            with app.test_request_context():
+                for scoring.numpy in (module, None):
+                    for g.user in (User(), admin):
+                        cutoff = contest.get_freeze_time()
+                        cells = scoring.aggregate(columns, cutoff, contest.start)
+                        for user in users:
+                            for problem in problems:
+                                score, submitted = problem.user_score(user, freeze=cutoff)
+                                self.assertEqual(cells.get((user.id, problem.id), (0, 0, None)), (
+                                    score, problem.get_user_failed_attempts(user, freeze=cutoff),
+                                    submitted and scoring.get_minutes(submitted, contest.start)))
+                        cells = [key + cell for key, cell in cells.items()]
+                        for contest.rules in ('acm', 'roi'):
+                            scores = scoring.rate(cells, contest.rules, max_scores)
+                            for user in users:
+                                self.assertEqual(scores[user.id], contest.rate_user(user))
+                    self.assertEqual(scoring.get_places([(3, 10), (2, 5), (2, 5), (2, 7), (1, 0)]),
+                                     [('1', 1), ('2-3', 2), ('2-3', 2), ('4', 4), ('5', 5)])
+        finally:
+            scoring.numpy = module
+
+    def test_scoreboard_cache(self):
+        import time
+        from pysistem.contests import boardcache
+        from pysistem.contests.views import refresh_scoreboard
+        cache = boardcache.get_cache()
+        cache.clear()
+        key = '/test/scoreboard'
+
+        def fail():
+            raise AssertionError('Rendered twice')
+        self.assertEqual(boardcache.get(key, 60, lambda: 'first', fail), 'first')
+        self.assertEqual(boardcache.get(key, 60, fail, fail), 'first')
+
+        # Stale entry is shown while someone else refreshes it
+        cache.set(key, ('first', time.time() - 100))
+        lock_file = boardcache.lock(key, blocking=False)
+        self.assertIsNone(boardcache.lock(key, blocking=False))
+        self.assertEqual(boardcache.get(key, 60, fail, fail), 'first')
+        lock_file.close()
+
+        self.assertEqual(boardcache.get(key, 60, fail, lambda: 'second'), 'first')
+        for _ in range(100):
+            if cache.get(key)[0] == 'second':
+                break
+            time.sleep(0.05)
+        self.assertEqual(boardcache.get(key, 60, fail, fail), 'second')
+        with boardcache.lock(key):
+            pass
+
+        contest = Contest(name='Cached', start=datetime(2016, 1, 10), end=datetime(2016, 1, 20),
+                          freeze=datetime(2016, 1, 20))
+        db.session.add(contest)
+        db.session.commit()
+        contest_id = contest.id
+        for _ in range(2):
+            request = self.app.get('/contest/%d/scoreboard' % contest_id)
+            self.assertEqual(request.status_code, 200)
+        self.assertIsNotNone(cache.get('/contests/scoreboard/%d/False/en' % contest_id))
+        self.assertIn('<thead>', refresh_scoreboard(contest_id, None, 'en')[0])
+        cache.clear()
+
+    def test_scoreboard_json(self):
+        from pysistem.contests import boardcache
+        boardcache.get_cache().clear()
+        admin = User.query.filter(User.username == 'admin').first()
+        user = User.query.filter(User.username == 'default').first()
+        problem = Problem(name='A+B', time_limit=1000)
+        test_group = TestGroup(problem)
+        test_group.score = 100
+        contest = Contest(name='Polled', start=datetime(2016, 1, 10),
+                          end=datetime(2016, 1, 20), freeze=datetime(2016, 1, 20))
+        assoc = ContestProblemAssociation('A')
+        assoc.problem = problem
+        contest.problems.append(assoc)
+        subs = []
+        for author, day, result in ((admin, 11, RESULT_WA), (user, 12, RESULT_OK)):
+            sub = Submission(user=author, problem=problem)
+            sub.submitted = datetime(2016, 1, day)
+            sub.status, sub.result, sub.score = STATUS_DONE, result, 100 * (result == RESULT_OK)
+            subs.append(sub)
+        db.session.add_all([problem, test_group, contest] + subs)
+        db.session.commit()
+        url = '/contest/%d/scoreboard/json' % contest.id
+        contest_id, problem_id, sub_id = contest.id, problem.id, subs[0].id
+        admin_id, user_id = admin.id, user.id
+
+        request = self.app.get(url)
+        board = json.loads(request.data.decode())
+        self.assertTrue(board['full'])
+        self.assertEqual([row[0] for row in board['places']], [user_id, admin_id])
+        self.assertEqual(board['users'][0]['cells'][str(problem_id)]['time'], '48:00')
+        revision, etag = board['revision'], request.headers['ETag']
+        request = self.app.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(request.status_code, 304)
+
+        sub = Submission.query.get(sub_id)
+        sub.result, sub.score = RESULT_OK, 100
+        db.session.commit()
+        request = self.app.get(url + '?since=%d' % revision, headers={'If-None-Match': etag})
+        self.assertEqual(request.status_code, 200)
+        board = json.loads(request.data.decode())
+        self.assertFalse(board['full'])
+        self.assertGreater(board['revision'], revision)
+        self.assertEqual([row['id'] for row in board['users']], [admin_id])
+        self.assertEqual([row[0] for row in board['places']], [admin_id, user_id])
+        revision = board['revision']
+        board = json.loads(self.app.get(url + '?since=%d' % revision).data.decode())
+        self.assertEqual((board['full'], board['users']), (False, []))
+
+        # Changing rules changes every row, so whole scoreboard is sent
+        Contest.query.get(contest_id).rules = 'roi'
+        db.session.commit()
+        board = json.loads(self.app.get(url + '?since=%d' % revision).data.decode())
+        self.assertTrue(board['full'])
+        self.assertEqual(len(board['users']), 2)
+        self.assertEqual(board['users'][0]['score'], [100])
+
+        # Never built standings: revision is sent after building them
+        contest = Contest(name='New', start=datetime(2016, 1, 10),
+                          end=datetime(2016, 1, 20), freeze=datetime(2016, 1, 20))
+        db.session.add(contest)
+        db.session.commit()
+        contest_id = contest.id
+        request = self.app.get('/contest/%d/scoreboard/json' % contest_id)
+        board = json.loads(request.data.decode())
+        self.assertGreater(board['revision'], 0)
+        self.assertEqual(Contest.query.get(contest_id).standings_revision, board['revision'])
+        request = self.app.get('/contest/%d/scoreboard/json' % contest_id,
+                               headers={'If-None-Match': request.headers['ETag']})
+        self.assertEqual(request.status_code, 304)
+        # Only the latest revision is kept, one entry per contest
+        self.assertEqual(len(boardcache.get_cache()._list_dir()), 2)
+
+    def test_problem_max_score(self):
+        problem = Problem(name='A+B')
+        db.session.add(problem)
+        db.session.commit()
+        problem_id = problem.id
+        self.assertEqual(problem.get_max_score(), 0)
+
+        self.login('admin', 'admin')
+        self.create_test_group(problem_id, 10, 3, False)
+        group_id = TestGroup.query.filter(TestGroup.problem_id == problem_id).first().id
+        for i in range(2):
+            self.app.post('/problem/addtest/%d' % group_id, data=dict(
+                input_file=(BytesIO(b'1 2'), 'input.txt'),
+                pattern_file=(BytesIO(b'3'), 'pattern.txt')
+            ))
+        problem = Problem.query.get(problem_id)
+        self.assertEqual((problem.max_score, problem.test_count), (16, 2))
+
+        test_id = TestPair.query.filter(TestPair.test_group_id == group_id).first().id
+        self.app.get('/problem/deltest/%d' % test_id)
+        self.app.post('/problem/%d/testgroup/%d' % (problem_id, group_id),
+                      data=dict(score=20, score_per_test=5))
+        problem = Problem.query.get(problem_id)
+        self.assertEqual((problem.get_max_score(), problem.test_count), (25, 1))
+
+        self.app.get('/problem/deltestgroup/%d' % group_id)
+        problem = Problem.query.get(problem_id)
+        self.assertEqual((problem.max_score, problem.test_count), (0, 0))
+
+    def test_bench_report(self):
+        from pysistem.judge import bench
+        self.assertEqual(bench.percentiles(list(range(1, 101))),
+                         {'p50': 50, 'p95': 95, 'p99': 99, 'max': 100})
+        self.assertEqual(bench.percentiles([]), {})
+        timings = [{'id': 1, 'latency': 1.0, 'compile_time': 0.5, 'check_time': 0.3},
+                   {'id': 2, 'latency': 2.0, 'compile_time': 0.1, 'check_time': None}]
+        judged = {1: (STATUS_DONE, RESULT_OK, 2, 100), 2: (STATUS_COMPILEFAIL, None, 0, 0)}
+        report = bench.make_report(timings, 2.0, judged, {1: ('AC', 'C'), 2: ('WA', 'C')})
+        self.assertEqual(report['submissions_per_sec'], 1.0)
+        self.assertEqual(report['per_test_overhead_ms'], 100.0)
+        self.assertEqual(report['latency_ms']['p50'], 1000.0)
+        self.assertEqual(report['verdicts']['AC'], {'submitted': 1, 'expected': 1})
+        self.assertEqual(report['verdicts']['WA'], {'submitted': 1, 'expected': 0})
+        self.assertEqual([entry['id'] for entry in report['unexpected']], [2])
+
+    def test_runner_run_group(self):
+        from pysistem.checkers.model import TestRunner
+
+        class FakeRunner(TestRunner):
+            def run(self, test_id, test_input, test_pattern, procs=None):
+                result = RESULT_OK if test_input == test_pattern else RESULT_WA
+                return result, '', test_input
+
+        tests = [(1, '1', '1'), (2, '2', '3'), (3, '3', '3'), (4, '4', '5')]
+        for workers in (1, 3):
+            runner = FakeRunner('', [], 1000, 65536, workers=workers)
+            self.assertEqual([x[:2] for x in runner.run_group(tests)],
+                             [(1, RESULT_OK), (2, RESULT_WA)])
+            self.assertEqual([x[:2] for x in runner.run_group(tests, check_all=True)],
+                             [(1, RESULT_OK), (2, RESULT_WA), (3, RESULT_OK), (4, RESULT_WA)])
+
+    def test_runner_kills_speculative_runs(self):
+        import sys
+        import time
+        from pysistem.checkers.model import TestRunner
+        from pysistem.compilers import scratch
+        from pysistem.test_pairs import store
+        app.config['SANDBOX_BACKEND'] = 'native'
+        try:
+            tests = [(i, store.get_path(store.get_hash(str(i)), lambda: str(i)),
+                      store.get_path(store.get_hash('0'), lambda: '0')) for i in range(3)]
+            cmd = [sys.executable, '-c', 'import os, time; seconds = int(input()) * 10; '
+                   'open("pid_%d" % os.getpid(), "w").close(); time.sleep(seconds)']
+            with scratch.job() as workdir:
+                runner = TestRunner(None, cmd, 30000, 1 << 20, 'kill', workers=3,
+                                    comparator='exact')
+                start = time.monotonic()
+                self.assertEqual([x[:2] for x in runner.run_group(tests)],
+                                 [(0, RESULT_WA)])
+                self.assertLess(time.monotonic() - start, 5)
+                pids = [int(name[4:]) for name in os.listdir(workdir) if name.startswith('pid_')]
+                self.assertTrue(pids)
+                for pid in pids:
+                    self.assertRaises(ProcessLookupError, os.kill, pid, 0)
+        finally:
+            app.config['SANDBOX_BACKEND'] = 'runsbox'
+
+    def test_delta_rejudge(self):
+        from pysistem.checkers.model import TestRunner, Verdict
+        from pysistem.judge import rejudge
+        from pysistem.submissions.model import RejudgeJob
+
+        class FakeRunner(TestRunner):
+            def run(self, test_id, test_input, test_pattern, procs=None):
+                runs.append(test_id)
+                return (RESULT_OK if test_input == test_pattern else RESULT_WA), '', {}
+
+        groups = [(10, 1, False, [(1, '1', '1'), (2, '2', '2')]), (5, 1, False, [(3, '3', '4')])]
+        reuse = {1: (RESULT_OK, 'old', {}), 3: (RESULT_OK, 'old', {})}
+        for workers in (1, 3):
+            runs, verdict = [], Verdict()
+            results = [x[:3] for x in FakeRunner('', [], 1000, 65536, workers=workers) \
+                       .run_groups(groups, verdict, reuse)]
+            self.assertEqual(runs, [2])
+            self.assertEqual(results, [(1, RESULT_OK, 'old'), (2, RESULT_OK, ''),
+                                       (3, RESULT_OK, 'old')])
+            self.assertEqual((verdict.result, verdict.score), (RESULT_OK, 18))
+
+        problem = Problem(name='A+B', time_limit=1000)
+        test_group = TestGroup(problem)
+        tests = [TestPair('1 2', '3'), TestPair('2 2', '4')]
+        for test in tests:
+            test.test_group = test_group
+        admin = User.query.filter(User.username == 'admin').first()
+        submission = Submission(user=admin, problem=problem)
+        db.session.add_all([problem, test_group, submission] + tests)
+        db.session.commit()
+        for test in tests:
+            log = SubmissionLog(RESULT_OK, 'ok', '', submission, test)
+            log.test_version = test.get_version()
+            db.session.add(log)
+        tests[1].pattern = '5'
+        db.session.commit()
+
+        rejudge.start(admin, problem_id=problem.id)
+        self.assertEqual(rejudge.get_reusable(submission, db.session), {})
+        rejudge.start(admin, delta=True, problem_id=problem.id)
+        db.session.expire_all()
+        self.assertEqual(list(rejudge.get_reusable(submission, db.session)), [tests[0].id])
+
+        # Rejudge changes state, so it is not started by GET
+        problem_id, jobs = problem.id, RejudgeJob.query.count()
+        self.login('admin', 'admin')
+        self.assertEqual(self.app.get('/problem/%d/rejudge' % problem_id).status_code, 405)
+        self.app.post('/problem/%d/rejudge' % problem_id)
+        self.assertEqual(RejudgeJob.query.count(), jobs + 1)
+
     def test_profile(self):
         request = self.app.get('/user', follow_redirects=True)
         self.assertEqual(request.status_code, 200)
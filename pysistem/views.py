@@ -26,6 +26,8 @@ def before_request(check_static=True):
     """Process before request"""
     if check_static and request.path.startswith('/static/'):
         return
+    if request.path.startswith('/judge/api/'):
+        return
     db.session.commit()
     g.is_first_time = (User.query.count() == 0)
     g.now = datetime.now()
@@ -215,3 +217,6 @@ app.register_blueprint(lessons_module)
 
 from pysistem.settings.views import mod as settings_module
 app.register_blueprint(settings_module)
+
+from pysistem.judge.views import mod as judge_module
+app.register_blueprint(judge_module)